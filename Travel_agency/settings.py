@@ -190,6 +190,47 @@ LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'homepage'
 LOGOUT_REDIRECT_URL = 'homepage'
 
+# Shared cache. Cache generation stamps (flight search, airports, sales reps)
+# must be seen by every gunicorn worker, so the default is a file cache on
+# this host rather than per-process memory; set REDIS_URL when running on
+# several hosts (needs the redis package)
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CACHE_DIR', BASE_DIR / 'cache'),
+            'OPTIONS': {'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', 10000))},
+        }
+    }
+
+# Flight search result cache (uses the default cache backend)
+# Entries are invalidated by per-route generation counters; the timeout only bounds memory
+SEARCH_CACHE_TIMEOUT = int(os.environ.get('SEARCH_CACHE_TIMEOUT', 300))
+
+# Sales representative header directory (invalidated on rep and profile saves)
+SALES_REP_CACHE_TIMEOUT = int(os.environ.get('SALES_REP_CACHE_TIMEOUT', 3600))
+
+# Rendered ticket PDFs (keyed by booking content, least recently used evicted past the size cap)
+TICKET_PDF_CACHE_DIR = os.environ.get('TICKET_PDF_CACHE_DIR', os.path.join(MEDIA_ROOT, 'ticket_pdfs'))
+TICKET_PDF_CACHE_MAX_BYTES = int(os.environ.get('TICKET_PDF_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+
+# Downscaled logos and other images used by ticket renders
+TICKET_ASSET_DIR = os.environ.get('TICKET_ASSET_DIR', os.path.join(MEDIA_ROOT, 'ticket_assets'))
+
+# Pre-render tickets with the render_tickets worker instead of inside download requests
+TICKET_RENDER_IN_BACKGROUND = os.environ.get('TICKET_RENDER_IN_BACKGROUND', 'False') == 'True'
+
+# Minutes a booking's seats stay held between review and payment
+# (expired holds are released by the release_expired_seat_holds command)
+SEAT_HOLD_MINUTES = int(os.environ.get('SEAT_HOLD_MINUTES', 15))
+
 # Easebuzz Payment Gateway Settings
 # LIVE CREDENTIALS (Production)
 EASEBUZZ_MERCHANT_KEY = os.environ.get('EASEBUZZ_MERCHANT_KEY', 'VMZA9Y0A3K')
@@ -200,6 +241,16 @@ EASEBUZZ_ENV = 'prod'
 # Using Production URL directly
 EASEBUZZ_PAYMENT_URL = 'https://pay.easebuzz.in/payment/initiateLink'
 EASEBUZZ_STATUS_URL = 'https://pay.easebuzz.in/payment/status'
+EASEBUZZ_PAY_BASE_URL = 'https://pay.easebuzz.in/pay/'
+
+# Gateway HTTP client (travels/easebuzz_client.py): timeouts in seconds,
+# retries for connection errors / 502-504, and the circuit breaker that fails
+# fast after repeated gateway failures
+EASEBUZZ_CONNECT_TIMEOUT = float(os.environ.get('EASEBUZZ_CONNECT_TIMEOUT', 3.05))
+EASEBUZZ_READ_TIMEOUT = float(os.environ.get('EASEBUZZ_READ_TIMEOUT', 10))
+EASEBUZZ_MAX_RETRIES = int(os.environ.get('EASEBUZZ_MAX_RETRIES', 2))
+EASEBUZZ_BREAKER_THRESHOLD = int(os.environ.get('EASEBUZZ_BREAKER_THRESHOLD', 5))
+EASEBUZZ_BREAKER_RESET_SECONDS = int(os.environ.get('EASEBUZZ_BREAKER_RESET_SECONDS', 30))
 
 # Email Configuration
 # Using Brevo HTTP API (not SMTP) - DigitalOcean blocks ALL SMTP ports
@@ -282,6 +333,11 @@ LOGGING = {
             'level': 'DEBUG' if DEBUG else 'INFO',
             'propagate': False,
         },
+        'travels.easebuzz_client': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
         'travels.views': {
             'handlers': ['file', 'console'],
             'level': 'DEBUG' if DEBUG else 'INFO',
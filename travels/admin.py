@@ -4,16 +4,17 @@ from django.utils.translation import gettext_lazy as _
 from django.utils.html import format_html
 from django.urls import reverse, path
 from django.contrib.contenttypes.models import ContentType
-from django.http import HttpResponseRedirect
+from django.http import HttpResponseRedirect, StreamingHttpResponse
 from django.contrib import messages
 from django.shortcuts import render
-from django.db.models import Sum, Count
+from django.db.models import Sum, Count, Q
 
+from . import airports, inventory, ticket_pdfs
 from .models import (
-    User, UserProfile, Route, Schedule, Booking, BookingPassenger,
+    User, UserProfile, Airline, Airport, Route, Schedule, Booking, BookingPassenger, SeatHold,
     Package, Contact, ODWallet, ODWalletTransaction, 
     CashBalanceWallet, CashBalanceTransaction, GroupRequest, PackageApplication, SalesRepresentative, Umrah, Coupon, VisaBooking, BookingChangeRequest,
-    BankAccount, PaymentUploadRequest
+    BankAccount, PaymentUploadRequest, PaymentTransaction, PaymentWebhookEvent, TicketRenderJob
 )
 
 # Custom Admin Filter for Agency ID
@@ -214,6 +215,71 @@ class UserProfileAdmin(admin.ModelAdmin):
         return format_html('<br>'.join(pdfs)) if pdfs else "No PDFs"
     has_pdfs.short_description = 'PDF Documents'
 
+@admin.register(Airline)
+class AirlineAdmin(admin.ModelAdmin):
+    """Admin interface for airlines; routes pick up logo changes automatically"""
+    list_display = ('name', 'code', 'logo_preview', 'route_count', 'is_active')
+    list_filter = ('is_active',)
+    search_fields = ('name', 'code')
+    ordering = ('name',)
+    readonly_fields = ('created_at', 'updated_at', 'logo_preview')
+    
+    fieldsets = (
+        ('Airline', {
+            'fields': ('code', 'name', 'aliases', 'is_active')
+        }),
+        ('Logo', {
+            'fields': ('logo', 'static_logo', 'logo_preview'),
+            'description': 'An uploaded logo takes precedence over the static logo path.'
+        }),
+        ('System Information', {
+            'fields': ('created_at', 'updated_at'),
+            'classes': ('collapse',)
+        }),
+    )
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(route_total=Count('routes'))
+    
+    def route_count(self, obj):
+        return obj.route_total
+    route_count.short_description = 'Routes'
+    route_count.admin_order_field = 'route_total'
+    
+    def logo_preview(self, obj):
+        """Show logo preview"""
+        logo_url = obj.get_logo_url()
+        if logo_url:
+            return format_html('<img src="{}" style="max-height: 30px; max-width: 90px;" />', logo_url)
+        return '-'
+    logo_preview.short_description = 'Logo'
+
+
+@admin.register(Airport)
+class AirportAdmin(admin.ModelAdmin):
+    """Admin interface for airport reference data used in search dropdowns and tickets"""
+    list_display = ('city', 'code', 'region', 'is_active', 'updated_at')
+    list_filter = ('is_active', 'region')
+    search_fields = ('city', 'code', 'region')
+    ordering = ('city',)
+    list_editable = ('code', 'is_active')
+    readonly_fields = ('created_at', 'updated_at')
+    
+    actions = ['activate_airports', 'deactivate_airports']
+    
+    def activate_airports(self, request, queryset):
+        updated = queryset.update(is_active=True)
+        airports.invalidate()
+        self.message_user(request, f"{updated} airport(s) activated.")
+    activate_airports.short_description = "Activate selected airports"
+    
+    def deactivate_airports(self, request, queryset):
+        updated = queryset.update(is_active=False)
+        airports.invalidate()
+        self.message_user(request, f"{updated} airport(s) deactivated.")
+    deactivate_airports.short_description = "Deactivate selected airports"
+
+
 class ScheduleInline(admin.TabularInline):
     model = Schedule
     extra = 1
@@ -226,12 +292,16 @@ class RouteAdmin(admin.ModelAdmin):
     list_filter = ('transport_type', 'route_type', 'flight_type', 'is_active', 'is_non_refundable', 'airline_name')
     search_fields = ('name', 'from_location', 'to_location', 'carrier_number', 'airline_name', 'layover_airport')
     inlines = [ScheduleInline]
-    readonly_fields = ('created_at', 'updated_at', 'duration_formatted', 'layover_duration_formatted')
+    readonly_fields = ('created_at', 'updated_at', 'duration_formatted', 'layover_duration_formatted', 'airline', 'airline_logo_url')
     
     fieldsets = (
         ('Basic Information', {
             'fields': ('name', 'from_location', 'to_location', 'transport_type', 'airline_name', 'carrier_number', 'route_type', 'flight_type')
         }),
+        ('Airline', {
+            'fields': ('airline', 'airline_logo_url'),
+            'description': 'Resolved automatically from the airline name / flight number when the route is saved.'
+        }),
         ('Schedule', {
             'fields': ('departure_time', 'arrival_time', 'duration')
         }),
@@ -292,7 +362,7 @@ class BookingAdmin(admin.ModelAdmin):
     readonly_fields = ('booking_reference', 'created_at', 'updated_at', 'user_email', 'schedule_info')
     inlines = [BookingPassengerInline]
     date_hierarchy = 'created_at'
-    actions = ['mark_as_confirmed', 'mark_as_cancelled', 'export_bookings']
+    actions = ['mark_as_confirmed', 'mark_as_cancelled', 'export_bookings', 'export_tickets']
     
     fieldsets = (
         ('Booking Information', {
@@ -334,6 +404,36 @@ class BookingAdmin(admin.ModelAdmin):
         # This is a placeholder - in a real app, you'd generate a CSV/Excel file
         self.message_user(request, "Export functionality would be implemented here")
     export_bookings.short_description = "Export selected bookings"
+    
+    def export_tickets(self, request, queryset):
+        from django.utils import timezone
+        bookings = queryset.filter(status=Booking.Status.CONFIRMED, payment_status=Booking.PaymentStatus.PAID)
+        response = StreamingHttpResponse(
+            ticket_pdfs.stream_zip(ticket_pdfs.export_bookings(bookings)), content_type='application/zip')
+        response['Content-Disposition'] = f'attachment; filename="E-Tickets-{timezone.localdate():%Y%m%d}.zip"'
+        return response
+    export_tickets.short_description = "Download tickets of selected bookings (ZIP, confirmed and paid only)"
+
+@admin.register(SeatHold)
+class SeatHoldAdmin(admin.ModelAdmin):
+    """Read-only view of seat holds (managed by the inventory service)"""
+    list_display = ('booking', 'schedule', 'seats', 'status', 'expires_at', 'created_at')
+    list_filter = ('status', 'expires_at')
+    search_fields = ('booking__booking_reference', 'schedule__route__carrier_number')
+    list_select_related = ('booking', 'schedule__route')
+    readonly_fields = ('booking', 'schedule', 'seats', 'status', 'expires_at', 'created_at', 'updated_at')
+    date_hierarchy = 'created_at'
+    
+    actions = ['release_holds']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def release_holds(self, request, queryset):
+        released = sum(inventory.release_hold(hold_id) for hold_id in queryset.values_list('pk', flat=True))
+        self.message_user(request, f"{released} seat hold(s) released.")
+    release_holds.short_description = "Release selected seat holds"
+
 
 @admin.register(Package)
 class PackageAdmin(admin.ModelAdmin):
@@ -517,7 +617,7 @@ class ODWalletAdmin(admin.ModelAdmin):
         return readonly
     
     def transaction_count(self, obj):
-        return obj.transactions.count()
+        return obj.txn_count
     transaction_count.short_description = 'Total Transactions'
     
     def activate_wallets(self, request, queryset):
@@ -597,6 +697,7 @@ class CashBalanceTransactionInline(admin.TabularInline):
 @admin.register(CashBalanceWallet)
 class CashBalanceWalletAdmin(admin.ModelAdmin):
     list_display = ('user_email', 'agency_id_display', 'balance_display', 'transaction_count', 'last_transaction', 'created_at')
+    list_select_related = ('user', 'user__profile')
     list_filter = ('created_at',)
     search_fields = ('user__email', 'user__client_id', 'user__first_name', 'user__last_name')
     readonly_fields = ('created_at', 'updated_at', 'user_full_info', 'transaction_count', 'total_credits', 'total_debits', 'last_transaction_details')
@@ -696,32 +797,29 @@ class CashBalanceWalletAdmin(admin.ModelAdmin):
         return 'N/A'
     user_full_info.short_description = 'User Details'
     
+    # Statistics come from the running totals kept on the wallet row by the wallet ledger
     def transaction_count(self, obj):
-        count = obj.transactions.count()
-        return format_html('<span style="font-weight: bold; color: #3b82f6;">{}</span>', count)
+        return format_html('<span style="font-weight: bold; color: #3b82f6;">{}</span>', obj.txn_count)
     transaction_count.short_description = 'Total Transactions'
+    transaction_count.admin_order_field = 'txn_count'
     
     def total_credits(self, obj):
-        from django.db.models import Sum
-        total = obj.transactions.filter(amount__gt=0).aggregate(Sum('amount'))['amount__sum'] or 0
-        return format_html('<span style="color: green; font-weight: bold;">+₹{}</span>', f'{float(total):.2f}')
+        return format_html('<span style="color: green; font-weight: bold;">+₹{}</span>', f'{float(obj.credit_total):.2f}')
     total_credits.short_description = 'Total Credits'
     
     def total_debits(self, obj):
-        from django.db.models import Sum
-        total = obj.transactions.filter(amount__lt=0).aggregate(Sum('amount'))['amount__sum'] or 0
-        return format_html('<span style="color: red; font-weight: bold;">-₹{}</span>', f'{float(abs(total)):.2f}')
+        return format_html('<span style="color: red; font-weight: bold;">-₹{}</span>', f'{float(obj.debit_total):.2f}')
     total_debits.short_description = 'Total Debits'
     
     def last_transaction(self, obj):
-        last = obj.transactions.first()
-        if last:
-            return last.created_at.strftime('%Y-%m-%d %H:%M')
+        if obj.last_txn_at:
+            return obj.last_txn_at.strftime('%Y-%m-%d %H:%M')
         return 'No transactions'
     last_transaction.short_description = 'Last Transaction'
+    last_transaction.admin_order_field = 'last_txn_at'
     
     def last_transaction_details(self, obj):
-        last = obj.transactions.first()
+        last = obj.last_txn
         if last:
             amount_color = 'green' if last.amount > 0 else 'red'
             amount_sign = '+' if last.amount > 0 else ''
@@ -777,13 +875,18 @@ class CashBalanceTransactionAdmin(admin.ModelAdmin):
                     cash_balance_wallet=wallet
                 ).order_by('-created_at')
                 
-                # Calculate statistics
-                total_credits = transactions.filter(amount__gt=0).aggregate(Sum('amount'))['amount__sum'] or 0
-                total_debits = abs(transactions.filter(amount__lt=0).aggregate(Sum('amount'))['amount__sum'] or 0)
-                total_transactions = transactions.count()
-                recharge_count = transactions.filter(transaction_type='recharge').count()
-                payment_count = transactions.filter(transaction_type='payment').count()
-                refund_count = transactions.filter(transaction_type='refund').count()
+                # Totals are kept on the wallet; per-type counts in a single query
+                total_credits = wallet.credit_total
+                total_debits = wallet.debit_total
+                total_transactions = wallet.txn_count
+                type_counts = transactions.order_by().aggregate(
+                    recharge_count=Count('pk', filter=Q(transaction_type='recharge')),
+                    payment_count=Count('pk', filter=Q(transaction_type='payment')),
+                    refund_count=Count('pk', filter=Q(transaction_type='refund')),
+                )
+                recharge_count = type_counts['recharge_count']
+                payment_count = type_counts['payment_count']
+                refund_count = type_counts['refund_count']
             else:
                 transactions = []
                 total_credits = 0
@@ -1517,3 +1620,61 @@ class PaymentUploadRequestAdmin(admin.ModelAdmin):
         self.message_user(request, f"{updated} payment request(s) marked as Rejected.")
     mark_as_rejected.short_description = "❌ Reject selected payments"
 
+
+
+@admin.register(PaymentTransaction)
+class PaymentTransactionAdmin(admin.ModelAdmin):
+    list_display = ('txnid', 'purpose', 'user', 'amount', 'status', 'gateway_status', 'created_at', 'completed_at')
+    list_filter = ('purpose', 'status', 'gateway', 'created_at')
+    search_fields = ('txnid', 'user__email')
+    readonly_fields = ('txnid', 'gateway', 'purpose', 'user', 'content_type', 'object_id', 'amount', 'status',
+                       'gateway_status', 'gateway_payload', 'completed_at', 'created_at', 'updated_at')
+    date_hierarchy = 'created_at'
+    list_per_page = 50
+    
+    def has_add_permission(self, request):
+        # Ledger rows are only created by the payment flow
+        return False
+
+
+@admin.register(PaymentWebhookEvent)
+class PaymentWebhookEventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'txnid', 'gateway_status', 'status', 'outcome', 'created_at', 'processed_at')
+    list_filter = ('status', 'outcome', 'gateway_status', 'created_at')
+    search_fields = ('txnid',)
+    readonly_fields = ('gateway', 'txnid', 'gateway_status', 'payload', 'status', 'outcome', 'error',
+                       'processed_at', 'created_at', 'updated_at')
+    date_hierarchy = 'created_at'
+    list_per_page = 50
+    actions = ['requeue_events']
+    
+    def has_add_permission(self, request):
+        # Events are only created by the webhook endpoint
+        return False
+    
+    def requeue_events(self, request, queryset):
+        updated = queryset.filter(status=PaymentWebhookEvent.Status.FAILED).update(
+            status=PaymentWebhookEvent.Status.PENDING, error='')
+        self.message_user(request, f"{updated} failed event(s) queued for processing again.")
+    requeue_events.short_description = "Retry selected failed events"
+
+
+@admin.register(TicketRenderJob)
+class TicketRenderJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'booking', 'status', 'attempts', 'render_ms', 'created_at', 'processed_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('booking__booking_reference',)
+    readonly_fields = ('booking', 'status', 'attempts', 'render_ms', 'error', 'processed_at', 'created_at', 'updated_at')
+    list_select_related = ('booking',)
+    list_per_page = 50
+    actions = ['requeue_jobs']
+    
+    def has_add_permission(self, request):
+        # Jobs are queued when bookings are confirmed and paid
+        return False
+    
+    def requeue_jobs(self, request, queryset):
+        updated = queryset.filter(status=TicketRenderJob.Status.FAILED).update(
+            status=TicketRenderJob.Status.PENDING, error='')
+        self.message_user(request, f"{updated} failed job(s) queued for rendering again.")
+    requeue_jobs.short_description = "Retry selected failed jobs"
@@ -0,0 +1,91 @@
+"""Airport reference data registry.
+
+The Airport table (plus the distinct route locations) is loaded once per
+process into a frozen AirportRegistry with O(1) city -> code and
+code -> city lookups and pre-sorted origin/destination lists. The registry
+carries a generation stamp kept in the shared cache; admin edits to
+airports or routes bump the stamp once they commit, and every process
+reloads its copy the next time it sees a newer stamp.
+"""
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping
+
+from . import generations
+
+GENERATION_KEY = 'airports:generation'
+
+_registry = None
+
+
+@dataclass(frozen=True)
+class AirportRegistry:
+    """Immutable snapshot of airport reference data"""
+    generation: int
+    codes: Mapping  # city -> IATA code
+    cities: Mapping  # IATA code -> city
+    origins: tuple
+    destinations: tuple
+    _codes_by_key: Mapping  # normalized city -> IATA code
+
+    def code_for(self, city, default=''):
+        """IATA code of a city (case and whitespace insensitive)"""
+        if not city:
+            return default
+        code = self.codes.get(city)
+        if code is None:
+            code = self._codes_by_key.get(' '.join(city.split()).lower(), default)
+        return code
+
+    def city_for(self, code, default=''):
+        """City served by an IATA code"""
+        if not code:
+            return default
+        return self.cities.get(code.strip().upper(), default)
+
+
+def get_generation():
+    """Current registry generation"""
+    return generations.get(GENERATION_KEY)
+
+
+def invalidate():
+    """Reload the registry in every process once the current transaction commits"""
+    generations.bump_on_commit(GENERATION_KEY)
+
+
+def load(generation=None):
+    """Build a registry snapshot from the database"""
+    from .models import Airport, Route
+
+    codes = {}
+    cities = {}
+    codes_by_key = {}
+    for city, code in Airport.objects.filter(is_active=True).order_by('pk').values_list('city', 'code'):
+        codes[city] = code
+        # First city entered for a shared code (e.g. Kuwait / Kuwait City) wins
+        cities.setdefault(code, city)
+        codes_by_key[' '.join(city.split()).lower()] = code
+
+    # All active airports appear in the dropdowns even if no routes exist yet
+    origins = set(codes) | set(Route.objects.values_list('from_location', flat=True).distinct())
+    destinations = set(codes) | set(Route.objects.values_list('to_location', flat=True).distinct())
+
+    return AirportRegistry(
+        generation=get_generation() if generation is None else generation,
+        codes=MappingProxyType(codes),
+        cities=MappingProxyType(cities),
+        origins=tuple(sorted(origins)),
+        destinations=tuple(sorted(destinations)),
+        _codes_by_key=MappingProxyType(codes_by_key),
+    )
+
+
+def get_registry():
+    """Process-level registry, reloaded only when the generation stamp moves"""
+    global _registry
+    generation = get_generation()
+    registry = _registry
+    if registry is None or registry.generation != generation:
+        registry = _registry = load(generation)
+    return registry
@@ -0,0 +1,293 @@
+"""Easebuzz payment gateway client.
+
+All server-to-server calls to Easebuzz go through one process-level
+EasebuzzClient: a keep-alive requests.Session (so initiations reuse the
+TLS connection), connect/read timeouts so a slow gateway cannot pin a
+worker, bounded retries with exponential backoff for failures that are
+safe to repeat, and a circuit breaker that fails fast while the gateway
+is down. Every call is timed; get_client().metrics.snapshot() reports
+call counts and latency percentiles.
+"""
+import hashlib
+import logging
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .metrics import LatencyMetrics
+
+logger = logging.getLogger(__name__)
+
+PAYMENT_URL = 'https://pay.easebuzz.in/payment/initiateLink'
+STATUS_URL = 'https://pay.easebuzz.in/payment/status'
+PAY_BASE_URL = 'https://pay.easebuzz.in/pay/'
+REFUND_URL = 'https://dashboard.easebuzz.in/transaction/v2/refund'
+
+REQUEST_HASH_SEQUENCE = (
+    'key', 'txnid', 'amount', 'productinfo', 'firstname', 'email',
+    'udf1', 'udf2', 'udf3', 'udf4', 'udf5', 'udf6', 'udf7', 'udf8', 'udf9', 'udf10',
+)
+RESPONSE_HASH_SEQUENCE = (
+    'status', 'udf10', 'udf9', 'udf8', 'udf7', 'udf6', 'udf5', 'udf4', 'udf3', 'udf2', 'udf1',
+    'email', 'firstname', 'productinfo', 'amount', 'txnid', 'key',
+)
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def _field(data_dict, key):
+    return str(data_dict.get(key, '')) if data_dict.get(key) is not None else ''
+
+
+def generate_easebuzz_hash(data_dict, salt):
+    """Generate hash for Easebuzz payment gateway using the strict sequence"""
+    # Sequence: key|txnid|amount|productinfo|firstname|email|udf1|...|udf10|salt
+    hash_string = '|'.join([_field(data_dict, key) for key in REQUEST_HASH_SEQUENCE] + [salt])
+    return hashlib.sha512(hash_string.encode('utf-8')).hexdigest().lower()
+
+
+def verify_easebuzz_hash(data_dict, salt, received_hash):
+    """Verify hash from Easebuzz payment response"""
+    # Response Sequence: salt|status|udf10|...|udf1|email|firstname|productinfo|amount|txnid|key
+    hash_string = '|'.join([salt] + [_field(data_dict, key) for key in RESPONSE_HASH_SEQUENCE])
+    return hashlib.sha512(hash_string.encode('utf-8')).hexdigest() == received_hash
+
+
+class EasebuzzError(Exception):
+    """The gateway could not be reached or rejected the request"""
+
+
+class CircuitOpenError(EasebuzzError):
+    """Calls are being short-circuited after repeated gateway failures"""
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures; after `reset_timeout`
+    seconds one trial call is let through (half-open) to probe the gateway"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, threshold=5, reset_timeout=30, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return self.CLOSED
+        if self.clock() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go through"""
+        with self._lock:
+            state = self.state
+            if state == self.CLOSED:
+                return
+            if state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return
+        raise CircuitOpenError('Payment gateway temporarily unavailable')
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.threshold:
+                self.opened_at = self.clock()
+            self._trial_running = False
+
+    def end_trial(self):
+        """Let the next half-open call through even if this one ended without a verdict"""
+        with self._lock:
+            self._trial_running = False
+
+
+class EasebuzzClient:
+    """Pooled, retrying HTTP client for the Easebuzz server-to-server API"""
+
+    # Gateway/proxy errors mean the request was not processed, so a retry is safe
+    RETRY_STATUSES = (502, 503, 504)
+
+    def __init__(self, key, salt, payment_url=PAYMENT_URL, status_url=STATUS_URL, pay_base_url=PAY_BASE_URL,
+                 refund_url=REFUND_URL, connect_timeout=3.05, read_timeout=10, max_retries=2, backoff=0.3, pool_size=10, breaker=None):
+        self.key = key
+        self.salt = salt
+        self.payment_url = payment_url
+        self.status_url = status_url
+        self.pay_base_url = pay_base_url
+        self.refund_url = refund_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.breaker = breaker or CircuitBreaker()
+        self.metrics = LatencyMetrics()
+
+        # Never re-send a POST after a read timeout: the gateway may already
+        # have created the payment link for this txnid
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=0,
+            status=max_retries,
+            backoff_factor=backoff,
+            status_forcelist=self.RETRY_STATUSES,
+            allowed_methods=frozenset({'GET', 'POST'}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            key=getattr(settings, 'EASEBUZZ_MERCHANT_KEY', ''),
+            salt=getattr(settings, 'EASEBUZZ_MERCHANT_SALT', ''),
+            payment_url=getattr(settings, 'EASEBUZZ_PAYMENT_URL', PAYMENT_URL),
+            status_url=getattr(settings, 'EASEBUZZ_STATUS_URL', STATUS_URL),
+            pay_base_url=getattr(settings, 'EASEBUZZ_PAY_BASE_URL', PAY_BASE_URL),
+            refund_url=getattr(settings, 'EASEBUZZ_REFUND_URL', REFUND_URL),
+            connect_timeout=getattr(settings, 'EASEBUZZ_CONNECT_TIMEOUT', 3.05),
+            read_timeout=getattr(settings, 'EASEBUZZ_READ_TIMEOUT', 10),
+            max_retries=getattr(settings, 'EASEBUZZ_MAX_RETRIES', 2),
+            breaker=CircuitBreaker(
+                threshold=getattr(settings, 'EASEBUZZ_BREAKER_THRESHOLD', 5),
+                reset_timeout=getattr(settings, 'EASEBUZZ_BREAKER_RESET_SECONDS', 30),
+            ),
+        )
+
+    @property
+    def configured(self):
+        return bool(self.key and self.salt)
+
+    def post(self, url, data):
+        """POST form data and return the decoded JSON body"""
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            self.metrics.record_short_circuit()
+            raise
+
+        started = time.perf_counter()
+        try:
+            response = self.session.post(url, data=data, timeout=self.timeout)
+            response.raise_for_status()
+            body = response.json()
+        except (requests.RequestException, ValueError) as exc:
+            elapsed = time.perf_counter() - started
+            self.metrics.record(elapsed, ok=False)
+            self.breaker.record_failure()
+            logger.warning('Easebuzz call to %s failed after %.0f ms: %s', url, elapsed * 1000, exc)
+            raise EasebuzzError(f'Payment gateway error: {exc}') from exc
+        finally:
+            # An unexpected error must not leave a half-open trial running forever
+            self.breaker.end_trial()
+
+        elapsed = time.perf_counter() - started
+        self.metrics.record(elapsed)
+        self.breaker.record_success()
+        logger.debug('Easebuzz call to %s took %.0f ms', url, elapsed * 1000)
+        return body
+
+    def initiate_payment(self, payment_data):
+        """Create a payment link; returns the URL to redirect the customer to.
+
+        `payment_data` holds txnid, amount, productinfo, firstname, email,
+        phone, surl, furl and optional udf fields; key and hash are added here.
+        """
+        data = {'udf%d' % i: '' for i in range(1, 11)}
+        data.update(payment_data)
+        data['key'] = self.key
+        data['hash'] = generate_easebuzz_hash(data, self.salt)
+
+        body = self.post(self.payment_url, data)
+        if not isinstance(body, dict):
+            body = {}
+        access_data = body.get('data')
+        if body.get('status') != 1 or not access_data:
+            error = body.get('error_desc') or body.get('data') or body.get('message') or 'No payment URL received'
+            raise EasebuzzError(f'Payment initiation failed: {error}')
+        # The gateway answers with either a full URL or an access key
+        if str(access_data).startswith('http'):
+            return access_data
+        return f"{self.pay_base_url}{access_data}"
+
+    def transaction_status(self, txnid):
+        """Gateway record of a transaction (dict with status, amount, ...), or None if unknown"""
+        data = {'key': self.key, 'txnid': txnid}
+        data['hash'] = hashlib.sha512(f'{self.key}|{txnid}|{self.salt}'.encode('utf-8')).hexdigest()
+
+        body = self.post(self.status_url, data)
+        if not isinstance(body, dict):
+            raise EasebuzzError('Unexpected status response')
+        attempts = body.get('msg')
+        if not body.get('status'):
+            if isinstance(attempts, str) and 'not found' in attempts.lower():
+                return None
+            raise EasebuzzError(f'Status lookup failed: {attempts or body}')
+        if isinstance(attempts, dict):
+            attempts = [attempts]
+        if not attempts:
+            return None
+        # A successful attempt wins over earlier failed ones for the same txnid
+        for attempt in attempts:
+            if attempt.get('status') == 'success':
+                return attempt
+        return attempts[-1]
+
+    def refund(self, merchant_refund_id, easebuzz_id, amount):
+        """Refund a settled payment (in full or in part); returns the gateway response.
+
+        `merchant_refund_id` is our own unique id for the refund, so a retried
+        request cannot refund twice; `easebuzz_id` is the gateway's easepayid.
+        """
+        amount = str(amount)
+        data = {
+            'key': self.key,
+            'merchant_refund_id': merchant_refund_id,
+            'easebuzz_id': easebuzz_id,
+            'refund_amount': amount,
+        }
+        data['hash'] = hashlib.sha512(
+            f'{self.key}|{merchant_refund_id}|{easebuzz_id}|{amount}|{self.salt}'.encode('utf-8')).hexdigest()
+
+        body = self.post(self.refund_url, data)
+        if not isinstance(body, dict) or not body.get('status'):
+            error = (body.get('reason') or body.get('message') or body) if isinstance(body, dict) else body
+            raise EasebuzzError(f'Refund failed: {error}')
+        return body
+
+
+def get_client():
+    """Process-level client shared by every request (keeps the connection pool warm)"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = EasebuzzClient.from_settings()
+    return _client
+
+
+def reset_client():
+    """Drop the shared client (e.g. after changing gateway settings in tests)"""
+    global _client
+    with _client_lock:
+        _client = None
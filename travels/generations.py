@@ -0,0 +1,36 @@
+"""Generation stamps for cached data.
+
+Cache keys embed the generation of the data they were built from, so
+bumping a generation makes every older entry unreachable and it simply
+expires. Stamps live in the default cache, which is shared by every worker
+process (see CACHES), so a bump in one process is seen by all of them.
+
+A missing stamp is seeded from the clock, so an evicted counter never comes
+back with a value that older entries were stored under.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+def get(key):
+    """Current generation stored under `key`"""
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, time.time_ns(), None)
+        generation = cache.get(key)
+    return generation
+
+
+def bump(key):
+    """Move the generation on now"""
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def bump_on_commit(key):
+    """Move the generation on once the current transaction commits"""
+    transaction.on_commit(lambda: bump(key))
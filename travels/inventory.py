@@ -0,0 +1,240 @@
+"""Seat inventory.
+
+Every change to Schedule.available_seats goes through this module. Seats
+are taken and released with a single conditional UPDATE
+(``available_seats = available_seats - n WHERE available_seats >= n``)
+inside a transaction, so concurrent confirmations on the same flight can
+neither oversell nor lose a decrement. The UPDATE locks the schedule row
+on databases with row-level locking. On SQLite a busy or locked database
+is retried with a short backoff.
+
+Between review and payment a booking's seats are held: a SeatHold row
+plus the Schedule.held_seats counter, so bookable seats are
+``available_seats - held_seats`` without aggregating holds per search.
+Payment converts holds into sold seats. Expired holds are released by the
+release_expired_seat_holds management command.
+
+QuerySet.update() bypasses the Schedule post_save signal, so the flight
+search index and fare calendar are refreshed here explicitly.
+"""
+import random
+import time
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Schedule, FlightSearchIndex, SeatHold
+
+BUSY_RETRIES = 8
+BUSY_BACKOFF = 0.02  # seconds, doubled on every attempt
+BUSY_BACKOFF_MAX = 0.5
+
+
+class SeatsUnavailable(Exception):
+    """A paid booking's seats could not all be confirmed (raise it inside the
+    caller's atomic block so legs already sold are rolled back)"""
+
+
+def _is_busy(exc):
+    message = str(exc).lower()
+    return 'locked' in message or 'busy' in message
+
+
+def retry_on_busy(func):
+    """Retry a write when SQLite reports the database as busy/locked.
+
+    Only the outermost transaction can be retried; inside an enclosing
+    atomic block the error is re-raised for the caller to handle.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        for attempt in range(BUSY_RETRIES + 1):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as exc:
+                connection = transaction.get_connection()
+                if (connection.vendor != 'sqlite' or not _is_busy(exc)
+                        or connection.in_atomic_block or attempt == BUSY_RETRIES):
+                    raise
+                delay = min(BUSY_BACKOFF * (2 ** attempt), BUSY_BACKOFF_MAX)
+                time.sleep(delay + random.uniform(0, delay))
+    return wrapper
+
+
+@retry_on_busy
+def reserve_seats(schedule_id, seats=1):
+    """Sell seats outright; returns False (changing nothing) if too few are bookable"""
+    if seats <= 0:
+        return True
+    with transaction.atomic():
+        updated = Schedule.objects.filter(pk=schedule_id, available_seats__gte=F('held_seats') + seats).update(
+            available_seats=F('available_seats') - seats,
+            updated_at=timezone.now(),
+        )
+        if updated:
+            FlightSearchIndex.refresh_seats(schedule_id)
+    return bool(updated)
+
+
+@retry_on_busy
+def release_seats(schedule_id, seats=1):
+    """Give seats back to a schedule; returns False if that would exceed total seats"""
+    if seats <= 0:
+        return True
+    with transaction.atomic():
+        updated = Schedule.objects.filter(
+            pk=schedule_id,
+            available_seats__lte=F('total_seats') - seats,
+        ).update(
+            available_seats=F('available_seats') + seats,
+            updated_at=timezone.now(),
+        )
+        if updated:
+            FlightSearchIndex.refresh_seats(schedule_id)
+    return bool(updated)
+
+
+def available_seats(schedule_id):
+    """Current bookable seat count straight from the database"""
+    seats = Schedule.objects.filter(pk=schedule_id).values_list('available_seats', 'held_seats').first()
+    return max(seats[0] - seats[1], 0) if seats else 0
+
+
+def get_hold_minutes():
+    """Minutes a seat hold lasts (SEAT_HOLD_MINUTES setting)"""
+    return getattr(settings, 'SEAT_HOLD_MINUTES', 15)
+
+
+@retry_on_busy
+def hold_seats(booking, seats, minutes=None):
+    """Hold seats on every leg of a booking; returns the holds, or [] if any leg is short"""
+    schedule_ids = [booking.schedule_id]
+    if booking.return_schedule_id:
+        schedule_ids.append(booking.return_schedule_id)
+    expires_at = timezone.now() + timedelta(minutes=minutes or get_hold_minutes())
+
+    with transaction.atomic():
+        for schedule_id in schedule_ids:
+            held = Schedule.objects.filter(pk=schedule_id, available_seats__gte=F('held_seats') + seats).update(
+                held_seats=F('held_seats') + seats,
+                updated_at=timezone.now(),
+            )
+            if not held:
+                # Undo the legs already held
+                transaction.set_rollback(True)
+                return []
+        holds = SeatHold.objects.bulk_create([
+            SeatHold(booking=booking, schedule_id=schedule_id, seats=seats, expires_at=expires_at)
+            for schedule_id in schedule_ids
+        ])
+        for schedule_id in schedule_ids:
+            FlightSearchIndex.refresh_seats(schedule_id)
+    return holds
+
+
+def release_held_seats(schedule_id, seats):
+    """Drop seats from a schedule's held counter (no SeatHold bookkeeping)"""
+    updated = Schedule.objects.filter(pk=schedule_id, held_seats__gte=seats).update(
+        held_seats=F('held_seats') - seats,
+        updated_at=timezone.now(),
+    )
+    if updated:
+        FlightSearchIndex.refresh_seats(schedule_id)
+    return bool(updated)
+
+
+@retry_on_busy
+def release_hold(hold_id):
+    """Release one active hold; False if it was already converted or released"""
+    with transaction.atomic():
+        hold = SeatHold.objects.filter(pk=hold_id).values('schedule_id', 'seats').first()
+        # Claiming the status first makes a racing payment or sweeper a no-op
+        if not hold or not SeatHold.objects.filter(pk=hold_id, status=SeatHold.Status.ACTIVE).update(
+                status=SeatHold.Status.RELEASED, updated_at=timezone.now()):
+            return False
+        release_held_seats(hold['schedule_id'], hold['seats'])
+    return True
+
+
+def release_booking_holds(booking):
+    """Release every active hold of a booking (e.g. cancelled before payment)"""
+    hold_ids = booking.seat_holds.filter(status=SeatHold.Status.ACTIVE).values_list('pk', flat=True)
+    return sum(release_hold(hold_id) for hold_id in list(hold_ids))
+
+
+@retry_on_busy
+def confirm_booking_seats(booking, seats):
+    """Turn a paid booking's holds into sold seats.
+
+    Legs without an active hold (expired and swept, or booked before holds
+    existed) are sold directly if seats are still bookable, and the sale is
+    recorded as a converted hold like any other. Returns False if any leg
+    could not be covered.
+    """
+    schedule_ids = [booking.schedule_id]
+    if booking.return_schedule_id:
+        schedule_ids.append(booking.return_schedule_id)
+
+    covered = set()
+    with transaction.atomic():
+        for hold in booking.seat_holds.filter(status=SeatHold.Status.ACTIVE).values('pk', 'schedule_id', 'seats'):
+            if not SeatHold.objects.filter(pk=hold['pk'], status=SeatHold.Status.ACTIVE).update(
+                    status=SeatHold.Status.CONVERTED, updated_at=timezone.now()):
+                continue
+            Schedule.objects.filter(pk=hold['schedule_id']).update(
+                available_seats=F('available_seats') - hold['seats'],
+                held_seats=F('held_seats') - hold['seats'],
+                updated_at=timezone.now(),
+            )
+            FlightSearchIndex.refresh_seats(hold['schedule_id'])
+            covered.add(hold['schedule_id'])
+
+    confirmed = True
+    for schedule_id in schedule_ids:
+        if schedule_id in covered:
+            continue
+        if not reserve_seats(schedule_id, seats):
+            confirmed = False
+        else:
+            # Record the sale so cancellation knows which legs to give back
+            SeatHold.objects.create(booking=booking, schedule_id=schedule_id, seats=seats,
+                                    status=SeatHold.Status.CONVERTED, expires_at=timezone.now())
+    return confirmed
+
+
+def sold_legs(booking):
+    """Schedule ids a confirmed booking has sold seats on (its converted holds)"""
+    sold = set(booking.seat_holds.filter(status=SeatHold.Status.CONVERTED).values_list('schedule_id', flat=True))
+    if not sold:
+        # Confirmed before seat holds existed, when only the outbound leg was sold
+        sold.add(booking.schedule_id)
+    return sold
+
+
+def release_booking_seats(booking, seats):
+    """Give back the sold seats of every leg of a cancelled booking"""
+    released = True
+    for schedule_id in sorted(sold_legs(booking)):
+        released = release_seats(schedule_id, seats) and released
+    return released
+
+
+def release_expired_holds(now=None, batch_size=500, dry_run=False):
+    """Release every active hold past its expiry, in batches; returns the count"""
+    now = now or timezone.now()
+    expired = SeatHold.objects.filter(status=SeatHold.Status.ACTIVE, expires_at__lte=now).order_by('pk')
+    if dry_run:
+        return expired.count()
+    released = 0
+    last_pk = 0
+    while True:
+        hold_ids = list(expired.filter(pk__gt=last_pk).values_list('pk', flat=True)[:batch_size])
+        if not hold_ids:
+            return released
+        for hold_id in hold_ids:
+            released += release_hold(hold_id)
+        last_pk = hold_ids[-1]
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from travels import pdf_assets
+from travels.models import Route
+from travels.templatetags.travel_filters import airline_logo
+
+
+class Command(BaseCommand):
+    help = 'Download the CDN airline logos of routes without a local logo into the ticket image pool (run from cron, e.g. daily)'
+
+    def handle(self, *args, **options):
+        """Fetch the remote logos ticket renders would otherwise ask the CDN for"""
+        carriers = (Route.objects.filter(is_active=True, airline_logo_url='')
+                    .values_list('carrier_number', flat=True).distinct())
+        urls = sorted({airline_logo(carrier) for carrier in carriers} - {''})
+        failed = [url for url in urls if not pdf_assets.fetch_remote_image(url)]
+        if failed:
+            self.stdout.write(self.style.WARNING(f'Could not download {len(failed)} of {len(urls)} logo(s): {", ".join(failed)}'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'{len(urls)} airline logo(s) pooled.'))
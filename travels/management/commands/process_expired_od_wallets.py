@@ -1,36 +1,47 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.utils import timezone
-from travels.models import ODWallet
-from decimal import Decimal
+from django.utils.dateparse import parse_datetime
+from travels import wallet_ledger
 
 
 class Command(BaseCommand):
-    help = 'Process expired OD wallets: deduct remaining balance and deactivate'
+    help = 'Process expired OD wallets: deduct remaining balance and deactivate (run from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Wallets processed per database transaction')
+        parser.add_argument('--since', default=None,
+                            help='Only wallets that expired at or after this ISO datetime (watermark printed by the previous run)')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be processed without writing anything')
 
     def handle(self, *args, **options):
         """Process all expired OD wallets"""
-        now = timezone.now()
-        expired_wallets = ODWallet.objects.filter(
-            expires_at__lte=now,
-            is_active=True
+        since = None
+        if options['since']:
+            since = parse_datetime(options['since'])
+            if since is None:
+                raise CommandError(f"Invalid --since datetime: {options['since']}")
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+
+        def progress(report, done, total):
+            self.stdout.write(f'{done}/{total} wallet(s) checked, {report.processed} processed')
+
+        report = wallet_ledger.expire_od_wallets(
+            since=since,
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+            progress=progress,
         )
-        
-        processed_count = 0
-        for wallet in expired_wallets:
-            if wallet.process_expiry():
-                processed_count += 1
-                self.stdout.write(
-                    self.style.SUCCESS(
-                        f'Processed expired wallet for {wallet.user.email}: '
-                        f'Used ₹{wallet.initial_balance - wallet.balance}, '
-                        f'Remaining deducted, Balance: ₹{wallet.balance}'
-                    )
-                )
-        
-        if processed_count == 0:
-            self.stdout.write(self.style.SUCCESS('No expired wallets to process.'))
-        else:
-            self.stdout.write(
-                self.style.SUCCESS(f'Successfully processed {processed_count} expired wallet(s).')
-            )
+        for line in report.lines:
+            self.stdout.write(line)
 
+        prefix = '[dry run] ' if options['dry_run'] else ''
+        if report.processed == 0:
+            self.stdout.write(self.style.SUCCESS(f'{prefix}No expired wallets to process.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'{prefix}Processed {report.processed} expired wallet(s): {report.deducted} with ₹{report.amount} deducted, '
+                f'{report.deactivated} deactivated with no balance, {report.skipped} already settled.'
+            ))
+        if not options['dry_run']:
+            self.stdout.write(f'Next run: --since {report.watermark.isoformat()}')
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+from travels import payments
+
+
+class Command(BaseCommand):
+    help = 'Apply stored Easebuzz webhook events in arrival order (run from cron, or with --loop as a worker)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Events fetched per batch')
+        parser.add_argument('--limit', type=int, default=None, help='Process at most this many events per pass')
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new events')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        """Process pending payment webhook events"""
+        while True:
+            counts = payments.process_webhook_events(batch_size=options['batch_size'], limit=options['limit'])
+            if counts:
+                summary = ', '.join(f'{count} {status}' for status, count in sorted(counts.items()))
+                self.stdout.write(self.style.SUCCESS(f'Processed webhook events: {summary}.'))
+            elif not options['loop']:
+                self.stdout.write(self.style.SUCCESS('No pending webhook events.'))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
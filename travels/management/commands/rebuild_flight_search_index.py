@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from travels.models import FlightSearchIndex
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the flight search index and fare calendar from active future schedules (drops past departures)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per bulk insert')
+
+    def handle(self, *args, **options):
+        """Rebuild the denormalized search and fare calendar tables"""
+        created = FlightSearchIndex.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {created} schedule(s) for flight search.'))
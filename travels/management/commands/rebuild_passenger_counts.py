@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from travels.models import Booking
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored passenger counts and lead passenger name of every booking'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Bookings updated per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the bookings whose summary is out of date')
+
+    def handle(self, *args, **options):
+        """Backfill Booking passenger counts from BookingPassenger rows"""
+        if options['dry_run']:
+            stale = Booking.objects.alias(**{
+                f'expected_{name}': expression for name, expression in Booking.passenger_summary().items()
+            }).exclude(**{name: F(f'expected_{name}') for name in Booking.PASSENGER_FIELDS}).count()
+            self.stdout.write(f'{stale} booking(s) have an out-of-date passenger summary.')
+            return
+
+        updated = Booking.rebuild_passenger_counts(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt the passenger summary of {updated} booking(s).'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from travels import wallet_ledger
+
+
+class Command(BaseCommand):
+    help = 'Recompute the running credit/debit totals, transaction counts and last transaction of every wallet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Wallets updated per transaction')
+
+    def handle(self, *args, **options):
+        """Rebuild wallet aggregates from the transaction history"""
+        updated = wallet_ledger.rebuild_aggregates(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt running totals of {updated} wallet(s).'))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from travels import payments
+
+
+class Command(BaseCommand):
+    help = 'Settle payments whose gateway callback never arrived by asking the Easebuzz status API (run from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=15, help='Only check transactions started at least this many minutes ago')
+        parser.add_argument('--max-age-hours', type=int, default=72, help='Stop checking transactions older than this')
+        parser.add_argument('--workers', type=int, default=8, help='Concurrent status lookups')
+        parser.add_argument('--batch-size', type=int, default=50, help='Results applied per database transaction')
+        parser.add_argument('--limit', type=int, default=None, help='Check at most this many transactions')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the transactions that would be checked')
+
+    def handle(self, *args, **options):
+        """Reconcile stale payment transactions"""
+        if options['dry_run']:
+            count = payments.stale_transactions(options['older_than'], options['max_age_hours']).count()
+            self.stdout.write(f'{count} pending payment transaction(s) would be checked.')
+            return
+
+        report = payments.reconcile(
+            older_than=options['older_than'],
+            max_age_hours=options['max_age_hours'],
+            workers=options['workers'],
+            batch_size=options['batch_size'],
+            limit=options['limit'],
+        )
+        if report.checked == 0:
+            self.stdout.write(self.style.SUCCESS('No pending payment transactions to reconcile.'))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {report.checked} transaction(s) in {report.elapsed:.2f}s ({report.throughput:.1f}/s): '
+            f'{report.settled} settled, {report.failed} failed, {report.pending} still pending, '
+            f'{report.unknown} unknown to the gateway, {report.errors} error(s).'
+        ))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from travels import inventory
+
+
+class Command(BaseCommand):
+    help = 'Release seat holds of unpaid bookings that are past their expiry (run every minute or so from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Holds fetched per batch')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the expired holds')
+
+    def handle(self, *args, **options):
+        """Release expired seat holds back to inventory"""
+        if options['dry_run']:
+            count = inventory.release_expired_holds(dry_run=True)
+            self.stdout.write(f'{count} expired seat hold(s) would be released.')
+            return
+
+        released = inventory.release_expired_holds(batch_size=options['batch_size'])
+        if released == 0:
+            self.stdout.write(self.style.SUCCESS('No expired seat holds to release.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Released {released} expired seat hold(s).'))
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+from travels import ticket_renderer
+from travels.metrics import LatencyMetrics
+
+
+class Command(BaseCommand):
+    help = 'Pre-render ticket PDFs of confirmed, paid bookings in a process pool (run from cron, or with --loop as a worker)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help='Render processes')
+        parser.add_argument('--batch-size', type=int, default=20, help='Jobs fetched per batch')
+        parser.add_argument('--limit', type=int, default=None, help='Process at most this many jobs per pass')
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new jobs')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        """Render pending ticket jobs and report latency and queue depth"""
+        metrics = LatencyMetrics()
+        with ticket_renderer.worker_pool(options['workers']) as executor:
+            while True:
+                requeued = ticket_renderer.requeue_stalled()
+                if requeued:
+                    self.stdout.write(self.style.WARNING(f'Requeued {requeued} stalled job(s).'))
+                counts = ticket_renderer.process_jobs(
+                    executor, batch_size=options['batch_size'], limit=options['limit'], metrics=metrics)
+                if counts:
+                    summary = ', '.join(f'{count} {status}' for status, count in sorted(counts.items()))
+                    self.stdout.write(self.style.SUCCESS(f'Rendered ticket jobs: {summary}.'))
+                    self.stdout.write(self._stats(metrics))
+                elif not options['loop']:
+                    self.stdout.write(self.style.SUCCESS('No pending ticket jobs.'))
+                if not options['loop']:
+                    return
+                time.sleep(options['interval'])
+
+    def _stats(self, metrics):
+        snapshot = metrics.snapshot()
+        latency = ''
+        if 'p50_ms' in snapshot:
+            latency = (f" render p50 {snapshot['p50_ms']} ms, p95 {snapshot['p95_ms']} ms, "
+                       f"max {snapshot['max_ms']} ms over the last {len(metrics.samples)} tickets;")
+        return f'{snapshot["calls"]} tickets rendered;{latency} queue depth {ticket_renderer.queue_depth()}.'
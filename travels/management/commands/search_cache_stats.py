@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from travels import search_cache
+
+
+class Command(BaseCommand):
+    help = 'Show flight search cache hit/miss counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Reset the counters after printing them')
+
+    def handle(self, *args, **options):
+        """Print search cache effectiveness"""
+        stats = search_cache.get_stats()
+        self.stdout.write(
+            f"Hits: {stats['hits']}  Misses: {stats['misses']}  "
+            f"Hit ratio: {stats['hit_ratio'] * 100:.1f}%"
+        )
+        if options['reset']:
+            search_cache.reset_stats()
+            self.stdout.write(self.style.SUCCESS('Search cache counters reset.'))
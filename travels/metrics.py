@@ -0,0 +1,47 @@
+"""Latency metrics.
+
+Counters and rolling latency percentiles, kept in process memory. Used by
+the Easebuzz client for gateway calls and by the ticket render worker for
+render times.
+"""
+import threading
+from collections import deque
+
+
+class LatencyMetrics:
+    """Call counters plus a rolling window of latencies (milliseconds)"""
+
+    def __init__(self, window=500):
+        self.calls = 0
+        self.errors = 0
+        self.short_circuited = 0
+        self.samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, elapsed, ok=True):
+        with self._lock:
+            self.calls += 1
+            if not ok:
+                self.errors += 1
+            self.samples.append(elapsed * 1000)
+
+    def record_short_circuit(self):
+        with self._lock:
+            self.short_circuited += 1
+
+    def snapshot(self):
+        """Counters and p50/p95/max latency over the rolling window"""
+        with self._lock:
+            samples = sorted(self.samples)
+            snapshot = {
+                'calls': self.calls,
+                'errors': self.errors,
+                'short_circuited': self.short_circuited,
+            }
+        if samples:
+            snapshot.update(
+                p50_ms=round(samples[len(samples) // 2], 1),
+                p95_ms=round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 1),
+                max_ms=round(samples[-1], 1),
+            )
+        return snapshot
@@ -0,0 +1,80 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:38
+
+import datetime
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def normalize_location(location):
+    return ' '.join((location or '').split()).lower()
+
+
+def populate_search_index(apps, schema_editor):
+    """Index existing active future schedules"""
+    Schedule = apps.get_model('travels', 'Schedule')
+    FlightSearchIndex = apps.get_model('travels', 'FlightSearchIndex')
+
+    schedules = Schedule.objects.select_related('route').filter(
+        is_active=True,
+        departure_date__gte=datetime.date.today()
+    ).order_by('pk')
+
+    batch = []
+    for schedule in schedules.iterator(chunk_size=1000):
+        route = schedule.route
+        batch.append(FlightSearchIndex(
+            schedule_id=schedule.pk,
+            route_id=route.pk,
+            origin_key=normalize_location(route.from_location),
+            destination_key=normalize_location(route.to_location),
+            departure_date=schedule.departure_date,
+            departure_time=route.departure_time,
+            adult_fare=schedule.adult_fare,
+            child_fare=schedule.child_fare,
+            infant_fare=schedule.infant_fare,
+            available_seats=schedule.available_seats,
+            flight_type=route.flight_type,
+            route_type=route.route_type,
+        ))
+        if len(batch) >= 1000:
+            FlightSearchIndex.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        FlightSearchIndex.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travels', '0043_user_is_verified'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FlightSearchIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('origin_key', models.CharField(max_length=100, verbose_name='origin key')),
+                ('destination_key', models.CharField(max_length=100, verbose_name='destination key')),
+                ('departure_date', models.DateField(verbose_name='departure date')),
+                ('departure_time', models.TimeField(verbose_name='departure time')),
+                ('adult_fare', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='adult fare')),
+                ('child_fare', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='child fare')),
+                ('infant_fare', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='infant fare')),
+                ('available_seats', models.PositiveIntegerField(verbose_name='available seats')),
+                ('flight_type', models.CharField(max_length=20, verbose_name='flight type')),
+                ('route_type', models.CharField(max_length=20, verbose_name='route type')),
+                ('route', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_index_rows', to='travels.route')),
+                ('schedule', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='search_index', to='travels.schedule')),
+            ],
+            options={
+                'verbose_name': 'flight search index',
+                'verbose_name_plural': 'flight search index',
+                'indexes': [models.Index(fields=['origin_key', 'destination_key', 'departure_date', 'adult_fare'], name='flight_search_idx')],
+            },
+        ),
+        migrations.RunPython(populate_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:42
+
+from django.db import migrations, models
+
+
+def populate_fare_calendar(apps, schema_editor):
+    """Build calendar cells from the flight search index"""
+    FlightSearchIndex = apps.get_model('travels', 'FlightSearchIndex')
+    FareCalendarDay = apps.get_model('travels', 'FareCalendarDay')
+
+    cells = FlightSearchIndex.objects.filter(available_seats__gt=0).values(
+        'origin_key', 'destination_key', 'departure_date'
+    ).annotate(
+        min_fare=models.Min('adult_fare'),
+        seats=models.Sum('available_seats'),
+        flights=models.Count('id'),
+    ).order_by()
+
+    FareCalendarDay.objects.bulk_create([
+        FareCalendarDay(
+            origin_key=cell['origin_key'],
+            destination_key=cell['destination_key'],
+            day=cell['departure_date'],
+            min_adult_fare=cell['min_fare'],
+            seats_left=cell['seats'],
+            flight_count=cell['flights'],
+        )
+        for cell in cells
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travels', '0044_flightsearchindex'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FareCalendarDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('origin_key', models.CharField(max_length=100, verbose_name='origin key')),
+                ('destination_key', models.CharField(max_length=100, verbose_name='destination key')),
+                ('day', models.DateField(verbose_name='day')),
+                ('min_adult_fare', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='minimum adult fare')),
+                ('seats_left', models.PositiveIntegerField(default=0, verbose_name='seats left')),
+                ('flight_count', models.PositiveIntegerField(default=0, verbose_name='flights')),
+            ],
+            options={
+                'verbose_name': 'fare calendar day',
+                'verbose_name_plural': 'fare calendar days',
+                'ordering': ['origin_key', 'destination_key', 'day'],
+                'indexes': [models.Index(fields=['day'], name='fare_calendar_day_idx')],
+                'unique_together': {('origin_key', 'destination_key', 'day')},
+            },
+        ),
+        migrations.RunPython(populate_fare_calendar, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,241 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:47
+
+from django.db import migrations, models
+
+
+# Seed data carried over from views.get_airport_codes()
+AIRPORTS = [
+    ('Mumbai', 'BOM', 'India'),
+    ('Delhi', 'DEL', 'India'),
+    ('Bangalore', 'BLR', 'India'),
+    ('Chennai', 'MAA', 'India'),
+    ('Kolkata', 'CCU', 'India'),
+    ('Hyderabad', 'HYD', 'India'),
+    ('Pune', 'PNQ', 'India'),
+    ('Ahmedabad', 'AMD', 'India'),
+    ('Goa', 'GOI', 'India'),
+    ('Kochi', 'COK', 'India'),
+    ('Thiruvananthapuram', 'TRV', 'India'),
+    ('Jaipur', 'JAI', 'India'),
+    ('Lucknow', 'LKO', 'India'),
+    ('Nagpur', 'NAG', 'India'),
+    ('Srinagar', 'SXR', 'India'),
+    ('Guwahati', 'GAU', 'India'),
+    ('Varanasi', 'VNS', 'India'),
+    ('Amritsar', 'ATQ', 'India'),
+    ('Indore', 'IDR', 'India'),
+    ('Bhopal', 'BHO', 'India'),
+    ('Chandigarh', 'IXC', 'India'),
+    ('Coimbatore', 'CJB', 'India'),
+    ('Madurai', 'IXM', 'India'),
+    ('Tiruchirappalli', 'TRZ', 'India'),
+    ('Visakhapatnam', 'VTZ', 'India'),
+    ('Bhubaneswar', 'BBI', 'India'),
+    ('Patna', 'PAT', 'India'),
+    ('Raipur', 'RPR', 'India'),
+    ('Surat', 'STV', 'India'),
+    ('Vadodara', 'BDQ', 'India'),
+    ('Udaipur', 'UDR', 'India'),
+    ('Jodhpur', 'JDH', 'India'),
+    ('Dehradun', 'DED', 'India'),
+    ('Shimla', 'SLV', 'India'),
+    ('Dubai', 'DXB', 'Middle East - UAE'),
+    ('Abu Dhabi', 'AUH', 'Middle East - UAE'),
+    ('Sharjah', 'SHJ', 'Middle East - UAE'),
+    ('Al Ain', 'AAN', 'Middle East - UAE'),
+    ('Ras Al Khaimah', 'RKT', 'Middle East - UAE'),
+    ('Riyadh', 'RUH', 'Middle East - Saudi Arabia'),
+    ('Jeddah', 'JED', 'Middle East - Saudi Arabia'),
+    ('Dammam', 'DMM', 'Middle East - Saudi Arabia'),
+    ('Medina', 'MED', 'Middle East - Saudi Arabia'),
+    ('Abha', 'AHB', 'Middle East - Saudi Arabia'),
+    ('Tabuk', 'TUU', 'Middle East - Saudi Arabia'),
+    ('Taif', 'TIF', 'Middle East - Saudi Arabia'),
+    ('Hail', 'HAS', 'Middle East - Saudi Arabia'),
+    ('Qassim', 'ELQ', 'Middle East - Saudi Arabia'),
+    ('Doha', 'DOH', 'Middle East - Qatar'),
+    ('Kuwait', 'KWI', 'Middle East - Kuwait'),
+    ('Kuwait City', 'KWI', 'Middle East - Kuwait'),
+    ('Bahrain', 'BAH', 'Middle East - Bahrain'),
+    ('Manama', 'BAH', 'Middle East - Bahrain'),
+    ('Muscat', 'MCT', 'Middle East - Oman'),
+    ('Salalah', 'SLL', 'Middle East - Oman'),
+    ('Amman', 'AMM', 'Middle East - Jordan'),
+    ('Beirut', 'BEY', 'Middle East - Lebanon'),
+    ('Tel Aviv', 'TLV', 'Middle East - Israel'),
+    ('Jerusalem', 'JRS', 'Middle East - Israel'),
+    ('Cairo', 'CAI', 'Middle East - Egypt'),
+    ('Alexandria', 'ALY', 'Middle East - Egypt'),
+    ('Sharm El Sheikh', 'SSH', 'Middle East - Egypt'),
+    ('Hurghada', 'HRG', 'Middle East - Egypt'),
+    ('Istanbul', 'IST', 'Middle East - Turkey'),
+    ('Ankara', 'ESB', 'Middle East - Turkey'),
+    ('Antalya', 'AYT', 'Middle East - Turkey'),
+    ('Tehran', 'IKA', 'Middle East - Iran'),
+    ('Shiraz', 'SYZ', 'Middle East - Iran'),
+    ('Isfahan', 'IFN', 'Middle East - Iran'),
+    ('Singapore', 'SIN', 'Asia - Southeast'),
+    ('Bangkok', 'BKK', 'Asia - Southeast'),
+    ('Phuket', 'HKT', 'Asia - Southeast'),
+    ('Kuala Lumpur', 'KUL', 'Asia - Southeast'),
+    ('Penang', 'PEN', 'Asia - Southeast'),
+    ('Jakarta', 'CGK', 'Asia - Southeast'),
+    ('Bali', 'DPS', 'Asia - Southeast'),
+    ('Manila', 'MNL', 'Asia - Southeast'),
+    ('Cebu', 'CEB', 'Asia - Southeast'),
+    ('Ho Chi Minh', 'SGN', 'Asia - Southeast'),
+    ('Hanoi', 'HAN', 'Asia - Southeast'),
+    ('Phnom Penh', 'PNH', 'Asia - Southeast'),
+    ('Yangon', 'RGN', 'Asia - Southeast'),
+    ('Vientiane', 'VTE', 'Asia - Southeast'),
+    ('Hong Kong', 'HKG', 'Asia - East'),
+    ('Macau', 'MFM', 'Asia - East'),
+    ('Shanghai', 'PVG', 'Asia - East'),
+    ('Beijing', 'PEK', 'Asia - East'),
+    ('Guangzhou', 'CAN', 'Asia - East'),
+    ('Shenzhen', 'SZX', 'Asia - East'),
+    ('Chengdu', 'CTU', 'Asia - East'),
+    ("Xi'an", 'XIY', 'Asia - East'),
+    ('Tokyo', 'NRT', 'Asia - East'),
+    ('Osaka', 'KIX', 'Asia - East'),
+    ('Seoul', 'ICN', 'Asia - East'),
+    ('Busan', 'PUS', 'Asia - East'),
+    ('Taipei', 'TPE', 'Asia - East'),
+    ('Kaohsiung', 'KHH', 'Asia - East'),
+    ('Colombo', 'CMB', 'Asia - South'),
+    ('Male', 'MLE', 'Asia - South'),
+    ('Kathmandu', 'KTM', 'Asia - South'),
+    ('Dhaka', 'DAC', 'Asia - South'),
+    ('Karachi', 'KHI', 'Asia - South'),
+    ('Lahore', 'LHE', 'Asia - South'),
+    ('Islamabad', 'ISB', 'Asia - South'),
+    ('Rawalpindi', 'RWP', 'Asia - South'),
+    ('London', 'LHR', 'Europe - UK & Ireland'),
+    ('Manchester', 'MAN', 'Europe - UK & Ireland'),
+    ('Edinburgh', 'EDI', 'Europe - UK & Ireland'),
+    ('Birmingham', 'BHX', 'Europe - UK & Ireland'),
+    ('Glasgow', 'GLA', 'Europe - UK & Ireland'),
+    ('Dublin', 'DUB', 'Europe - UK & Ireland'),
+    ('Cork', 'ORK', 'Europe - UK & Ireland'),
+    ('Paris', 'CDG', 'Europe - Western'),
+    ('Lyon', 'LYS', 'Europe - Western'),
+    ('Nice', 'NCE', 'Europe - Western'),
+    ('Marseille', 'MRS', 'Europe - Western'),
+    ('Frankfurt', 'FRA', 'Europe - Western'),
+    ('Munich', 'MUC', 'Europe - Western'),
+    ('Berlin', 'BER', 'Europe - Western'),
+    ('Hamburg', 'HAM', 'Europe - Western'),
+    ('Amsterdam', 'AMS', 'Europe - Western'),
+    ('Brussels', 'BRU', 'Europe - Western'),
+    ('Zurich', 'ZRH', 'Europe - Western'),
+    ('Geneva', 'GVA', 'Europe - Western'),
+    ('Vienna', 'VIE', 'Europe - Western'),
+    ('Madrid', 'MAD', 'Europe - Western'),
+    ('Barcelona', 'BCN', 'Europe - Western'),
+    ('Lisbon', 'LIS', 'Europe - Western'),
+    ('Porto', 'OPO', 'Europe - Western'),
+    ('Rome', 'FCO', 'Europe - Western'),
+    ('Milan', 'MXP', 'Europe - Western'),
+    ('Venice', 'VCE', 'Europe - Western'),
+    ('Naples', 'NAP', 'Europe - Western'),
+    ('Copenhagen', 'CPH', 'Europe - Northern'),
+    ('Stockholm', 'ARN', 'Europe - Northern'),
+    ('Oslo', 'OSL', 'Europe - Northern'),
+    ('Helsinki', 'HEL', 'Europe - Northern'),
+    ('Reykjavik', 'KEF', 'Europe - Northern'),
+    ('Warsaw', 'WAW', 'Europe - Eastern'),
+    ('Prague', 'PRG', 'Europe - Eastern'),
+    ('Budapest', 'BUD', 'Europe - Eastern'),
+    ('Bucharest', 'OTP', 'Europe - Eastern'),
+    ('Sofia', 'SOF', 'Europe - Eastern'),
+    ('Athens', 'ATH', 'Europe - Eastern'),
+    ('Belgrade', 'BEG', 'Europe - Eastern'),
+    ('Zagreb', 'ZAG', 'Europe - Eastern'),
+    ('New York', 'JFK', 'North America - USA'),
+    ('Los Angeles', 'LAX', 'North America - USA'),
+    ('Chicago', 'ORD', 'North America - USA'),
+    ('San Francisco', 'SFO', 'North America - USA'),
+    ('Miami', 'MIA', 'North America - USA'),
+    ('Boston', 'BOS', 'North America - USA'),
+    ('Washington', 'IAD', 'North America - USA'),
+    ('Seattle', 'SEA', 'North America - USA'),
+    ('Atlanta', 'ATL', 'North America - USA'),
+    ('Dallas', 'DFW', 'North America - USA'),
+    ('Houston', 'IAH', 'North America - USA'),
+    ('Las Vegas', 'LAS', 'North America - USA'),
+    ('Phoenix', 'PHX', 'North America - USA'),
+    ('Denver', 'DEN', 'North America - USA'),
+    ('Philadelphia', 'PHL', 'North America - USA'),
+    ('Detroit', 'DTW', 'North America - USA'),
+    ('Minneapolis', 'MSP', 'North America - USA'),
+    ('Orlando', 'MCO', 'North America - USA'),
+    ('Toronto', 'YYZ', 'North America - Canada'),
+    ('Vancouver', 'YVR', 'North America - Canada'),
+    ('Montreal', 'YUL', 'North America - Canada'),
+    ('Calgary', 'YYC', 'North America - Canada'),
+    ('Ottawa', 'YOW', 'North America - Canada'),
+    ('Edmonton', 'YEG', 'North America - Canada'),
+    ('Mexico City', 'MEX', 'North America - Mexico'),
+    ('Cancun', 'CUN', 'North America - Mexico'),
+    ('Guadalajara', 'GDL', 'North America - Mexico'),
+    ('São Paulo', 'GRU', 'South America'),
+    ('Rio de Janeiro', 'GIG', 'South America'),
+    ('Buenos Aires', 'EZE', 'South America'),
+    ('Lima', 'LIM', 'South America'),
+    ('Bogotá', 'BOG', 'South America'),
+    ('Santiago', 'SCL', 'South America'),
+    ('Caracas', 'CCS', 'South America'),
+    ('Johannesburg', 'JNB', 'Africa'),
+    ('Cape Town', 'CPT', 'Africa'),
+    ('Casablanca', 'CMN', 'Africa'),
+    ('Lagos', 'LOS', 'Africa'),
+    ('Nairobi', 'NBO', 'Africa'),
+    ('Addis Ababa', 'ADD', 'Africa'),
+    ('Accra', 'ACC', 'Africa'),
+    ('Sydney', 'SYD', 'Australia & Oceania'),
+    ('Melbourne', 'MEL', 'Australia & Oceania'),
+    ('Brisbane', 'BNE', 'Australia & Oceania'),
+    ('Perth', 'PER', 'Australia & Oceania'),
+    ('Adelaide', 'ADL', 'Australia & Oceania'),
+    ('Auckland', 'AKL', 'Australia & Oceania'),
+    ('Wellington', 'WLG', 'Australia & Oceania'),
+    ('Christchurch', 'CHC', 'Australia & Oceania'),
+    ('Fiji', 'NAN', 'Australia & Oceania'),
+    ('Honolulu', 'HNL', 'Australia & Oceania'),
+]
+
+
+def populate_airports(apps, schema_editor):
+    """Seed the airport table with the cities previously hard-coded in views"""
+    Airport = apps.get_model('travels', 'Airport')
+    Airport.objects.bulk_create(
+        [Airport(city=city, code=code, region=region) for city, code, region in AIRPORTS],
+        ignore_conflicts=True,
+    )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travels', '0045_farecalendarday'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Airport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('city', models.CharField(max_length=100, unique=True, verbose_name='city')),
+                ('code', models.CharField(db_index=True, help_text='3-letter IATA code, e.g., LKO', max_length=3, verbose_name='IATA code')),
+                ('region', models.CharField(blank=True, help_text='E.g., India, Middle East - UAE', max_length=100, verbose_name='region')),
+                ('is_active', models.BooleanField(default=True, help_text='Offer this city in search dropdowns', verbose_name='active')),
+            ],
+            options={
+                'verbose_name': 'airport',
+                'verbose_name_plural': 'airports',
+                'ordering': ['city'],
+            },
+        ),
+        migrations.RunPython(populate_airports, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,136 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Seed data carried over from Route.get_airline_logo_url() and the
+# airline_name_from_code template filter: (code, name, aliases, static logo)
+AIRLINES = [
+    ('6E', 'IndiGo', ['indigo airlines', 'indigo airline'], 'images/flight-logo/indigo.png'),
+    ('G9', 'Air Arabia', ['airarabia'], 'images/flight-logo/air-arabia.png'),
+    ('AI', 'Air India', ['airindia'], 'images/flight-logo/air-india.png'),
+    ('IX', 'Air India Express', [], 'images/flight-logo/air-india.png'),
+    ('XY', 'flynas', ['fly nas'], 'images/flight-logo/flynas.png'),
+    ('J9', 'Jazeera Airways', ['jazeera', 'jazeera airway'], 'images/flight-logo/jazeera.png'),
+    ('SV', 'Saudia', ['saudi airlines', 'saudi arabian airlines', 'saudi arabia', 'saudi arabian'], 'images/flight-logo/saudi-airline.png'),
+    ('FZ', 'flydubai', ['fly dubai', 'fly dubai airlines'], 'images/flight-logo/fly-dubai.png'),
+    # Using fly-dubai as placeholder until an Emirates logo is uploaded
+    ('EK', 'Emirates', ['emirates airlines'], 'images/flight-logo/fly-dubai.png'),
+    ('UK', 'Vistara', [], ''),
+    ('SG', 'SpiceJet', ['spice jet'], ''),
+    ('G8', 'Go First', ['go air', 'goair'], ''),
+    ('I5', 'AirAsia India', [], ''),
+    ('QP', 'Akasa Air', ['akasa'], ''),
+    ('9I', 'Alliance Air', [], ''),
+    ('S5', 'Star Air', [], ''),
+    ('EY', 'Etihad Airways', ['etihad'], ''),
+    ('QR', 'Qatar Airways', ['qatar airway'], ''),
+    ('SQ', 'Singapore Airlines', [], ''),
+    ('TG', 'Thai Airways', [], ''),
+    ('MH', 'Malaysia Airlines', [], ''),
+    ('CX', 'Cathay Pacific', [], ''),
+    ('BA', 'British Airways', [], ''),
+    ('LH', 'Lufthansa', [], ''),
+    ('AF', 'Air France', [], ''),
+    ('KL', 'KLM', [], ''),
+    ('TK', 'Turkish Airlines', [], ''),
+    ('GF', 'Gulf Air', [], ''),
+    ('WY', 'Oman Air', [], ''),
+    ('UL', 'SriLankan Airlines', ['srilankan'], ''),
+    ('BG', 'Biman Bangladesh', ['biman'], ''),
+    ('PK', 'Pakistan International', ['pia'], ''),
+    ('RA', 'Nepal Airlines', [], ''),
+]
+
+
+def _normalize(value):
+    return ' '.join(str(value or '').split()).lower()
+
+
+def _resolve(airlines, airline_name, carrier_number):
+    """Frozen copy of Airline.resolve() for the historical models"""
+    name = _normalize(airline_name)
+    keyed = [
+        (airline, {_normalize(airline.name), _normalize(airline.code)} | {_normalize(alias) for alias in airline.aliases})
+        for airline in airlines
+    ]
+    if name:
+        for airline, keys in keyed:
+            if name in keys:
+                return airline
+        padded = f' {name} '
+        candidates = sorted(
+            ((key, airline) for airline, keys in keyed for key in keys if len(key) > 2),
+            key=lambda item: -len(item[0])
+        )
+        for key, airline in candidates:
+            if f' {key} ' in padded:
+                return airline
+    code = str(carrier_number or '').strip().upper()[:2]
+    for airline in airlines:
+        if code and airline.code == code:
+            return airline
+    return None
+
+
+def populate_airlines(apps, schema_editor):
+    """Seed airlines and resolve the airline / logo URL of existing routes"""
+    from django.templatetags.static import static
+
+    Airline = apps.get_model('travels', 'Airline')
+    Route = apps.get_model('travels', 'Route')
+
+    Airline.objects.bulk_create(
+        [Airline(code=code, name=name, aliases=aliases, static_logo=logo) for code, name, aliases, logo in AIRLINES],
+        ignore_conflicts=True,
+    )
+
+    airlines = list(Airline.objects.filter(is_active=True))
+    for route in Route.objects.all():
+        airline = _resolve(airlines, route.airline_name, route.carrier_number)
+        if airline:
+            Route.objects.filter(pk=route.pk).update(
+                airline_id=airline.pk,
+                airline_logo_url=static(airline.static_logo) if airline.static_logo else '',
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travels', '0046_airport'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Airline',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('code', models.CharField(help_text='2-character IATA code, e.g., 6E', max_length=2, unique=True, verbose_name='IATA code')),
+                ('name', models.CharField(max_length=100, verbose_name='airline name')),
+                ('aliases', models.JSONField(blank=True, default=list, help_text='Other names used for this airline on routes, e.g., ["indigo airlines"]', verbose_name='aliases')),
+                ('logo', models.ImageField(blank=True, help_text='Uploaded logo (takes precedence over the static logo)', null=True, upload_to='airline_logos/', verbose_name='logo')),
+                ('static_logo', models.CharField(blank=True, help_text='Path under static/, e.g., images/flight-logo/indigo.png', max_length=200, verbose_name='static logo path')),
+                ('is_active', models.BooleanField(default=True, verbose_name='active')),
+            ],
+            options={
+                'verbose_name': 'airline',
+                'verbose_name_plural': 'airlines',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='airline_logo_url',
+            field=models.CharField(blank=True, editable=False, max_length=255, verbose_name='airline logo URL'),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='airline',
+            field=models.ForeignKey(blank=True, editable=False, help_text='Resolved from the airline name / flight number on save', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='routes', to='travels.airline'),
+        ),
+        migrations.RunPython(populate_airlines, migrations.RunPython.noop),
+    ]
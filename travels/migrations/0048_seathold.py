@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travels', '0047_airline'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='schedule',
+            name='held_seats',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Seats held for bookings awaiting payment (maintained by the inventory service)', verbose_name='held seats'),
+        ),
+        migrations.CreateModel(
+            name='SeatHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('seats', models.PositiveIntegerField(verbose_name='seats')),
+                ('status', models.CharField(choices=[('active', 'Active'), ('converted', 'Converted'), ('released', 'Released')], default='active', max_length=20, verbose_name='status')),
+                ('expires_at', models.DateTimeField(verbose_name='expires at')),
+                ('booking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seat_holds', to='travels.booking')),
+                ('schedule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seat_holds', to='travels.schedule')),
+            ],
+            options={
+                'verbose_name': 'seat hold',
+                'verbose_name_plural': 'seat holds',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'expires_at'], name='seat_hold_expiry_idx')],
+            },
+        ),
+    ]
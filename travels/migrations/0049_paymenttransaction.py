@@ -0,0 +1,95 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:54
+
+import json
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_payment_transactions(apps, schema_editor):
+    """Move gateway txnids out of booking notes / payment_id / wallet references into the ledger"""
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    PaymentTransaction = apps.get_model('travels', 'PaymentTransaction')
+    Booking = apps.get_model('travels', 'Booking')
+    VisaBooking = apps.get_model('travels', 'VisaBooking')
+    CashBalanceTransaction = apps.get_model('travels', 'CashBalanceTransaction')
+
+    def content_type(model):
+        return ContentType.objects.get_or_create(app_label='travels', model=model)[0]
+
+    rows = []
+    booking_type = content_type('booking')
+    for booking in Booking.objects.filter(notes__contains='easebuzz_txnid').iterator():
+        try:
+            txnid = json.loads(booking.notes).get('easebuzz_txnid')
+        except (ValueError, AttributeError):
+            continue
+        if txnid:
+            paid = booking.payment_status == 'paid'
+            rows.append(PaymentTransaction(
+                txnid=txnid, purpose='flight_booking', user_id=booking.user_id,
+                content_type=booking_type, object_id=booking.pk, amount=booking.total_amount,
+                status='success' if paid else 'initiated', gateway_status='success' if paid else '',
+                completed_at=booking.updated_at if paid else None,
+            ))
+
+    visa_type = content_type('visabooking')
+    for visa in VisaBooking.objects.filter(payment_id__startswith='VISATXN_').iterator():
+        paid = visa.payment_status == 'paid'
+        rows.append(PaymentTransaction(
+            txnid=visa.payment_id, purpose='visa', user_id=visa.user_id,
+            content_type=visa_type, object_id=visa.pk, amount=visa.price,
+            status='success' if paid else 'initiated', gateway_status='success' if paid else '',
+            completed_at=visa.updated_at if paid else None,
+        ))
+
+    wallet_type = content_type('cashbalancewallet')
+    recharges = CashBalanceTransaction.objects.filter(
+        transaction_type='recharge', reference_id__startswith='WALLET_'
+    ).select_related('cash_balance_wallet')
+    for recharge in recharges.iterator():
+        rows.append(PaymentTransaction(
+            txnid=recharge.reference_id, purpose='wallet_recharge', user_id=recharge.cash_balance_wallet.user_id,
+            content_type=wallet_type, object_id=recharge.cash_balance_wallet_id, amount=recharge.amount,
+            status='success', gateway_status='success', completed_at=recharge.created_at,
+        ))
+
+    PaymentTransaction.objects.bulk_create(rows, batch_size=500, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('travels', '0048_seathold'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('txnid', models.CharField(max_length=64, unique=True, verbose_name='transaction ID')),
+                ('gateway', models.CharField(default='easebuzz', max_length=20, verbose_name='gateway')),
+                ('purpose', models.CharField(choices=[('flight_booking', 'Flight Booking'), ('visa', 'Visa Application'), ('wallet_recharge', 'Wallet Recharge')], max_length=20, verbose_name='purpose')),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='amount')),
+                ('status', models.CharField(choices=[('initiated', 'Initiated'), ('success', 'Success'), ('failed', 'Failed')], default='initiated', max_length=20, verbose_name='status')),
+                ('gateway_status', models.CharField(blank=True, help_text='Status string reported by the gateway', max_length=50, verbose_name='gateway status')),
+                ('gateway_payload', models.JSONField(blank=True, default=dict, help_text='Raw gateway callback / status response', verbose_name='gateway payload')),
+                ('completed_at', models.DateTimeField(blank=True, null=True, verbose_name='completed at')),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='contenttypes.contenttype')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='payment_transactions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Payment Transaction',
+                'verbose_name_plural': 'Payment Transactions',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['content_type', 'object_id'], name='payment_txn_target_idx'), models.Index(fields=['status', 'created_at'], name='payment_txn_status_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_payment_transactions, migrations.RunPython.noop),
+    ]
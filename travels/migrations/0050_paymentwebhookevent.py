@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travels', '0049_paymenttransaction'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentWebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('gateway', models.CharField(default='easebuzz', max_length=20, verbose_name='gateway')),
+                ('txnid', models.CharField(db_index=True, max_length=64, verbose_name='transaction ID')),
+                ('gateway_status', models.CharField(blank=True, max_length=50, verbose_name='gateway status')),
+                ('payload', models.JSONField(blank=True, default=dict, verbose_name='payload')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processed', 'Processed'), ('ignored', 'Ignored'), ('failed', 'Failed')], default='pending', max_length=20, verbose_name='status')),
+                ('outcome', models.CharField(blank=True, help_text='Result of applying the event to its payment transaction', max_length=30, verbose_name='outcome')),
+                ('error', models.TextField(blank=True, verbose_name='error')),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='processed at')),
+            ],
+            options={
+                'verbose_name': 'Payment Webhook Event',
+                'verbose_name_plural': 'Payment Webhook Events',
+                'ordering': ['-id'],
+                'indexes': [models.Index(fields=['status', 'id'], name='payment_webhook_queue_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:05
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_wallet_totals(apps, schema_editor):
+    """Compute the running totals of existing wallets from their history"""
+    zero = Value(Decimal('0'), output_field=DecimalField(max_digits=12, decimal_places=2))
+    ledgers = (
+        ('ODWallet', 'ODWalletTransaction', 'od_wallet'),
+        ('CashBalanceWallet', 'CashBalanceTransaction', 'cash_balance_wallet'),
+    )
+    for wallet_name, history_name, wallet_field in ledgers:
+        Wallet = apps.get_model('travels', wallet_name)
+        History = apps.get_model('travels', history_name)
+        history = History.objects.filter(**{wallet_field: OuterRef('pk')})
+        per_wallet = history.order_by().values(wallet_field)
+        Wallet.objects.update(
+            credit_total=Coalesce(Subquery(per_wallet.filter(amount__gt=0).annotate(total=Sum('amount')).values('total')), zero),
+            debit_total=Coalesce(Subquery(per_wallet.filter(amount__lt=0).annotate(total=-Sum('amount')).values('total')), zero),
+            txn_count=Coalesce(Subquery(per_wallet.annotate(count=Count('pk')).values('count')), 0),
+            last_txn_at=Subquery(history.order_by('-created_at', '-pk').values('created_at')[:1]),
+            last_txn_id=Subquery(history.order_by('-created_at', '-pk').values('pk')[:1]),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travels', '0050_paymentwebhookevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cashbalancewallet',
+            name='credit_total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='total credits'),
+        ),
+        migrations.AddField(
+            model_name='cashbalancewallet',
+            name='debit_total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='total debits'),
+        ),
+        migrations.AddField(
+            model_name='cashbalancewallet',
+            name='last_txn_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='last transaction at'),
+        ),
+        migrations.AddField(
+            model_name='cashbalancewallet',
+            name='last_txn_id',
+            field=models.PositiveBigIntegerField(blank=True, editable=False, null=True, verbose_name='last transaction ID'),
+        ),
+        migrations.AddField(
+            model_name='cashbalancewallet',
+            name='txn_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='transaction count'),
+        ),
+        migrations.AddField(
+            model_name='odwallet',
+            name='credit_total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='total credits'),
+        ),
+        migrations.AddField(
+            model_name='odwallet',
+            name='debit_total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='total debits'),
+        ),
+        migrations.AddField(
+            model_name='odwallet',
+            name='last_txn_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='last transaction at'),
+        ),
+        migrations.AddField(
+            model_name='odwallet',
+            name='last_txn_id',
+            field=models.PositiveBigIntegerField(blank=True, editable=False, null=True, verbose_name='last transaction ID'),
+        ),
+        migrations.AddField(
+            model_name='odwallet',
+            name='txn_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='transaction count'),
+        ),
+        migrations.RunPython(backfill_wallet_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.db import migrations
+
+
+def create_missing_cash_wallets(apps, schema_editor):
+    """Give every existing user a cash balance wallet (previously created on first page view)"""
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    CashBalanceWallet = apps.get_model('travels', 'CashBalanceWallet')
+    user_ids = User.objects.filter(cash_balance_wallet__isnull=True).values_list('pk', flat=True)
+    CashBalanceWallet.objects.bulk_create(
+        [CashBalanceWallet(user_id=user_id) for user_id in user_ids.iterator()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travels', '0051_wallet_running_totals'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_missing_cash_wallets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:15
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Concat
+
+
+def backfill_passenger_summary(apps, schema_editor):
+    """Compute the passenger summary of existing bookings from their passengers"""
+    Booking = apps.get_model('travels', 'Booking')
+    BookingPassenger = apps.get_model('travels', 'BookingPassenger')
+    passengers = BookingPassenger.objects.filter(booking=OuterRef('pk')).order_by()
+
+    def count(*types):
+        rows = passengers.filter(passenger_type__in=types) if types else passengers
+        return Coalesce(Subquery(rows.values('booking').annotate(n=Count('pk')).values('n')), 0)
+
+    Booking.objects.update(
+        adult_count=count('adult', 'senior'),
+        child_count=count('child'),
+        infant_count=count('infant'),
+        seat_count=count('adult', 'senior', 'child'),
+        passenger_count=count(),
+        lead_passenger_name=Coalesce(
+            Subquery(passengers.order_by('pk').annotate(
+                name=Concat('first_name', Value(' '), 'last_name')
+            ).values('name')[:1]),
+            Value(''),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travels', '0053_booking_user_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='adult_count',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, help_text='Adults and senior citizens', verbose_name='adults'),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='child_count',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='children'),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='infant_count',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='infants'),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='lead_passenger_name',
+            field=models.CharField(blank=True, editable=False, max_length=201, verbose_name='lead passenger'),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='passenger_count',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='passengers'),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='seat_count',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, help_text='Seats taken (infants travel on a lap)', verbose_name='seats'),
+        ),
+        migrations.RunPython(backfill_passenger_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travels', '0054_booking_passenger_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TicketRenderJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=20, verbose_name='status')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='attempts')),
+                ('render_ms', models.PositiveIntegerField(blank=True, null=True, verbose_name='render time (ms)')),
+                ('error', models.TextField(blank=True, verbose_name='error')),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='processed at')),
+                ('booking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='render_jobs', to='travels.booking')),
+            ],
+            options={
+                'verbose_name': 'Ticket Render Job',
+                'verbose_name_plural': 'Ticket Render Jobs',
+                'ordering': ['-id'],
+                'indexes': [models.Index(fields=['status', 'id'], name='ticket_render_queue_idx')],
+            },
+        ),
+    ]
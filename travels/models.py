@@ -1,7 +1,10 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser, BaseUserManager, Group, Permission
+from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.contenttypes.models import ContentType
 from django.utils import timezone
-from django.db.models.signals import post_save, pre_save
+from django.db.models.functions import Coalesce, Concat
+from django.db.models.signals import post_save, pre_save, post_delete
 from django.dispatch import receiver
 from django.db import transaction
 from django.core.validators import MinLengthValidator, RegexValidator, MinValueValidator, MaxValueValidator
@@ -12,6 +15,8 @@ from datetime import datetime, date, timedelta
 from decimal import Decimal
 import uuid
 
+from . import airports, sales_reps, search_cache, ticket_pdfs, ticket_renderer
+
 class TimestampedModel(models.Model):
     """Abstract base class with created and updated timestamps"""
     created_at = models.DateTimeField(auto_now_add=True)
@@ -285,7 +290,8 @@ class UserProfile(TimestampedModel):
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
-    """Automatically create UserProfile when a User is created"""
+    """Automatically create UserProfile and CashBalanceWallet when a User is created
+    (sign-up, admin and createsuperuser alike)"""
     if created:
         # Create profile with default values
         try:
@@ -295,6 +301,7 @@ def create_user_profile(sender, instance, created, **kwargs):
                     'full_name': instance.get_full_name() or instance.email.split('@')[0]
                 }
             )
+            CashBalanceWallet.objects.get_or_create(user=instance)
         except Exception as e:
             # Log error but don't fail user creation
             import logging
@@ -428,6 +435,117 @@ class OTPVerification(models.Model):
         self.save()
         return False
 
+class Airline(TimestampedModel):
+    """Airline reference data (IATA code, name, aliases and logo) - Admin managed"""
+    code = models.CharField(_('IATA code'), max_length=2, unique=True, help_text=_('2-character IATA code, e.g., 6E'))
+    name = models.CharField(_('airline name'), max_length=100)
+    aliases = models.JSONField(_('aliases'), default=list, blank=True,
+                               help_text=_('Other names used for this airline on routes, e.g., ["indigo airlines"]'))
+    logo = models.ImageField(_('logo'), upload_to='airline_logos/', blank=True, null=True,
+                             help_text=_('Uploaded logo (takes precedence over the static logo)'))
+    static_logo = models.CharField(_('static logo path'), max_length=200, blank=True,
+                                   help_text=_('Path under static/, e.g., images/flight-logo/indigo.png'))
+    is_active = models.BooleanField(_('active'), default=True)
+    
+    class Meta:
+        verbose_name = _('airline')
+        verbose_name_plural = _('airlines')
+        ordering = ['name']
+    
+    def __str__(self):
+        return f"{self.name} ({self.code})"
+    
+    def save(self, *args, **kwargs):
+        self.code = self.code.strip().upper()
+        super().save(*args, **kwargs)
+    
+    @staticmethod
+    def normalize_name(value):
+        """Lowercase and collapse whitespace for name matching"""
+        return ' '.join(str(value or '').split()).lower()
+    
+    @property
+    def match_keys(self):
+        """Normalized name, code and aliases this airline answers to"""
+        keys = {self.normalize_name(self.name), self.normalize_name(self.code)}
+        keys.update(self.normalize_name(alias) for alias in self.aliases or [])
+        keys.discard('')
+        return keys
+    
+    def get_logo_url(self):
+        """Uploaded logo URL, else the bundled static logo"""
+        if self.logo:
+            return self.logo.url
+        if self.static_logo:
+            from django.templatetags.static import static
+            return static(self.static_logo)
+        return ''
+    
+    @classmethod
+    def resolve(cls, airline_name='', carrier_number='', airlines=None):
+        """Airline matching a route's airline name, else its flight number prefix"""
+        if airlines is None:
+            airlines = list(cls.objects.filter(is_active=True))
+        name = cls.normalize_name(airline_name)
+        if name:
+            # Exact name/alias match first
+            for airline in airlines:
+                if name in airline.match_keys:
+                    return airline
+            # Then a whole-word alias inside the name, longest alias first
+            # (so "air india express" wins over "air india")
+            padded = f' {name} '
+            keys = sorted(
+                ((key, airline) for airline in airlines for key in airline.match_keys if len(key) > 2),
+                key=lambda item: -len(item[0])
+            )
+            for key, airline in keys:
+                if f' {key} ' in padded:
+                    return airline
+        # Finally the carrier code prefix of the flight number (e.g., EK701 -> EK)
+        code = str(carrier_number or '').strip().upper()[:2]
+        if code:
+            for airline in airlines:
+                if airline.code == code:
+                    return airline
+        return None
+    
+    @classmethod
+    def refresh_routes(cls):
+        """Re-resolve the airline and stored logo URL of every route"""
+        airlines = list(cls.objects.filter(is_active=True))
+        changed = 0
+        for route in Route.objects.only('id', 'airline_name', 'carrier_number', 'airline_id', 'airline_logo_url'):
+            airline = cls.resolve(route.airline_name, route.carrier_number, airlines)
+            airline_id = airline.pk if airline else None
+            logo_url = airline.get_logo_url() if airline else ''
+            if route.airline_id != airline_id or route.airline_logo_url != logo_url:
+                # update() skips Route signals; cached searches are dropped below
+                Route.objects.filter(pk=route.pk).update(airline_id=airline_id, airline_logo_url=logo_url)
+                changed += 1
+        if changed:
+            search_cache.bump_all()
+        return changed
+
+class Airport(TimestampedModel):
+    """Airport reference data (city and IATA code) - Admin managed"""
+    city = models.CharField(_('city'), max_length=100, unique=True)
+    code = models.CharField(_('IATA code'), max_length=3, db_index=True, help_text=_('3-letter IATA code, e.g., LKO'))
+    region = models.CharField(_('region'), max_length=100, blank=True, help_text=_('E.g., India, Middle East - UAE'))
+    is_active = models.BooleanField(_('active'), default=True, help_text=_('Offer this city in search dropdowns'))
+    
+    class Meta:
+        verbose_name = _('airport')
+        verbose_name_plural = _('airports')
+        ordering = ['city']
+    
+    def __str__(self):
+        return f"{self.city} ({self.code})"
+    
+    def save(self, *args, **kwargs):
+        self.code = self.code.strip().upper()
+        super().save(*args, **kwargs)
+
 class Route(TimestampedModel):
     """Travel routes available in the system"""
     ROUTE_TYPE_CHOICES = [
@@ -450,6 +568,9 @@ class Route(TimestampedModel):
     transport_type = models.CharField(_('transport type'), max_length=20, choices=TRANSPORT_TYPE_CHOICES, default='flight')
     airline_name = models.CharField(_('airline/flight company name'), max_length=100, blank=True, 
                                      help_text=_('E.g., Indigo, Air India, SpiceJet, Vistara, etc.'))
+    airline = models.ForeignKey(Airline, on_delete=models.SET_NULL, null=True, blank=True, related_name='routes',
+                                editable=False, help_text=_('Resolved from the airline name / flight number on save'))
+    airline_logo_url = models.CharField(_('airline logo URL'), max_length=255, blank=True, editable=False)
     carrier_number = models.CharField(_('flight number'), max_length=20, unique=True)
     departure_time = models.TimeField(_('departure time'))
     arrival_time = models.TimeField(_('arrival time'))
@@ -502,76 +623,25 @@ class Route(TimestampedModel):
         minutes = (total_seconds % 3600) // 60
         return f"{hours}h {minutes}m" if hours else f"{minutes}m"
     
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            self.resolve_airline()
+        elif {'airline_name', 'carrier_number'} & set(update_fields):
+            self.resolve_airline()
+            kwargs['update_fields'] = set(update_fields) | {'airline_name', 'airline', 'airline_logo_url'}
+        super().save(*args, **kwargs)
+    
+    def resolve_airline(self, airlines=None):
+        """Link the airline and store its logo URL so renders don't compute it"""
+        self.airline = Airline.resolve(self.airline_name, self.carrier_number, airlines)
+        self.airline_logo_url = self.airline.get_logo_url() if self.airline else ''
+        if self.airline and not self.airline_name:
+            self.airline_name = self.airline.name
+    
     def get_airline_logo_url(self):
-        """Get airline logo URL based on airline name from static files"""
-        if not self.airline_name:
-            return None
-        
-        from django.templatetags.static import static
-        
-        # Airline logo mapping - using static files from static/images/flight-logo/
-        # Map airline names to their corresponding logo file names
-        airline_logos = {
-            'indigo': 'images/flight-logo/indigo.png',
-            'indigo airlines': 'images/flight-logo/indigo.png',
-            'indigo airline': 'images/flight-logo/indigo.png',
-            '6e': 'images/flight-logo/indigo.png',
-            'air arabia': 'images/flight-logo/air-arabia.png',
-            'airarabia': 'images/flight-logo/air-arabia.png',
-            'g9': 'images/flight-logo/air-arabia.png',
-            'air india': 'images/flight-logo/air india.png',
-            'airindia': 'images/flight-logo/air india.png',
-            'air india express': 'images/flight-logo/air india.png',
-            'ai': 'images/flight-logo/air india.png',
-            'ix': 'images/flight-logo/air india.png',
-            'flynas': 'images/flight-logo/flynas.png',
-            'xn': 'images/flight-logo/flynas.png',
-            'jazeera': 'images/flight-logo/jazeera.png',
-            'jazeera airways': 'images/flight-logo/jazeera.png',
-            'jazeera airway': 'images/flight-logo/jazeera.png',
-            'j9': 'images/flight-logo/jazeera.png',
-            'saudi airlines': 'images/flight-logo/saudi-airline.png',
-            'saudi arabian airlines': 'images/flight-logo/saudi-airline.png',
-            'saudi arabia': 'images/flight-logo/saudi-airline.png',
-            'saudi arabian': 'images/flight-logo/saudi-airline.png',
-            'saudia': 'images/flight-logo/saudi-airline.png',
-            'sv': 'images/flight-logo/saudi-airline.png',
-            'fly dubai': 'images/flight-logo/fly-dubai.png',
-            'flydubai': 'images/flight-logo/fly-dubai.png',
-            'fly dubai airlines': 'images/flight-logo/fly-dubai.png',
-            'fz': 'images/flight-logo/fly-dubai.png',
-            'emirates': 'images/flight-logo/fly-dubai.png',  # Using fly-dubai as placeholder
-            'emirates airlines': 'images/flight-logo/fly-dubai.png',
-            'ek': 'images/flight-logo/fly-dubai.png',  # Emirates carrier code
-        }
-        
-        # Normalize airline name (lowercase, strip spaces)
-        airline_key = self.airline_name.lower().strip()
-        # Remove extra spaces
-        airline_key = ' '.join(airline_key.split())
-        
-        # Try exact match first
-        logo_path = airline_logos.get(airline_key)
-        if logo_path:
-            return static(logo_path)
-        
-        # Try partial match (contains check)
-        for key, path in airline_logos.items():
-            if key in airline_key or airline_key in key:
-                return static(path)
-        
-        # Try to detect from carrier number (e.g., EK701 -> ek)
-        if self.carrier_number:
-            # Extract the airline code prefix (letters only)
-            import re
-            match = re.match(r'^([A-Za-z]+)', self.carrier_number.strip())
-            if match:
-                carrier_code = match.group(1).lower()
-                logo_path = airline_logos.get(carrier_code)
-                if logo_path:
-                    return static(logo_path)
-        
-        return None
+        """Airline logo URL resolved when the route was saved"""
+        return self.airline_logo_url or None
     
     def calculate_arrival_date(self, departure_date):
         """Calculate arrival date based on departure date and duration"""
@@ -615,6 +685,8 @@ class Schedule(TimestampedModel):
     arrival_date = models.DateField(_('arrival date'))
     total_seats = models.PositiveIntegerField(_('total seats'), default=50)
     available_seats = models.PositiveIntegerField(_('available seats'), default=50)
+    held_seats = models.PositiveIntegerField(_('held seats'), default=0, editable=False,
+                                             help_text=_('Seats held for bookings awaiting payment (maintained by the inventory service)'))
     
     # Passenger-specific fares
     adult_fare = models.DecimalField(
@@ -670,25 +742,42 @@ class Schedule(TimestampedModel):
         if self.available_seats > self.total_seats:
             raise ValidationError(_('Available seats cannot exceed total seats'))
     
+    def save(self, *args, **kwargs):
+        # held_seats is owned by the inventory service: re-read it and never write back a stale copy
+        if not self._state.adding and self.pk and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            held_seats = Schedule.objects.filter(pk=self.pk).values_list('held_seats', flat=True).first()
+            if held_seats is not None:
+                self.held_seats = held_seats
+                kwargs['update_fields'] = [
+                    field.name for field in self._meta.concrete_fields
+                    if not field.primary_key and field.name != 'held_seats'
+                ]
+        super().save(*args, **kwargs)
+    
+    @property
+    def bookable_seats(self):
+        """Seats that can still be booked (unsold seats minus active holds)"""
+        return max(self.available_seats - self.held_seats, 0)
+    
     @property
     def is_available(self):
         """Check if there are available seats and the schedule is active"""
-        return self.available_seats > 0 and self.is_active
+        return self.bookable_seats > 0 and self.is_active
     
     def book_seats(self, seats=1):
         """Book specified number of seats"""
-        if not self.is_available or seats > self.available_seats:
+        from .inventory import reserve_seats
+        if not self.is_active or not reserve_seats(self.pk, seats):
             return False
-        self.available_seats -= seats
-        self.save()
+        self.refresh_from_db(fields=['available_seats', 'updated_at'])
         return True
     
     def cancel_booking(self, seats=1):
         """Cancel booking and release seats"""
-        if (self.available_seats + seats) > self.total_seats:
+        from .inventory import release_seats
+        if not release_seats(self.pk, seats):
             return False
-        self.available_seats += seats
-        self.save()
+        self.refresh_from_db(fields=['available_seats', 'updated_at'])
         return True
     
     @property
@@ -749,7 +838,319 @@ class Schedule(TimestampedModel):
     
     def can_book(self, num_seats=1):
         """Check if specified number of seats can be booked"""
-        return self.is_available and self.available_seats >= num_seats
+        return self.is_active and self.bookable_seats >= num_seats
+
+class FlightSearchIndex(TimestampedModel):
+    """Denormalized search row for an active, future schedule.
+
+    Origin/destination are stored as lowercase keys so search_flights can use
+    plain equality lookups against the composite index instead of iexact
+    comparisons through the Route join.
+    """
+    schedule = models.OneToOneField(Schedule, on_delete=models.CASCADE, related_name='search_index')
+    route = models.ForeignKey(Route, on_delete=models.CASCADE, related_name='search_index_rows')
+    origin_key = models.CharField(_('origin key'), max_length=100)
+    destination_key = models.CharField(_('destination key'), max_length=100)
+    departure_date = models.DateField(_('departure date'))
+    departure_time = models.TimeField(_('departure time'))
+    adult_fare = models.DecimalField(_('adult fare'), max_digits=10, decimal_places=2)
+    child_fare = models.DecimalField(_('child fare'), max_digits=10, decimal_places=2, null=True, blank=True)
+    infant_fare = models.DecimalField(_('infant fare'), max_digits=10, decimal_places=2, null=True, blank=True)
+    available_seats = models.PositiveIntegerField(_('available seats'))
+    flight_type = models.CharField(_('flight type'), max_length=20)
+    route_type = models.CharField(_('route type'), max_length=20)
+
+    class Meta:
+        verbose_name = _('flight search index')
+        verbose_name_plural = _('flight search index')
+        indexes = [
+            models.Index(fields=['origin_key', 'destination_key', 'departure_date', 'adult_fare'], name='flight_search_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.origin_key} to {self.destination_key} on {self.departure_date}"
+
+    @staticmethod
+    def normalize_location(location):
+        """Normalize a location name into a search key"""
+        return ' '.join((location or '').split()).lower()
+
+    @classmethod
+    def row_values(cls, schedule):
+        """Field values for the search row of a schedule"""
+        route = schedule.route
+        return {
+            'route_id': route.pk,
+            'origin_key': cls.normalize_location(route.from_location),
+            'destination_key': cls.normalize_location(route.to_location),
+            'departure_date': schedule.departure_date,
+            'departure_time': route.departure_time,
+            'adult_fare': schedule.adult_fare,
+            'child_fare': schedule.child_fare,
+            'infant_fare': schedule.infant_fare,
+            'available_seats': schedule.bookable_seats,
+            'flight_type': route.flight_type,
+            'route_type': route.route_type,
+        }
+
+    def cell(self):
+        """Fare calendar cell this row contributes to"""
+        return (self.origin_key, self.destination_key, self.departure_date)
+
+    @classmethod
+    def sync_schedule(cls, schedule):
+        """Create, update or drop the search row for a schedule"""
+        previous = cls.objects.filter(schedule_id=schedule.pk).values_list(
+            'origin_key', 'destination_key', 'departure_date'
+        ).first()
+        if not schedule.is_active or schedule.departure_date < date.today():
+            if previous:
+                cls.objects.filter(schedule_id=schedule.pk).delete()
+                FareCalendarDay.refresh_cell(*previous)
+            return None
+        row, created = cls.objects.update_or_create(schedule_id=schedule.pk, defaults=cls.row_values(schedule))
+        FareCalendarDay.refresh_cell(*row.cell())
+        if previous and previous != row.cell():
+            FareCalendarDay.refresh_cell(*previous)
+        return row
+
+    @classmethod
+    def sync_route(cls, route):
+        """Push route-level fields down to the search rows of its schedules"""
+        origin_key = cls.normalize_location(route.from_location)
+        destination_key = cls.normalize_location(route.to_location)
+        previous_pairs = set(
+            cls.objects.filter(route_id=route.pk).values_list('origin_key', 'destination_key').distinct()
+        )
+        updated = cls.objects.filter(route_id=route.pk).update(
+            origin_key=origin_key,
+            destination_key=destination_key,
+            departure_time=route.departure_time,
+            flight_type=route.flight_type,
+            route_type=route.route_type,
+            updated_at=timezone.now(),
+        )
+        # Only a change of origin/destination moves fares between calendars
+        if previous_pairs - {(origin_key, destination_key)}:
+            for pair in previous_pairs | {(origin_key, destination_key)}:
+                FareCalendarDay.rebuild_pair(*pair)
+        else:
+            search_cache.bump_generation(origin_key, destination_key)
+        return updated
+
+    @classmethod
+    def refresh_seats(cls, schedule_id):
+        """Copy the current bookable seat count (available minus held) of a schedule into its search row"""
+        updated = cls.objects.filter(schedule_id=schedule_id).update(
+            available_seats=models.Subquery(
+                Schedule.objects.filter(pk=schedule_id).annotate(
+                    bookable=models.F('available_seats') - models.F('held_seats')
+                ).values('bookable')[:1]
+            ),
+            updated_at=timezone.now(),
+        )
+        cell = cls.objects.filter(schedule_id=schedule_id).values_list(
+            'origin_key', 'destination_key', 'departure_date'
+        ).first()
+        if cell:
+            FareCalendarDay.refresh_cell(*cell)
+        return updated
+
+    @classmethod
+    def rebuild(cls, batch_size=1000):
+        """Rebuild the whole index (and fare calendar) from active future schedules"""
+        schedules = Schedule.objects.select_related('route').filter(
+            is_active=True,
+            departure_date__gte=date.today()
+        ).order_by('pk')
+
+        created = 0
+        with transaction.atomic():
+            cls.objects.all().delete()
+            batch = []
+            for schedule in schedules.iterator(chunk_size=batch_size):
+                batch.append(cls(schedule_id=schedule.pk, **cls.row_values(schedule)))
+                if len(batch) >= batch_size:
+                    cls.objects.bulk_create(batch)
+                    created += len(batch)
+                    batch = []
+            if batch:
+                cls.objects.bulk_create(batch)
+                created += len(batch)
+            FareCalendarDay.rebuild(batch_size=batch_size)
+            search_cache.bump_all()
+        return created
+
+class FareCalendarDay(TimestampedModel):
+    """Per-day availability and cheapest adult fare for an origin/destination pair.
+
+    Cells are recomputed from FlightSearchIndex whenever a schedule, seat count
+    or route on that pair/day changes, so calendars never aggregate Schedule.
+    """
+    origin_key = models.CharField(_('origin key'), max_length=100)
+    destination_key = models.CharField(_('destination key'), max_length=100)
+    day = models.DateField(_('day'))
+    min_adult_fare = models.DecimalField(_('minimum adult fare'), max_digits=10, decimal_places=2)
+    seats_left = models.PositiveIntegerField(_('seats left'), default=0)
+    flight_count = models.PositiveIntegerField(_('flights'), default=0)
+
+    class Meta:
+        verbose_name = _('fare calendar day')
+        verbose_name_plural = _('fare calendar days')
+        ordering = ['origin_key', 'destination_key', 'day']
+        unique_together = ['origin_key', 'destination_key', 'day']
+        indexes = [
+            models.Index(fields=['day'], name='fare_calendar_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.origin_key} to {self.destination_key} on {self.day}: {self.min_adult_fare}"
+
+    @staticmethod
+    def available_rows():
+        """Search rows that still have seats to sell"""
+        return FlightSearchIndex.objects.filter(available_seats__gt=0)
+
+    @classmethod
+    def refresh_cell(cls, origin_key, destination_key, day):
+        """Recompute a single pair/day cell from the search index"""
+        search_cache.bump_generation(origin_key, destination_key)
+        totals = cls.available_rows().filter(
+            origin_key=origin_key,
+            destination_key=destination_key,
+            departure_date=day
+        ).aggregate(
+            min_fare=models.Min('adult_fare'),
+            seats=models.Sum('available_seats'),
+            flights=models.Count('id'),
+        )
+        if not totals['flights']:
+            cls.objects.filter(origin_key=origin_key, destination_key=destination_key, day=day).delete()
+            return None
+        cell, created = cls.objects.update_or_create(
+            origin_key=origin_key,
+            destination_key=destination_key,
+            day=day,
+            defaults={
+                'min_adult_fare': totals['min_fare'],
+                'seats_left': totals['seats'],
+                'flight_count': totals['flights'],
+            }
+        )
+        return cell
+
+    @classmethod
+    def grouped_cells(cls, rows):
+        """Aggregate search rows into calendar cells"""
+        return rows.values('origin_key', 'destination_key', 'departure_date').annotate(
+            min_fare=models.Min('adult_fare'),
+            seats=models.Sum('available_seats'),
+            flights=models.Count('id'),
+        ).order_by()
+
+    @classmethod
+    def rebuild_pair(cls, origin_key, destination_key):
+        """Recompute every cell of one origin/destination pair"""
+        search_cache.bump_generation(origin_key, destination_key)
+        rows = cls.available_rows().filter(origin_key=origin_key, destination_key=destination_key)
+        with transaction.atomic():
+            cls.objects.filter(origin_key=origin_key, destination_key=destination_key).delete()
+            cls.objects.bulk_create([
+                cls(
+                    origin_key=cell['origin_key'],
+                    destination_key=cell['destination_key'],
+                    day=cell['departure_date'],
+                    min_adult_fare=cell['min_fare'],
+                    seats_left=cell['seats'],
+                    flight_count=cell['flights'],
+                )
+                for cell in cls.grouped_cells(rows)
+            ])
+
+    @classmethod
+    def rebuild(cls, batch_size=1000):
+        """Recompute the whole calendar from the search index"""
+        created = 0
+        with transaction.atomic():
+            cls.objects.all().delete()
+            batch = []
+            for cell in cls.grouped_cells(cls.available_rows()).iterator(chunk_size=batch_size):
+                batch.append(cls(
+                    origin_key=cell['origin_key'],
+                    destination_key=cell['destination_key'],
+                    day=cell['departure_date'],
+                    min_adult_fare=cell['min_fare'],
+                    seats_left=cell['seats'],
+                    flight_count=cell['flights'],
+                ))
+                if len(batch) >= batch_size:
+                    cls.objects.bulk_create(batch)
+                    created += len(batch)
+                    batch = []
+            if batch:
+                cls.objects.bulk_create(batch)
+                created += len(batch)
+        return created
+
+    @classmethod
+    def for_month(cls, origin_key, destination_key, year, month):
+        """Cells of one pair for a calendar month, from today onwards"""
+        first_day = date(year, month, 1)
+        next_month = date(year + (month // 12), (month % 12) + 1, 1)
+        return cls.objects.filter(
+            origin_key=origin_key,
+            destination_key=destination_key,
+            day__gte=max(first_day, date.today()),
+            day__lt=next_month,
+        ).order_by('day')
+
+    @classmethod
+    def for_days(cls, origin_key, destination_key, days):
+        """Map of day -> cell for a strip of dates"""
+        return {
+            cell.day: cell
+            for cell in cls.objects.filter(origin_key=origin_key, destination_key=destination_key, day__in=days)
+        }
+
+@receiver(post_save, sender=Schedule)
+def sync_schedule_search_index(sender, instance, update_fields=None, **kwargs):
+    """Keep the flight search index in step with schedule saves"""
+    if update_fields and set(update_fields) <= {'available_seats', 'updated_at'}:
+        # Seat-only saves (payment confirmation) just refresh the seat count
+        FlightSearchIndex.refresh_seats(instance.pk)
+    else:
+        FlightSearchIndex.sync_schedule(instance)
+
+@receiver(post_delete, sender=Schedule)
+def refresh_calendar_for_deleted_schedule(sender, instance, **kwargs):
+    """Drop a deleted schedule's fares from the calendar (its search row cascades)"""
+    route = Route.objects.filter(pk=instance.route_id).values_list('from_location', 'to_location').first()
+    if route:
+        FareCalendarDay.refresh_cell(
+            FlightSearchIndex.normalize_location(route[0]),
+            FlightSearchIndex.normalize_location(route[1]),
+            instance.departure_date
+        )
+
+@receiver(post_save, sender=Route)
+def sync_route_search_index(sender, instance, created, **kwargs):
+    """Propagate route edits to the flight search index"""
+    if not created:
+        FlightSearchIndex.sync_route(instance)
+
+@receiver(post_save, sender=Airline)
+@receiver(post_delete, sender=Airline)
+def refresh_airline_routes(sender, **kwargs):
+    """Re-resolve route airlines and logos after an airline edit"""
+    transaction.on_commit(Airline.refresh_routes)
+
+@receiver(post_save, sender=Airport)
+@receiver(post_delete, sender=Airport)
+@receiver(post_save, sender=Route)
+@receiver(post_delete, sender=Route)
+def invalidate_airport_registry(sender, **kwargs):
+    """Airports and route locations feed the airport registry"""
+    airports.invalidate()
 
 class Booking(TimestampedModel):
     """User travel bookings"""
@@ -849,6 +1250,16 @@ class Booking(TimestampedModel):
     ip_address = models.GenericIPAddressField(_('IP address'), null=True, blank=True)
     user_agent = models.TextField(_('user agent'), blank=True)
     
+    # Passenger summary, kept in step with BookingPassenger writes
+    adult_count = models.PositiveSmallIntegerField(_('adults'), default=0, editable=False, help_text=_('Adults and senior citizens'))
+    child_count = models.PositiveSmallIntegerField(_('children'), default=0, editable=False)
+    infant_count = models.PositiveSmallIntegerField(_('infants'), default=0, editable=False)
+    seat_count = models.PositiveSmallIntegerField(_('seats'), default=0, editable=False, help_text=_('Seats taken (infants travel on a lap)'))
+    passenger_count = models.PositiveSmallIntegerField(_('passengers'), default=0, editable=False)
+    lead_passenger_name = models.CharField(_('lead passenger'), max_length=201, blank=True, editable=False)
+    
+    PASSENGER_FIELDS = ('adult_count', 'child_count', 'infant_count', 'seat_count', 'passenger_count', 'lead_passenger_name')
+    
     class Meta:
         verbose_name = _('booking')
         verbose_name_plural = _('bookings')
@@ -857,6 +1268,7 @@ class Booking(TimestampedModel):
             models.Index(fields=['booking_reference'], name='booking_ref_idx'),
             models.Index(fields=['status'], name='booking_status_idx'),
             models.Index(fields=['payment_status'], name='booking_payment_status_idx'),
+            models.Index(fields=['user', 'created_at'], name='booking_user_created_idx'),
         ]
     
     def __str__(self):
@@ -867,8 +1279,59 @@ class Booking(TimestampedModel):
             self.booking_reference = self.generate_booking_reference()
         if not self.total_amount:
             self.calculate_total()
+        # The passenger summary is only written by refresh_passenger_counts()
+        if not self._state.adding and self.pk is not None and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.PASSENGER_FIELDS
+            ]
         super().save(*args, **kwargs)
     
+    @staticmethod
+    def passenger_summary():
+        """Subquery expressions computing PASSENGER_FIELDS from the passenger rows"""
+        passengers = BookingPassenger.objects.filter(booking=models.OuterRef('pk')).order_by()
+        
+        def count(*types):
+            rows = passengers.filter(passenger_type__in=types) if types else passengers
+            return Coalesce(models.Subquery(rows.values('booking').annotate(n=models.Count('pk')).values('n')), 0)
+        
+        adult, child, infant, senior = (
+            BookingPassenger.PassengerType.ADULT, BookingPassenger.PassengerType.CHILD,
+            BookingPassenger.PassengerType.INFANT, BookingPassenger.PassengerType.SENIOR,
+        )
+        return {
+            'adult_count': count(adult, senior),
+            'child_count': count(child),
+            'infant_count': count(infant),
+            'seat_count': count(adult, senior, child),
+            'passenger_count': count(),
+            'lead_passenger_name': Coalesce(
+                models.Subquery(passengers.order_by('pk').annotate(
+                    name=Concat('first_name', models.Value(' '), 'last_name')
+                ).values('name')[:1]),
+                models.Value(''),
+            ),
+        }
+    
+    @classmethod
+    def refresh_passenger_counts(cls, booking_ids):
+        """Recompute the passenger summary of some bookings (one UPDATE)"""
+        return cls.objects.filter(pk__in=booking_ids).update(**cls.passenger_summary())
+    
+    @classmethod
+    def rebuild_passenger_counts(cls, batch_size=1000):
+        """Recompute the passenger summary of every booking in batches; returns bookings updated"""
+        updated = 0
+        last_pk = 0
+        while True:
+            booking_ids = list(cls.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not booking_ids:
+                return updated
+            with transaction.atomic():
+                updated += cls.refresh_passenger_counts(booking_ids)
+            last_pk = booking_ids[-1]
+    
     def generate_booking_reference(self):
         """Generate a unique booking reference"""
         import random
@@ -912,16 +1375,20 @@ class Booking(TimestampedModel):
         if self.status == self.Status.CANCELLED:
             return False
             
-        self.status = self.Status.CANCELLED
         if refund_amount is not None:
             if refund_amount < self.total_amount:
                 self.payment_status = self.PaymentStatus.PARTIALLY_REFUNDED
             else:
                 self.payment_status = self.PaymentStatus.REFUNDED
         
-        # Release the seats back to inventory (number of passengers)
-        num_passengers = self.passengers.count() or 1
-        self.schedule.cancel_booking(seats=num_passengers)
+        # Release the seats back to inventory (number of passengers), or the
+        # seat holds of a booking that was never paid
+        from . import inventory
+        if self.status == self.Status.CONFIRMED:
+            inventory.release_booking_seats(self, self.seat_count or 1)
+        else:
+            inventory.release_booking_holds(self)
+        self.status = self.Status.CANCELLED
         self.save()
         return True
     
@@ -930,22 +1397,26 @@ class Booking(TimestampedModel):
         if self.status != self.Status.PENDING:
             return False
         
-        # Get number of passengers
-        num_passengers = self.passengers.count() or 1
-            
-        # Attempt to book the seats
-        if not self.schedule.book_seats(seats=num_passengers):
+        # Convert the seat holds (or book the seats outright)
+        from . import inventory
+        if not self.schedule.is_active:
+            return False
+        try:
+            with transaction.atomic():
+                # A leg that cannot be sold rolls back the legs already sold
+                if not inventory.confirm_booking_seats(self, self.seat_count or 1):
+                    raise inventory.SeatsUnavailable(self.pk)
+                self.status = self.Status.CONFIRMED
+                self.payment_status = self.PaymentStatus.PAID
+                self.save()
+        except inventory.SeatsUnavailable:
             return False
-            
-        self.status = self.Status.CONFIRMED
-        self.payment_status = self.PaymentStatus.PAID
-        self.save()
         return True
     
     @property
     def num_passengers(self):
         """Get number of passengers in this booking"""
-        return self.passengers.count()
+        return self.passenger_count
     
     @property
     def flight_info(self):
@@ -972,6 +1443,47 @@ class Booking(TimestampedModel):
             return False
         return self.travel_date >= date.today() and self.status == self.Status.CONFIRMED
 
+class SeatHold(TimestampedModel):
+    """Seats held on a schedule for a booking between review and payment.
+
+    While ACTIVE the seats are counted in Schedule.held_seats. Payment
+    converts the hold into sold seats; the release_expired_seat_holds
+    command releases holds that pass expires_at unpaid.
+    """
+    class Status(models.TextChoices):
+        ACTIVE = 'active', _('Active')
+        CONVERTED = 'converted', _('Converted')
+        RELEASED = 'released', _('Released')
+    
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='seat_holds')
+    schedule = models.ForeignKey(Schedule, on_delete=models.CASCADE, related_name='seat_holds')
+    seats = models.PositiveIntegerField(_('seats'))
+    status = models.CharField(_('status'), max_length=20, choices=Status.choices, default=Status.ACTIVE)
+    expires_at = models.DateTimeField(_('expires at'))
+    
+    class Meta:
+        verbose_name = _('seat hold')
+        verbose_name_plural = _('seat holds')
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'expires_at'], name='seat_hold_expiry_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.seats} seat(s) on {self.schedule} for {self.booking.booking_reference} ({self.status})"
+    
+    @property
+    def is_expired(self):
+        """Check if the hold has run out"""
+        return self.expires_at <= timezone.now()
+
+@receiver(post_delete, sender=SeatHold)
+def release_deleted_seat_hold(sender, instance, **kwargs):
+    """Give back the held seats of an active hold deleted with its booking/schedule"""
+    if instance.status == SeatHold.Status.ACTIVE:
+        from .inventory import release_held_seats
+        release_held_seats(instance.schedule_id, instance.seats)
+
 class Coupon(TimestampedModel):
     """Coupon codes for discounts on bookings"""
     class DiscountType(models.TextChoices):
@@ -1284,6 +1796,33 @@ class BookingPassenger(models.Model):
         if errors:
             raise ValidationError(errors)
 
+@receiver(post_save, sender=BookingPassenger)
+@receiver(post_delete, sender=BookingPassenger)
+def refresh_booking_passenger_counts(sender, instance, **kwargs):
+    """Keep the booking's stored passenger summary in step"""
+    Booking.refresh_passenger_counts([instance.booking_id])
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def drop_cached_ticket_pdfs(sender, instance, **kwargs):
+    """Fare edits and status changes make the booking's cached tickets obsolete"""
+    ticket_pdfs.invalidate(instance.pk)
+
+@receiver(post_save, sender=BookingPassenger)
+@receiver(post_delete, sender=BookingPassenger)
+def drop_cached_passenger_ticket_pdfs(sender, instance, **kwargs):
+    """Passenger edits change the printed ticket"""
+    ticket_pdfs.invalidate(instance.booking_id)
+
+@receiver(post_save, sender=Booking)
+def queue_ticket_render(sender, instance, **kwargs):
+    """Have the render worker prepare the tickets of a confirmed, paid booking"""
+    if (ticket_renderer.enabled()
+            and instance.status == Booking.Status.CONFIRMED
+            and instance.payment_status == Booking.PaymentStatus.PAID):
+        booking_id = instance.pk
+        transaction.on_commit(lambda: TicketRenderJob.enqueue(booking_id))
+
 class Contact(TimestampedModel):
     """Contact form submissions"""
     class Status(models.TextChoices):
@@ -1329,7 +1868,37 @@ class Contact(TimestampedModel):
         """Check if inquiry has been read"""
         return self.status in [self.Status.READ, self.Status.REPLIED, self.Status.CLOSED]
 
-class ODWallet(TimestampedModel):
+class WalletTotalsModel(TimestampedModel):
+    """Abstract base for wallets: running totals of the transaction history,
+    maintained by the wallet ledger in the same transaction as each posting"""
+    credit_total = models.DecimalField(_('total credits'), max_digits=12, decimal_places=2, default=0, editable=False)
+    debit_total = models.DecimalField(_('total debits'), max_digits=12, decimal_places=2, default=0, editable=False)
+    txn_count = models.PositiveIntegerField(_('transaction count'), default=0, editable=False)
+    last_txn_at = models.DateTimeField(_('last transaction at'), null=True, blank=True, editable=False)
+    last_txn_id = models.PositiveBigIntegerField(_('last transaction ID'), null=True, blank=True, editable=False)
+    
+    TOTALS_FIELDS = ('credit_total', 'debit_total', 'txn_count', 'last_txn_at', 'last_txn_id')
+    
+    class Meta:
+        abstract = True
+    
+    def save(self, *args, **kwargs):
+        """Never write the totals back from a (possibly stale) instance; only the ledger updates them"""
+        if not self._state.adding and self.pk is not None and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.TOTALS_FIELDS
+            ]
+        super().save(*args, **kwargs)
+    
+    @property
+    def last_txn(self):
+        """Most recent history row (one primary-key lookup)"""
+        if not self.last_txn_id:
+            return None
+        return self.transactions.filter(pk=self.last_txn_id).first()
+
+class ODWallet(WalletTotalsModel):
     """OD (Organizational Discount) Wallet - Admin controlled access and recharge only"""
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='od_wallet')
     balance = models.DecimalField(_('balance'), max_digits=10, decimal_places=2, default=0, help_text=_('Current balance (can be negative after expiry)'))
@@ -1374,41 +1943,8 @@ class ODWallet(TimestampedModel):
     
     def process_expiry(self):
         """Process expired wallet: deduct remaining balance and deactivate"""
-        if not self.is_expired() or not self.is_active:
-            return False
-        
-        # Calculate used amount (initial - current balance before expiry)
-        # If balance is already negative, it means it was processed before
-        if self.balance < 0:
-            return False  # Already processed
-        
-        # Calculate how much was used
-        used_amount = self.initial_balance - self.balance
-        
-        # Deduct remaining balance (make it negative to show used amount)
-        remaining_balance = self.balance
-        if remaining_balance > 0:
-            # Set balance to negative of used amount
-            self.balance = -used_amount
-            self.is_active = False
-            self.save()
-            
-            # Create transaction record for expiry deduction
-            ODWalletTransaction.objects.create(
-                od_wallet=self,
-                transaction_type='adjustment',
-                amount=-remaining_balance,
-                balance_after=self.balance,
-                description=f'Wallet expired. Remaining balance ₹{remaining_balance} deducted. Used: ₹{used_amount}',
-                reference_id='EXPIRY_AUTO'
-            )
-            return True
-        elif remaining_balance == 0:
-            # Balance is zero, just deactivate
-            self.is_active = False
-            self.save()
-            return True
-        return False
+        from . import wallet_ledger
+        return wallet_ledger.expire_od_wallet(self)
     
     def can_use(self):
         """Check if OD wallet can be used (active and has balance and not expired)"""
@@ -1418,56 +1954,13 @@ class ODWallet(TimestampedModel):
     
     def add_balance(self, amount, transaction_type='recharge', description='', reference_id=None):
         """Add balance to OD wallet and create transaction record (Admin only)"""
-        if amount <= 0:
-            raise ValidationError(_('Amount must be greater than zero'))
-        
-        if (self.balance + amount) > self.max_balance:
-            raise ValidationError(_(f'Balance cannot exceed maximum limit of ₹{self.max_balance}'))
-        
-        # Track initial balance if this is first recharge or wallet is being activated
-        if self.initial_balance == 0 or (not self.is_active and transaction_type == 'recharge'):
-            self.initial_balance = self.balance + amount
-        
-        self.balance += amount
-        self.save()
-        
-        # Create transaction record
-        ODWalletTransaction.objects.create(
-            od_wallet=self,
-            transaction_type=transaction_type,
-            amount=amount,
-            balance_after=self.balance,
-            description=description,
-            reference_id=reference_id
-        )
-        
-        return self.balance
+        from . import wallet_ledger
+        return wallet_ledger.credit(self, amount, transaction_type, description, reference_id)
     
     def deduct_balance(self, amount, transaction_type='payment', description='', reference_id=None):
         """Deduct balance from OD wallet and create transaction record"""
-        if amount <= 0:
-            raise ValidationError(_('Amount must be greater than zero'))
-        
-        if amount > self.balance:
-            raise ValidationError(_('Insufficient OD wallet balance'))
-        
-        if not self.is_active:
-            raise ValidationError(_('OD Wallet is not active'))
-        
-        self.balance -= amount
-        self.save()
-        
-        # Create transaction record (negative amount for deduction)
-        ODWalletTransaction.objects.create(
-            od_wallet=self,
-            transaction_type=transaction_type,
-            amount=-amount,
-            balance_after=self.balance,
-            description=description,
-            reference_id=reference_id
-        )
-        
-        return self.balance
+        from . import wallet_ledger
+        return wallet_ledger.debit(self, amount, transaction_type, description, reference_id)
 
 class ODWalletTransaction(TimestampedModel):
     """Transaction history for OD Wallet"""
@@ -1511,7 +2004,7 @@ class ODWalletTransaction(TimestampedModel):
             return False
         return self.amount < 0
 
-class CashBalanceWallet(TimestampedModel):
+class CashBalanceWallet(WalletTotalsModel):
     """Cash Balance Wallet - User can recharge themselves, direct access for everyone"""
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='cash_balance_wallet')
     balance = models.DecimalField(_('balance'), max_digits=10, decimal_places=2, default=0, validators=[MinValueValidator(0)])
@@ -1531,47 +2024,14 @@ class CashBalanceWallet(TimestampedModel):
     
     def add_balance(self, amount, transaction_type='recharge', description='', reference_id=None):
         """Add balance to cash balance wallet and create transaction record (User self-recharge)"""
-        if amount <= 0:
-            raise ValidationError(_('Amount must be greater than zero'))
-        
         # No max balance limit - users can add unlimited balance
-        self.balance += amount
-        self.save()
-        
-        # Create transaction record
-        CashBalanceTransaction.objects.create(
-            cash_balance_wallet=self,
-            transaction_type=transaction_type,
-            amount=amount,
-            balance_after=self.balance,
-            description=description,
-            reference_id=reference_id
-        )
-        
-        return self.balance
+        from . import wallet_ledger
+        return wallet_ledger.credit(self, amount, transaction_type, description, reference_id)
     
     def deduct_balance(self, amount, transaction_type='payment', description='', reference_id=None):
         """Deduct balance from cash balance wallet and create transaction record"""
-        if amount <= 0:
-            raise ValidationError(_('Amount must be greater than zero'))
-        
-        if amount > self.balance:
-            raise ValidationError(_('Insufficient cash balance'))
-        
-        self.balance -= amount
-        self.save()
-        
-        # Create transaction record (negative amount for deduction)
-        CashBalanceTransaction.objects.create(
-            cash_balance_wallet=self,
-            transaction_type=transaction_type,
-            amount=-amount,
-            balance_after=self.balance,
-            description=description,
-            reference_id=reference_id
-        )
-        
-        return self.balance
+        from . import wallet_ledger
+        return wallet_ledger.debit(self, amount, transaction_type, description, reference_id)
 
 class CashBalanceTransaction(TimestampedModel):
     """Balance History Details - Complete transaction history for Cash Balance"""
@@ -1635,6 +2095,18 @@ class SalesRepresentative(TimestampedModel):
     def __str__(self):
         return f"{self.name} ({self.phone})"
 
+@receiver(post_save, sender=SalesRepresentative)
+@receiver(post_delete, sender=SalesRepresentative)
+def invalidate_sales_rep_directory(sender, **kwargs):
+    """Representatives feed the cached header directory"""
+    sales_reps.invalidate()
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def forget_sales_rep_assignment(sender, instance, **kwargs):
+    """The profile holds the agency's assigned representative"""
+    sales_reps.forget_assignment(instance.user_id)
+
 class PackageApplication(TimestampedModel):
     """Model to store package application details"""
     class Status(models.TextChoices):
@@ -2210,3 +2682,173 @@ class PaymentUploadRequest(TimestampedModel):
         """Check if request is rejected"""
         return self.status == self.Status.REJECTED
 
+
+
+class PaymentTransaction(TimestampedModel):
+    """Payment gateway transaction ledger - one row per gateway txnid.
+
+    Linked generically to what is being paid for (Booking, VisaBooking or
+    CashBalanceWallet) so gateway callbacks resolve their target through the
+    unique txnid index instead of scanning booking notes.
+    """
+    class Purpose(models.TextChoices):
+        FLIGHT_BOOKING = 'flight_booking', _('Flight Booking')
+        VISA = 'visa', _('Visa Application')
+        WALLET_RECHARGE = 'wallet_recharge', _('Wallet Recharge')
+    
+    class Status(models.TextChoices):
+        INITIATED = 'initiated', _('Initiated')
+        SUCCESS = 'success', _('Success')
+        FAILED = 'failed', _('Failed')
+    
+    txnid = models.CharField(_('transaction ID'), max_length=64, unique=True)
+    gateway = models.CharField(_('gateway'), max_length=20, default='easebuzz')
+    purpose = models.CharField(_('purpose'), max_length=20, choices=Purpose.choices)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='payment_transactions')
+    content_type = models.ForeignKey(ContentType, on_delete=models.PROTECT)
+    object_id = models.PositiveBigIntegerField()
+    target = GenericForeignKey('content_type', 'object_id')
+    amount = models.DecimalField(_('amount'), max_digits=10, decimal_places=2)
+    status = models.CharField(_('status'), max_length=20, choices=Status.choices, default=Status.INITIATED)
+    gateway_status = models.CharField(_('gateway status'), max_length=50, blank=True,
+                                      help_text=_('Status string reported by the gateway'))
+    gateway_payload = models.JSONField(_('gateway payload'), default=dict, blank=True,
+                                       help_text=_('Raw gateway callback / status response'))
+    completed_at = models.DateTimeField(_('completed at'), null=True, blank=True)
+    
+    class Meta:
+        verbose_name = _('Payment Transaction')
+        verbose_name_plural = _('Payment Transactions')
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['content_type', 'object_id'], name='payment_txn_target_idx'),
+            models.Index(fields=['status', 'created_at'], name='payment_txn_status_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.txnid} - ₹{self.amount} ({self.get_status_display()})"
+    
+    @classmethod
+    def start(cls, txnid, target, amount, purpose, user=None):
+        """Record a transaction as it is handed to the gateway"""
+        return cls.objects.create(
+            txnid=txnid,
+            purpose=purpose,
+            user=user,
+            content_type=ContentType.objects.get_for_model(target),
+            object_id=target.pk,
+            amount=amount,
+        )
+    
+    @classmethod
+    def for_txnid(cls, txnid):
+        """Ledger row for a gateway txnid, or None"""
+        if not txnid:
+            return None
+        return cls.objects.select_related('content_type').filter(txnid=txnid).first()
+    
+    @staticmethod
+    def clean_payload(data):
+        """Plain dict copy of a gateway response without the hash"""
+        return {key: value for key, value in dict(data.items()).items() if key != 'hash'}
+    
+    def mark_success(self, payload=None, gateway_status='success'):
+        """Move to SUCCESS exactly once; False if another callback already did"""
+        updated = PaymentTransaction.objects.filter(pk=self.pk).exclude(status=self.Status.SUCCESS).update(
+            status=self.Status.SUCCESS,
+            gateway_status=gateway_status,
+            gateway_payload=self.clean_payload(payload) if payload is not None else self.gateway_payload,
+            completed_at=timezone.now(),
+            updated_at=timezone.now(),
+        )
+        if updated:
+            self.refresh_from_db()
+        return bool(updated)
+    
+    def mark_failed(self, payload=None, gateway_status='failure'):
+        """Record a failed payment (never overrides a success)"""
+        updated = PaymentTransaction.objects.filter(pk=self.pk).exclude(status=self.Status.SUCCESS).update(
+            status=self.Status.FAILED,
+            gateway_status=gateway_status or '',
+            gateway_payload=self.clean_payload(payload) if payload is not None else self.gateway_payload,
+            completed_at=timezone.now(),
+            updated_at=timezone.now(),
+        )
+        if updated:
+            self.refresh_from_db()
+        return bool(updated)
+
+
+class PaymentWebhookEvent(TimestampedModel):
+    """Verified gateway webhook, stored as received and applied later by the
+    process_payment_webhooks worker (in arrival order)"""
+    class Status(models.TextChoices):
+        PENDING = 'pending', _('Pending')
+        PROCESSED = 'processed', _('Processed')
+        IGNORED = 'ignored', _('Ignored')
+        FAILED = 'failed', _('Failed')
+    
+    gateway = models.CharField(_('gateway'), max_length=20, default='easebuzz')
+    txnid = models.CharField(_('transaction ID'), max_length=64, db_index=True)
+    gateway_status = models.CharField(_('gateway status'), max_length=50, blank=True)
+    payload = models.JSONField(_('payload'), default=dict, blank=True)
+    status = models.CharField(_('status'), max_length=20, choices=Status.choices, default=Status.PENDING)
+    outcome = models.CharField(_('outcome'), max_length=30, blank=True,
+                               help_text=_('Result of applying the event to its payment transaction'))
+    error = models.TextField(_('error'), blank=True)
+    processed_at = models.DateTimeField(_('processed at'), null=True, blank=True)
+    
+    class Meta:
+        verbose_name = _('Payment Webhook Event')
+        verbose_name_plural = _('Payment Webhook Events')
+        ordering = ['-id']
+        indexes = [
+            models.Index(fields=['status', 'id'], name='payment_webhook_queue_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.txnid} - {self.gateway_status} ({self.get_status_display()})"
+    
+    @classmethod
+    def receive(cls, data):
+        """Store a verified gateway payload (hash included) for the worker"""
+        payload = dict(data.items())
+        return cls.objects.create(
+            txnid=payload.get('txnid', ''),
+            gateway_status=str(payload.get('status', '')).lower(),
+            payload=payload,
+        )
+
+
+class TicketRenderJob(TimestampedModel):
+    """Queued pre-render of a booking's ticket PDFs, processed by the
+    render_tickets worker"""
+    class Status(models.TextChoices):
+        PENDING = 'pending', _('Pending')
+        RUNNING = 'running', _('Running')
+        DONE = 'done', _('Done')
+        FAILED = 'failed', _('Failed')
+    
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='render_jobs')
+    status = models.CharField(_('status'), max_length=20, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField(_('attempts'), default=0)
+    render_ms = models.PositiveIntegerField(_('render time (ms)'), null=True, blank=True)
+    error = models.TextField(_('error'), blank=True)
+    processed_at = models.DateTimeField(_('processed at'), null=True, blank=True)
+    
+    class Meta:
+        verbose_name = _('Ticket Render Job')
+        verbose_name_plural = _('Ticket Render Jobs')
+        ordering = ['-id']
+        indexes = [
+            models.Index(fields=['status', 'id'], name='ticket_render_queue_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.booking_id} ({self.get_status_display()})"
+    
+    @classmethod
+    def enqueue(cls, booking_id):
+        """Queue a booking for rendering unless it is already waiting"""
+        if not cls.objects.filter(booking_id=booking_id, status=cls.Status.PENDING).exists():
+            cls.objects.create(booking_id=booking_id)
@@ -0,0 +1,57 @@
+"""Keyset (cursor) pagination.
+
+Pages are cut with a cursor on (created_at, id), which walks a
+created_at index instead of counting and skipping rows with OFFSET. The
+cursor is opaque to the client: the last row's position, base64 encoded.
+"""
+import base64
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from django.db.models import Q
+
+PAGE_SIZE = 50
+
+
+@dataclass(frozen=True)
+class KeysetPage:
+    """One keyset page of rows, newest first"""
+    rows: tuple
+    next_cursor: Optional[str] = None
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __bool__(self):
+        return bool(self.rows)
+
+
+def encode_cursor(row):
+    """Opaque cursor pointing just past a row"""
+    raw = f'{row.created_at.isoformat()}|{row.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(created_at, id) of a cursor, or None if it is missing or malformed"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def keyset_page(queryset, cursor=None, page_size=PAGE_SIZE):
+    """Rows of a queryset older than the cursor, newest first (one range query)"""
+    queryset = queryset.order_by('-created_at', '-pk')
+    position = decode_cursor(cursor)
+    if position:
+        created_at, pk = position
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+    rows = list(queryset[:page_size + 1])
+    next_cursor = encode_cursor(rows[page_size - 1]) if len(rows) > page_size else None
+    return KeysetPage(rows=tuple(rows[:page_size]), next_cursor=next_cursor)
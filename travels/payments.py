@@ -0,0 +1,252 @@
+"""Payment settlement.
+
+Applies a gateway result to a PaymentTransaction and whatever it pays for
+(flight booking, visa application or cash balance wallet). Shared by the
+browser callbacks, the webhook worker and the reconcile_payments job, so a
+payment is fulfilled exactly once no matter which of them sees the result
+first.
+
+A booking whose seats sold out while the customer was at the gateway is
+not confirmed: the seat changes are rolled back, the booking is cancelled
+and the payment is refunded through the gateway once the settlement has
+committed.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import inventory
+from .easebuzz_client import EasebuzzError, get_client
+from .models import Booking, VisaBooking, CashBalanceWallet, PaymentTransaction, PaymentWebhookEvent
+
+logger = logging.getLogger(__name__)
+
+SETTLED = 'settled'
+ALREADY_SETTLED = 'already_settled'
+FAILED = 'failed'
+AMOUNT_MISMATCH = 'amount_mismatch'
+SEATS_UNAVAILABLE = 'seats_unavailable'
+
+DEFAULT_RECHARGE_DESCRIPTION = 'Wallet Recharge via Easebuzz'
+
+# Gateway statuses that are not final yet; the transaction stays INITIATED
+PENDING_GATEWAY_STATUSES = {'', 'initiated', 'pending', 'in_process'}
+
+
+def amount_matches(payment_txn, amount):
+    """Gateway amount equals the ledger amount (500 == 500.00)"""
+    try:
+        return Decimal(str(amount)) == payment_txn.amount
+    except (InvalidOperation, TypeError):
+        return False
+
+
+def refund_booking(payment_txn, booking, client=None):
+    """Refund the gateway payment of a booking that could not be confirmed;
+    True once the gateway accepted the refund"""
+    client = client or get_client()
+    easebuzz_id = (payment_txn.gateway_payload or {}).get('easepayid')
+    try:
+        if not easebuzz_id:
+            raise EasebuzzError('No easepayid recorded for the payment')
+        client.refund(f'RF_{payment_txn.txnid}', easebuzz_id, payment_txn.amount)
+    except EasebuzzError as exc:
+        logger.error('Refund of %s for booking %s failed: %s', payment_txn.txnid, booking.booking_reference, exc)
+        Booking.objects.filter(pk=booking.pk).update(
+            notes=f'{booking.notes or ""}\nRefund of {payment_txn.txnid} failed, refund manually: {exc}'.strip(),
+            updated_at=timezone.now())
+        return False
+    Booking.objects.filter(pk=booking.pk).update(
+        payment_status=Booking.PaymentStatus.REFUNDED, updated_at=timezone.now())
+    return True
+
+
+def fulfil(target, payment_txn, description=None, client=None):
+    """Mark the paid-for object as paid; False if a booking's seats are gone
+    (the booking is cancelled and its payment refunded instead)"""
+    if isinstance(target, Booking):
+        if target.payment_status == Booking.PaymentStatus.PAID:
+            return True
+        try:
+            with transaction.atomic():
+                # A leg that cannot be sold rolls back the legs already sold
+                if not inventory.confirm_booking_seats(target, target.seat_count or 1):
+                    raise inventory.SeatsUnavailable(target.pk)
+                target.payment_status = Booking.PaymentStatus.PAID
+                target.status = Booking.Status.CONFIRMED
+                target.save()
+        except inventory.SeatsUnavailable:
+            # Paid until the refund goes through; cancel() releases the holds
+            target.payment_status = Booking.PaymentStatus.PAID
+            target.cancel()
+            transaction.on_commit(lambda: refund_booking(payment_txn, target, client))
+            return False
+    elif isinstance(target, VisaBooking):
+        target.payment_status = VisaBooking.PaymentStatus.PAID
+        target.payment_id = payment_txn.txnid
+        target.save()
+    elif isinstance(target, CashBalanceWallet):
+        target.add_balance(
+            amount=payment_txn.amount,
+            transaction_type='recharge',
+            description=description or DEFAULT_RECHARGE_DESCRIPTION,
+            reference_id=payment_txn.txnid,
+        )
+    return True
+
+
+def settle(payment_txn, gateway_status, amount, payload=None, description=None, client=None):
+    """Apply one gateway result; returns SETTLED, ALREADY_SETTLED, FAILED,
+    AMOUNT_MISMATCH or SEATS_UNAVAILABLE (paid, but refunded)"""
+    if gateway_status != 'success':
+        payment_txn.mark_failed(payload, gateway_status)
+        return FAILED
+    if not amount_matches(payment_txn, amount):
+        payment_txn.mark_failed(payload, AMOUNT_MISMATCH)
+        return AMOUNT_MISMATCH
+    with transaction.atomic():
+        # Claiming the ledger row first makes a racing callback a no-op
+        if not payment_txn.mark_success(payload, gateway_status):
+            return ALREADY_SETTLED
+        if not fulfil(payment_txn.target, payment_txn, description, client):
+            return SEATS_UNAVAILABLE
+    return SETTLED
+
+
+def process_webhook_event(event_id):
+    """Apply one stored webhook; returns the event's final status (None if
+    another worker already took it)"""
+    try:
+        with transaction.atomic():
+            # Claim the event; a second worker sees it is no longer pending
+            if not PaymentWebhookEvent.objects.filter(pk=event_id, status=PaymentWebhookEvent.Status.PENDING).update(
+                    status=PaymentWebhookEvent.Status.PROCESSED, processed_at=timezone.now(), updated_at=timezone.now()):
+                return None
+            event = PaymentWebhookEvent.objects.get(pk=event_id)
+            payment_txn = PaymentTransaction.for_txnid(event.txnid)
+            if payment_txn is None:
+                event.status = PaymentWebhookEvent.Status.IGNORED
+                event.outcome = 'unknown_txnid'
+            else:
+                event.outcome = settle(payment_txn, event.gateway_status, event.payload.get('amount'), event.payload)
+            event.save(update_fields=['status', 'outcome', 'updated_at'])
+            return event.status
+    except Exception as exc:
+        PaymentWebhookEvent.objects.filter(pk=event_id).update(
+            status=PaymentWebhookEvent.Status.FAILED, error=str(exc), processed_at=timezone.now(), updated_at=timezone.now())
+        return PaymentWebhookEvent.Status.FAILED
+
+
+def process_webhook_events(batch_size=100, limit=None):
+    """Apply pending webhooks oldest first; returns {status: count}.
+
+    Duplicate deliveries of a txnid resolve to ALREADY_SETTLED through the
+    ledger, so retries can never confirm or credit twice.
+    """
+    counts = {}
+    last_pk = 0
+    processed = 0
+    pending = PaymentWebhookEvent.objects.filter(status=PaymentWebhookEvent.Status.PENDING).order_by('pk')
+    while limit is None or processed < limit:
+        size = batch_size if limit is None else min(batch_size, limit - processed)
+        event_ids = list(pending.filter(pk__gt=last_pk).values_list('pk', flat=True)[:size])
+        if not event_ids:
+            break
+        for event_id in event_ids:
+            status = process_webhook_event(event_id)
+            if status:
+                counts[status] = counts.get(status, 0) + 1
+        processed += len(event_ids)
+        last_pk = event_ids[-1]
+    return counts
+
+
+@dataclass
+class ReconcileReport:
+    """Counters of one reconciliation run"""
+    checked: int = 0
+    settled: int = 0
+    failed: int = 0
+    pending: int = 0
+    unknown: int = 0
+    errors: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def throughput(self):
+        """Transactions checked per second"""
+        return self.checked / self.elapsed if self.elapsed else 0.0
+
+
+def stale_transactions(older_than=15, max_age_hours=72, now=None):
+    """INITIATED ledger rows whose callback never arrived"""
+    now = now or timezone.now()
+    return PaymentTransaction.objects.filter(
+        status=PaymentTransaction.Status.INITIATED,
+        created_at__lte=now - timedelta(minutes=older_than),
+        created_at__gte=now - timedelta(hours=max_age_hours),
+    ).select_related('content_type').order_by('created_at')
+
+
+def _apply_batch(batch, report, client=None):
+    """Apply gateway results to their ledger rows in one transaction"""
+    with transaction.atomic():
+        for payment_txn, result in batch:
+            if result is None:
+                report.unknown += 1
+                continue
+            gateway_status = str(result.get('status') or '').lower()
+            if gateway_status in PENDING_GATEWAY_STATUSES:
+                report.pending += 1
+                continue
+            try:
+                # Savepoint per row so one bad row does not abort the batch
+                with transaction.atomic():
+                    outcome = settle(payment_txn, gateway_status, result.get('amount'), result, client=client)
+            except Exception:
+                report.errors += 1
+                continue
+            if outcome in (SETTLED, SEATS_UNAVAILABLE):
+                report.settled += 1
+            elif outcome in (FAILED, AMOUNT_MISMATCH):
+                report.failed += 1
+
+
+def reconcile(older_than=15, max_age_hours=72, workers=8, batch_size=50, limit=None, client=None):
+    """Query the gateway for stale transactions and settle them.
+
+    Status lookups run concurrently on a bounded thread pool (HTTP only, no
+    database access in the workers); results are applied on the calling
+    thread in batches of `batch_size`, one transaction per batch.
+    """
+    client = client or get_client()
+    pending = stale_transactions(older_than, max_age_hours)
+    if limit:
+        pending = pending[:limit]
+    report = ReconcileReport()
+    started = time.perf_counter()
+
+    batch = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(client.transaction_status, payment_txn.txnid): payment_txn
+                   for payment_txn in pending}
+        for future in as_completed(futures):
+            report.checked += 1
+            try:
+                batch.append((futures[future], future.result()))
+            except EasebuzzError:
+                report.errors += 1
+            if len(batch) >= batch_size:
+                _apply_batch(batch, report, client)
+                batch = []
+    if batch:
+        _apply_batch(batch, report, client)
+
+    report.elapsed = time.perf_counter() - started
+    return report
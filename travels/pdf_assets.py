@@ -0,0 +1,193 @@
+"""Images and files for xhtml2pdf ticket renders.
+
+xhtml2pdf asks link_callback for every <img> of every render. Turning a
+static/media URI into a path (a stat per STATICFILES_DIRS entry when
+STATIC_ROOT is not populated) is memoized per process.
+
+Images are served from a pool of downscaled copies instead of the original
+files. Agency logos are uploaded at any resolution but print at most 150 x
+60 points, and a 3000 px logo costs seconds of decoding and megabytes of
+PDF on every render. Each file version is decoded once, shrunk to
+LOGO_MAX_SIZE and stored as a small PNG under TICKET_ASSET_DIR, named by
+the hash of its contents; the in-process index is keyed by path, mtime and
+size, so replacing a logo is picked up on the next render.
+
+Remote airline logos (the CDN fallback) are never downloaded while a
+ticket renders: the fetch_ticket_logos command downloads them into the
+same pool ahead of time, and a render uses the pooled copy. A logo that
+was not fetched yet is logged and left to xhtml2pdf as the plain URL.
+"""
+import functools
+import hashlib
+import logging
+import os
+import tempfile
+from dataclasses import replace
+from io import BytesIO
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Four times the largest printed logo (150 x 60 pt), for print quality
+LOGO_MAX_SIZE = (600, 240)
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp'}
+REMOTE_TIMEOUT = (3.05, 5)
+
+_pooled = {}  # (path, mtime_ns, size) -> pooled copy
+_unfetched = set()  # remote URLs already logged as missing from the pool
+
+
+def get_asset_dir():
+    return str(getattr(settings, 'TICKET_ASSET_DIR', os.path.join(settings.MEDIA_ROOT, 'ticket_assets')))
+
+
+def find_file(uri):
+    """Absolute path of a static or media URI (the URI itself for anything else)"""
+    # Handle static files
+    sUrl = settings.STATIC_URL        # Typically /static/
+    sRoot = settings.STATIC_ROOT      # Typically /home/user/var/www/static/
+    mUrl = settings.MEDIA_URL         # Typically /media/
+    mRoot = settings.MEDIA_ROOT       # Typically /home/user/var/www/media/
+
+    if uri.startswith(mUrl):
+        path = os.path.join(mRoot, uri.replace(mUrl, ""))
+    elif uri.startswith(sUrl):
+        path = os.path.join(sRoot, uri.replace(sUrl, ""))
+    else:
+        return uri
+
+    # Example: /home/user/var/www/static/css/style.css
+    if not os.path.isfile(path):
+        # For development where STATIC_ROOT might not be set or populated
+        if uri.startswith(sUrl):
+             # check in static directories
+             for static_dir in settings.STATICFILES_DIRS:
+                 potential_path = os.path.join(static_dir, uri.replace(sUrl, ""))
+                 if os.path.isfile(potential_path):
+                     path = potential_path
+                     break
+
+    return path
+
+
+@functools.lru_cache(maxsize=1024)
+def resolve(uri):
+    """find_file(), memoized per process"""
+    return find_file(uri)
+
+
+def _is_image(path):
+    return os.path.splitext(urlsplit(path).path)[1].lower() in IMAGE_EXTENSIONS
+
+
+def _write(path, data):
+    """Write a pool file atomically"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as tmp_file:
+        tmp_file.write(data)
+    os.replace(tmp_path, path)
+
+
+def _downscale(data):
+    """PNG bytes of an image shrunk to fit LOGO_MAX_SIZE"""
+    with Image.open(BytesIO(data)) as image:
+        if image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+            image = image.convert('RGBA')
+        image.thumbnail(LOGO_MAX_SIZE)
+        output = BytesIO()
+        image.save(output, 'PNG', optimize=True)
+    return output.getvalue()
+
+
+def pooled_image(path):
+    """Path of the downscaled copy of an image file, made once per file version
+    (the original path if it is missing or not an image Pillow can read)"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return path
+    version = (path, stat.st_mtime_ns, stat.st_size)
+    pooled = _pooled.get(version)
+    if pooled and os.path.exists(pooled):
+        return pooled
+    try:
+        with open(path, 'rb') as image_file:
+            data = image_file.read()
+        pooled = os.path.join(get_asset_dir(), f'{hashlib.sha256(data).hexdigest()}.png')
+        if not os.path.exists(pooled):
+            _write(pooled, _downscale(data))
+    except (OSError, ValueError, Image.DecompressionBombError) as exc:
+        logger.warning('Could not pool ticket image %s: %s', path, exc)
+        return path
+    _pooled[version] = pooled
+    return pooled
+
+
+def _remote_copy(url):
+    return os.path.join(get_asset_dir(), 'remote', hashlib.sha256(url.encode('utf-8')).hexdigest())
+
+
+def fetch_remote_image(url):
+    """Download a remote image into the pool (outside rendering); True once a copy is there"""
+    download = _remote_copy(url)
+    if os.path.exists(download):
+        return True
+    try:
+        response = requests.get(url, timeout=REMOTE_TIMEOUT)
+        response.raise_for_status()
+        _write(download, response.content)
+    except (requests.RequestException, OSError) as exc:
+        logger.warning('Could not download ticket image %s: %s', url, exc)
+        return False
+    _unfetched.discard(url)
+    return True
+
+
+def pooled_remote_image(url):
+    """Path of the downscaled copy of a fetched remote image (the URL itself until it is fetched)"""
+    download = _remote_copy(url)
+    if os.path.exists(download):
+        return pooled_image(download)
+    if url not in _unfetched:
+        _unfetched.add(url)
+        logger.warning('Ticket image %s is not pooled yet (run fetch_ticket_logos); using the remote URL', url)
+    return url
+
+
+def link_callback(uri, rel):
+    """
+    Convert HTML URIs to absolute system paths so xhtml2pdf can access those resources
+    (images come from the downscaled pool)
+    """
+    if uri.startswith(('http://', 'https://')):
+        return pooled_remote_image(uri) if _is_image(uri) else uri
+    path = resolve(uri)
+    if path != uri and _is_image(path):
+        return pooled_image(path)
+    return path
+
+
+def resource_options():
+    """Extra pisa.CreatePDF() arguments letting the render read static, media
+    and pooled files wherever the process was started (xhtml2pdf 0.2.23+
+    confines local reads to the working directory by default)"""
+    try:
+        from xhtml2pdf.config.resources import default_policy
+    except ImportError:
+        # Older xhtml2pdf reads local files without a policy
+        return {}
+    roots = [settings.STATIC_ROOT, settings.MEDIA_ROOT, *settings.STATICFILES_DIRS, get_asset_dir()]
+    policy = default_policy()
+    return {'resource_policy': replace(policy, extra_roots=(*policy.extra_roots, *(str(root) for root in roots if root)))}
+
+
+def clear():
+    """Forget memoized lookups (pooled files stay on disk)"""
+    resolve.cache_clear()
+    _pooled.clear()
+    _unfetched.clear()
@@ -0,0 +1,88 @@
+"""Sales representative directory.
+
+The header shows the user's assigned representative, or every active one.
+The whole (tiny) SalesRepresentative table and each user's assignment are
+kept in the shared cache under a generation stamp: saving or deleting a
+representative bumps the stamp, and saving a profile drops that user's
+assignment entry, so a warm header render costs no queries.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from . import generations
+
+GENERATION_KEY = 'sales_reps:generation'
+
+# Cached for users without an assigned representative
+NO_REPRESENTATIVE = 0
+
+
+def get_timeout():
+    """Seconds a directory entry may live (SALES_REP_CACHE_TIMEOUT setting)"""
+    return getattr(settings, 'SALES_REP_CACHE_TIMEOUT', 3600)
+
+
+def get_generation():
+    """Current directory generation"""
+    return generations.get(GENERATION_KEY)
+
+
+def invalidate():
+    """Drop the cached directory once the current transaction commits"""
+    generations.bump_on_commit(GENERATION_KEY)
+
+
+def _assignment_key(user_id):
+    return f'sales_reps:user:{user_id}'
+
+
+def forget_assignment(user_id):
+    """Drop one user's cached assignment once the current transaction commits"""
+    transaction.on_commit(lambda: cache.delete(_assignment_key(user_id)))
+
+
+def directory():
+    """{'by_id': {pk: rep}, 'active': [rep, ...]} for every representative"""
+    from .models import SalesRepresentative
+
+    key = f'sales_reps:directory:{get_generation()}'
+    entry = cache.get(key)
+    if entry is None:
+        representatives = list(SalesRepresentative.objects.order_by('display_order', 'name'))
+        entry = {
+            'by_id': {rep.pk: rep for rep in representatives},
+            'active': [rep for rep in representatives if rep.is_active],
+        }
+        cache.set(key, entry, get_timeout())
+    return entry
+
+
+def active_representatives():
+    """Active representatives in display order"""
+    return directory()['active']
+
+
+def assigned_representative(user):
+    """The representative assigned to a user's agency, or None"""
+    from .models import UserProfile
+
+    key = _assignment_key(user.pk)
+    rep_id = cache.get(key)
+    if rep_id is None:
+        rep_id = UserProfile.objects.filter(user=user).values_list('sales_representative_id', flat=True).first()
+        rep_id = rep_id or NO_REPRESENTATIVE
+        cache.set(key, rep_id, get_timeout())
+    if rep_id == NO_REPRESENTATIVE:
+        return None
+    return directory()['by_id'].get(rep_id)
+
+
+def for_user(user):
+    """Representatives to show a user: the assigned one (even if not globally
+    active, as it was explicitly assigned to this agency) or all active ones"""
+    if user.is_authenticated:
+        rep = assigned_representative(user)
+        if rep:
+            return [rep]
+    return active_representatives()
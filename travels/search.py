@@ -0,0 +1,149 @@
+"""Flight search service.
+
+Each search leg is evaluated with a single query against the flight search
+index (or served straight from the search cache) and handed back as an
+immutable result, so neither the view nor the template touches the
+schedule table again.
+"""
+from dataclasses import dataclass
+from datetime import date
+from decimal import Decimal
+from typing import Optional
+
+from django.utils import timezone
+
+from . import search_cache
+from .models import Route, Schedule, FlightSearchIndex
+
+
+@dataclass(frozen=True)
+class SearchLeg:
+    """Evaluated schedules for one direction of a search"""
+    from_location: str
+    to_location: str
+    departure_date: Optional[date]
+    rows: tuple = ()
+    used_fallback: bool = False
+    count: int = 0
+    route_info: Optional[Route] = None
+    cheapest_fare: Optional[Decimal] = None
+
+    @classmethod
+    def from_rows(cls, from_location, to_location, departure_date, rows, used_fallback=False):
+        """Build a leg, precomputing its count, route info and cheapest fare"""
+        rows = tuple(rows)
+        return cls(
+            from_location=from_location,
+            to_location=to_location,
+            departure_date=departure_date,
+            rows=rows,
+            used_fallback=used_fallback,
+            count=len(rows),
+            route_info=rows[0].route if rows else None,
+            cheapest_fare=min((row.adult_fare for row in rows), default=None),
+        )
+
+    def __bool__(self):
+        return bool(self.rows)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return self.count
+
+
+@dataclass(frozen=True)
+class SearchResult:
+    """Outbound and optional return legs of a flight search"""
+    outbound: SearchLeg
+    return_leg: Optional[SearchLeg] = None
+
+    @property
+    def total_flights(self):
+        return self.outbound.count
+
+    @property
+    def total_return_flights(self):
+        return self.return_leg.count if self.return_leg else 0
+
+    @property
+    def route_info(self):
+        return self.outbound.route_info
+
+    @property
+    def cheapest_fare(self):
+        return self.outbound.cheapest_fare
+
+
+class SearchService:
+    """Runs flight searches against the search index, one query per leg"""
+
+    def __init__(self, passengers=1, flight_type='any', route_type='', travel_class='economy'):
+        self.passengers = passengers
+        self.flight_type = flight_type or 'any'
+        self.route_type = route_type if route_type in dict(Route.ROUTE_TYPE_CHOICES) else ''
+        self.travel_class = (travel_class or 'economy').lower()
+
+    @property
+    def class_available(self):
+        """Only Economy is stored in the schedule table"""
+        return self.travel_class == 'economy'
+
+    def search(self, from_location, to_location, departure_date=None, return_date=None):
+        """Search the outbound leg and, when return_date is given, the reverse leg"""
+        outbound = self.search_leg(from_location, to_location, departure_date, route_type_fallback=True)
+        return_leg = None
+        if return_date:
+            return_leg = self.search_leg(to_location, from_location, return_date)
+        return SearchResult(outbound=outbound, return_leg=return_leg)
+
+    def search_leg(self, from_location, to_location, departure_date=None, route_type_fallback=False):
+        """Evaluate one leg through the search cache"""
+        if not self.class_available:
+            return SearchLeg.from_rows(from_location, to_location, departure_date, ())
+
+        origin_key = FlightSearchIndex.normalize_location(from_location)
+        destination_key = FlightSearchIndex.normalize_location(to_location)
+        today = timezone.now().date()
+        params = {
+            'today': today.isoformat(),
+            'departure_date': departure_date.isoformat() if departure_date else '',
+            'passengers': self.passengers,
+            'flight_type': self.flight_type,
+            'route_type': self.route_type,
+            'route_type_fallback': route_type_fallback,
+        }
+        return search_cache.get_or_set(
+            origin_key, destination_key, params,
+            lambda: self._query_leg(from_location, to_location, origin_key, destination_key,
+                                    departure_date, today, route_type_fallback)
+        )
+
+    def _query_leg(self, from_location, to_location, origin_key, destination_key, departure_date, today, route_type_fallback):
+        """Single query over the search index; route_type fallback is resolved in memory"""
+        flights = Schedule.objects.select_related('route').filter(
+            search_index__origin_key=origin_key,
+            search_index__destination_key=destination_key,
+            search_index__departure_date__gte=today,
+            search_index__available_seats__gte=self.passengers,
+        )
+        if departure_date:
+            flights = flights.filter(search_index__departure_date=departure_date)
+        if self.flight_type != 'any':
+            flights = flights.filter(search_index__flight_type=self.flight_type)
+        if self.route_type and not route_type_fallback:
+            flights = flights.filter(search_index__route_type=self.route_type)
+
+        # Order by adult fare and departure date
+        rows = list(flights.order_by('search_index__adult_fare', 'search_index__departure_date'))
+
+        used_fallback = False
+        if self.route_type and route_type_fallback:
+            matching = [row for row in rows if row.route.route_type == self.route_type]
+            # If no flights found with route type, keep the unfiltered rows
+            used_fallback = bool(rows) and not matching
+            if matching:
+                rows = matching
+
+        return SearchLeg.from_rows(from_location, to_location, departure_date, rows, used_fallback)
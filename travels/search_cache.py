@@ -0,0 +1,96 @@
+"""Flight search result cache.
+
+Cached results are keyed by a generation counter per origin/destination pair
+(plus a global generation bumped on full index rebuilds). Any schedule save,
+seat change, fare edit or route edit bumps the counter of the affected pair
+once the write commits, so stale entries simply become unreachable and expire
+on their own. Counters are kept by the generations module in the shared
+default cache, so a bump is seen by every worker process.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import generations
+
+KEY_PREFIX = 'flight_search'
+HITS_KEY = f'{KEY_PREFIX}:stats:hits'
+MISSES_KEY = f'{KEY_PREFIX}:stats:misses'
+GLOBAL_PAIR = ('*', '*')
+
+
+def get_timeout():
+    """Seconds a cached search result may live (SEARCH_CACHE_TIMEOUT setting)"""
+    return getattr(settings, 'SEARCH_CACHE_TIMEOUT', 300)
+
+
+def _digest(*parts):
+    return hashlib.md5('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+def _generation_key(origin_key, destination_key):
+    return f'{KEY_PREFIX}:gen:{_digest(origin_key, destination_key)}'
+
+
+def get_generation(origin_key, destination_key):
+    """Current generation of a pair"""
+    return generations.get(_generation_key(origin_key, destination_key))
+
+
+def bump_generation(origin_key, destination_key):
+    """Invalidate every cached search of a pair once the current transaction commits"""
+    generations.bump_on_commit(_generation_key(origin_key, destination_key))
+
+
+def bump_all():
+    """Invalidate every cached search (full index rebuild)"""
+    bump_generation(*GLOBAL_PAIR)
+
+
+def result_key(origin_key, destination_key, params):
+    """Cache key for one search leg under the current generations"""
+    return '{prefix}:result:{global_gen}:{pair_gen}:{digest}'.format(
+        prefix=KEY_PREFIX,
+        global_gen=get_generation(*GLOBAL_PAIR),
+        pair_gen=get_generation(origin_key, destination_key),
+        digest=_digest(origin_key, destination_key, *sorted(params.items())),
+    )
+
+
+def _count(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def get_or_set(origin_key, destination_key, params, compute):
+    """Return the cached result for a search leg, computing it on a miss"""
+    key = result_key(origin_key, destination_key, params)
+    result = cache.get(key)
+    if result is not None:
+        _count(HITS_KEY)
+        return result
+    _count(MISSES_KEY)
+    result = compute()
+    cache.set(key, result, get_timeout())
+    return result
+
+
+def get_stats():
+    """Hit/miss counters and hit ratio"""
+    hits = cache.get(HITS_KEY) or 0
+    misses = cache.get(MISSES_KEY) or 0
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': (hits / total) if total else 0.0,
+    }
+
+
+def reset_stats():
+    """Zero the hit/miss counters"""
+    cache.delete_many([HITS_KEY, MISSES_KEY])
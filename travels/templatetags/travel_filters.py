@@ -36,11 +36,17 @@ def duration_format(minutes):
     except (ValueError, TypeError):
         return str(minutes)
 
+PASSENGER_COUNT_FIELDS = {'adult': 'adult_count', 'child': 'child_count', 'infant': 'infant_count'}
+
 @register.filter
-def passenger_type_count(queryset, passenger_type):
-    """Count passengers of a specific type in a queryset"""
+def passenger_type_count(value, passenger_type):
+    """Count passengers of a specific type: read from a booking's stored
+    counts, or counted in a passenger queryset"""
+    field = PASSENGER_COUNT_FIELDS.get(passenger_type)
+    if field and hasattr(value, field):
+        return getattr(value, field)
     try:
-        return queryset.filter(passenger_type=passenger_type).count()
+        return value.filter(passenger_type=passenger_type).count()
     except (AttributeError, TypeError):
         return 0
 
@@ -64,62 +70,3 @@ def airline_logo(carrier_code):
     
     # Return CDN URL - fallback if static not found
     return f'https://pics.avs.io/200/80/{code}.png'
-
-
-@register.filter
-def airline_logo_static(airline_name):
-    """Return static file path for airline logo based on airline name from database.
-    The logo files should be in static/images/flight-logo/{airline_name}.png
-    E.g., "Air India" -> "/static/images/flight-logo/air-india.png"
-    """
-    if not airline_name:
-        return ''
-    
-    # Convert to lowercase and replace spaces with hyphens for file path
-    name = str(airline_name).strip().lower().replace(' ', '-')
-    return f'/static/images/flight-logo/{name}.png'
-
-
-@register.filter
-def airline_name_from_code(carrier_code):
-    """Return airline name based on carrier code"""
-    if not carrier_code:
-        return 'Airline'
-    
-    code = str(carrier_code).strip().upper()[:2]
-    
-    airline_names = {
-        '6E': 'IndiGo',
-        'AI': 'Air India',
-        'UK': 'Vistara',
-        'SG': 'SpiceJet',
-        'G8': 'Go First',
-        'I5': 'AirAsia India',
-        'IX': 'Air India Express',
-        'QP': 'Akasa Air',
-        '9I': 'Alliance Air',
-        'S5': 'Star Air',
-        'EK': 'Emirates',
-        'EY': 'Etihad Airways',
-        'QR': 'Qatar Airways',
-        'SQ': 'Singapore Airlines',
-        'TG': 'Thai Airways',
-        'MH': 'Malaysia Airlines',
-        'CX': 'Cathay Pacific',
-        'BA': 'British Airways',
-        'LH': 'Lufthansa',
-        'AF': 'Air France',
-        'KL': 'KLM',
-        'TK': 'Turkish Airlines',
-        'SV': 'Saudia',
-        'GF': 'Gulf Air',
-        'WY': 'Oman Air',
-        'FZ': 'Fly Dubai',
-        'G9': 'Air Arabia',
-        'UL': 'SriLankan Airlines',
-        'BG': 'Biman Bangladesh',
-        'PK': 'Pakistan International',
-        'RA': 'Nepal Airlines',
-    }
-    
-    return airline_names.get(code, 'Airline')
\ No newline at end of file
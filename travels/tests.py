@@ -1,3 +1,1749 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time as clock
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import time, timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from importlib import import_module
+from urllib.parse import parse_qs
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.template import engines
+from django.template.loader import render_to_string
+from django.templatetags.static import static
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import airports, easebuzz_client, inventory, pagination, payments, pdf_assets, sales_reps, search_cache, statements, ticket_pdfs, ticket_renderer, wallet_ledger
+from .easebuzz_client import EasebuzzClient, EasebuzzError, CircuitBreaker, CircuitOpenError, RESPONSE_HASH_SEQUENCE
+from .models import (
+    Airline, Airport, Booking, BookingPassenger, Route, Schedule, FlightSearchIndex, FareCalendarDay, SeatHold, PaymentTransaction, PaymentWebhookEvent,
+    CashBalanceWallet, CashBalanceTransaction, ODWallet, SalesRepresentative, TicketRenderJob, UserProfile, VisaBooking,
+)
+from .context_processors import wallet_context
+from .metrics import LatencyMetrics
+from .search import SearchService, SearchResult
+from .wallets import get_wallet_snapshot
+
+
+class FlightSearchTestMixin:
+    """Routes and schedules shared by the flight search tests"""
+
+    def setUp(self):
+        cache.clear()
+        self.departure_date = timezone.now().date() + timedelta(days=10)
+        self.return_date = self.departure_date + timedelta(days=5)
+        self.outbound_route = self.create_route('Lucknow', 'Dubai', 'TC101')
+        self.return_route = self.create_route('Dubai', 'Lucknow', 'TC102')
+        self.create_schedule(self.outbound_route, self.departure_date, '12500.00')
+        self.create_schedule(self.return_route, self.return_date, '11800.00')
+
+    def create_route(self, from_location, to_location, carrier_number, route_type='international'):
+        return Route.objects.create(
+            name=f'{from_location} to {to_location}',
+            from_location=from_location,
+            to_location=to_location,
+            airline_name='Air India Express',
+            carrier_number=carrier_number,
+            departure_time=time(9, 30),
+            arrival_time=time(12, 45),
+            duration=timedelta(hours=3, minutes=15),
+            route_type=route_type,
+        )
+
+    def create_schedule(self, route, departure_date, adult_fare):
+        return Schedule.objects.create(
+            route=route,
+            departure_date=departure_date,
+            arrival_date=departure_date,
+            total_seats=50,
+            available_seats=50,
+            adult_fare=Decimal(adult_fare),
+        )
+
+
+class SearchServiceTests(FlightSearchTestMixin, TestCase):
+
+    def test_one_way_search_runs_a_single_query(self):
+        service = SearchService(passengers=1)
+        with self.assertNumQueries(1):
+            result = service.search('Lucknow', 'Dubai', self.departure_date)
+            # Rows, route info and the cheapest fare are already evaluated
+            self.assertEqual(result.total_flights, 1)
+            self.assertEqual(result.route_info, self.outbound_route)
+            self.assertEqual(result.cheapest_fare, Decimal('12500.00'))
+            self.assertEqual(result.outbound.rows[0].route.carrier_number, 'TC101')
+        self.assertIsNone(result.return_leg)
+        self.assertEqual(result.total_return_flights, 0)
+
+    def test_return_search_runs_one_query_per_leg(self):
+        service = SearchService(passengers=1)
+        with self.assertNumQueries(2):
+            result = service.search('Lucknow', 'Dubai', self.departure_date, self.return_date)
+            self.assertEqual(result.total_flights, 1)
+            self.assertEqual(result.total_return_flights, 1)
+            self.assertEqual(result.return_leg.rows[0].route, self.return_route)
+
+    def test_repeated_search_is_served_from_cache(self):
+        service = SearchService(passengers=1)
+        service.search('Lucknow', 'Dubai', self.departure_date, self.return_date)
+        with self.assertNumQueries(0):
+            result = service.search('Lucknow', 'Dubai', self.departure_date, self.return_date)
+        self.assertEqual(result.total_flights, 1)
+        self.assertEqual(result.total_return_flights, 1)
+
+    def test_seat_change_invalidates_a_cached_result(self):
+        service = SearchService(passengers=1)
+        self.assertEqual(service.search('Lucknow', 'Dubai', self.departure_date).outbound.rows[0].available_seats, 50)
+        schedule = Schedule.objects.get(route=self.outbound_route)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(inventory.reserve_seats(schedule.pk, 5))
+        with self.assertNumQueries(1):
+            result = service.search('Lucknow', 'Dubai', self.departure_date)
+        self.assertEqual(result.outbound.rows[0].available_seats, 45)
+
+    def test_hit_and_miss_counters(self):
+        search_cache.reset_stats()
+        service = SearchService(passengers=1)
+        for i in range(3):
+            service.search('Lucknow', 'Dubai', self.departure_date)
+        self.assertEqual(search_cache.get_stats(), {'hits': 2, 'misses': 1, 'hit_ratio': 2 / 3})
+        search_cache.reset_stats()
+        self.assertEqual(search_cache.get_stats(), {'hits': 0, 'misses': 0, 'hit_ratio': 0.0})
+
+    def test_route_type_falls_back_without_extra_query(self):
+        service = SearchService(passengers=1, route_type='domestic')
+        with self.assertNumQueries(1):
+            result = service.search('Lucknow', 'Dubai', self.departure_date)
+        self.assertTrue(result.outbound.used_fallback)
+        self.assertEqual(result.total_flights, 1)
+
+    def test_unsupported_travel_class_skips_the_database(self):
+        service = SearchService(passengers=1, travel_class='business')
+        with self.assertNumQueries(0):
+            result = service.search('Lucknow', 'Dubai', self.departure_date)
+        self.assertFalse(result.outbound)
+        self.assertIsNone(result.cheapest_fare)
+
+    def test_result_is_immutable(self):
+        result = SearchService().search('Lucknow', 'Dubai', self.departure_date)
+        with self.assertRaises(AttributeError):
+            result.outbound = None
+
+
+class FlightSearchIndexTests(FlightSearchTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.schedule = Schedule.objects.get(route=self.outbound_route)
+
+    def row(self, schedule=None):
+        return FlightSearchIndex.objects.filter(schedule=schedule or self.schedule).first()
+
+    def test_row_is_created_with_the_schedule(self):
+        row = self.row()
+        self.assertEqual(
+            (row.route_id, row.origin_key, row.destination_key, row.departure_date, row.departure_time,
+             row.adult_fare, row.available_seats, row.route_type),
+            (self.outbound_route.pk, 'lucknow', 'dubai', self.departure_date, time(9, 30),
+             Decimal('12500.00'), 50, 'international'),
+        )
+        self.assertEqual(FlightSearchIndex.objects.count(), 2)
+
+    def test_row_follows_schedule_edits(self):
+        new_date = self.departure_date + timedelta(days=1)
+        self.schedule.departure_date = new_date
+        self.schedule.adult_fare = Decimal('9999.00')
+        self.schedule.child_fare = Decimal('5000.00')
+        self.schedule.save()
+        row = self.row()
+        self.assertEqual((row.departure_date, row.adult_fare, row.child_fare),
+                         (new_date, Decimal('9999.00'), Decimal('5000.00')))
+        self.assertEqual(FlightSearchIndex.objects.filter(route=self.outbound_route).count(), 1)
+
+    def test_row_is_dropped_for_inactive_past_and_deleted_schedules(self):
+        self.schedule.is_active = False
+        self.schedule.save()
+        self.assertIsNone(self.row())
+        self.schedule.is_active = True
+        self.schedule.save()
+        self.assertIsNotNone(self.row())
+
+        past = self.create_schedule(self.outbound_route, timezone.now().date() - timedelta(days=1), '12500.00')
+        self.assertIsNone(self.row(past))
+
+        self.schedule.delete()
+        self.assertFalse(FlightSearchIndex.objects.filter(route=self.outbound_route).exists())
+
+    def test_rows_follow_route_edits(self):
+        self.outbound_route.from_location = 'New Delhi'
+        self.outbound_route.departure_time = time(6, 15)
+        self.outbound_route.route_type = 'domestic'
+        self.outbound_route.save()
+        row = self.row()
+        self.assertEqual((row.origin_key, row.departure_time, row.route_type), ('new delhi', time(6, 15), 'domestic'))
+        result = SearchService(passengers=1).search('New Delhi', 'Dubai', self.departure_date)
+        self.assertEqual(result.total_flights, 1)
+
+        self.outbound_route.delete()
+        self.assertEqual(list(FlightSearchIndex.objects.values_list('route_id', flat=True)), [self.return_route.pk])
+
+
+class SearchFlightsViewTests(FlightSearchTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = get_user_model().objects.create_user(email='agent@example.com', password='pass12345')
+        self.client.force_login(self.user)
+
+    def test_template_receives_search_result(self):
+        response = self.client.get(reverse('search_flights'), {
+            'from_location': 'Lucknow (LKO)',
+            'to_location': 'Dubai (DXB)',
+            'travel_date': self.departure_date.isoformat(),
+            'return_date': self.return_date.isoformat(),
+            'trip_type': 'return',
+        })
+        self.assertEqual(response.status_code, 200)
+        search = response.context['search']
+        self.assertIsInstance(search, SearchResult)
+        self.assertEqual(search.total_flights, 1)
+        self.assertEqual(search.total_return_flights, 1)
+        self.assertContains(response, 'TC101')
+        self.assertContains(response, 'TC102')
+
+
+class FareCalendarTests(FlightSearchTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.schedule = Schedule.objects.get(route=self.outbound_route)
+
+    def cell(self):
+        return FareCalendarDay.objects.filter(
+            origin_key=FlightSearchIndex.normalize_location('Lucknow'),
+            destination_key=FlightSearchIndex.normalize_location('Dubai'),
+            day=self.departure_date,
+        ).values_list('min_adult_fare', 'seats_left', 'flight_count').first()
+
+    def test_cell_follows_fare_changes(self):
+        self.assertEqual(self.cell(), (Decimal('12500.00'), 50, 1))
+        cheaper = self.create_schedule(self.create_route('Lucknow', 'Dubai', 'TC103'), self.departure_date, '11000.00')
+        self.assertEqual(self.cell(), (Decimal('11000.00'), 100, 2))
+        self.schedule.adult_fare = Decimal('9000.00')
+        self.schedule.save()
+        self.assertEqual(self.cell(), (Decimal('9000.00'), 100, 2))
+        cheaper.delete()
+        self.assertEqual(self.cell(), (Decimal('9000.00'), 50, 1))
+
+    def test_cell_follows_seat_changes(self):
+        booking = Booking.objects.create(
+            user=get_user_model().objects.create_user(email='agent@example.com', password='pass12345'),
+            schedule=self.schedule, base_fare=Decimal('12500.00'), total_amount=Decimal('12500.00'),
+        )
+        inventory.hold_seats(booking, 4)
+        self.assertEqual(self.cell(), (Decimal('12500.00'), 46, 1))
+        self.assertTrue(inventory.reserve_seats(self.schedule.pk, 46))
+        # A sold-out day drops out of the calendar
+        self.assertIsNone(self.cell())
+        inventory.release_booking_holds(booking)
+        self.assertEqual(self.cell(), (Decimal('12500.00'), 4, 1))
+
+    def test_api_returns_the_month(self):
+        self.client.force_login(get_user_model().objects.create_user(email='agent@example.com', password='pass12345'))
+        month = self.departure_date.strftime('%Y-%m')
+        response = self.client.get(reverse('fare_calendar_api'), {
+            'from_location': 'Lucknow (LKO)', 'to_location': 'Dubai (DXB)', 'month': month})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            'success': True, 'from_location': 'Lucknow', 'to_location': 'Dubai', 'month': month,
+            'days': [{'date': self.departure_date.isoformat(), 'min_adult_fare': '12500.00', 'seats_left': 50}],
+        })
+        self.assertEqual(self.client.get(reverse('fare_calendar_api'), {'from_location': 'Lucknow'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('fare_calendar_api'), {
+            'from_location': 'Lucknow', 'to_location': 'Dubai', 'month': 'May'}).status_code, 400)
+
+    def test_strip_links_are_urlencoded(self):
+        route = self.create_route('Navi Mumbai', 'Abu Dhabi', 'TC201')
+        self.create_schedule(route, self.departure_date, '9800.00')
+        self.client.force_login(get_user_model().objects.create_user(email='agent@example.com', password='pass12345'))
+        response = self.client.get(reverse('search_flights'), {
+            'from_location': 'Navi Mumbai', 'to_location': 'Abu Dhabi',
+            'travel_date': self.departure_date.isoformat(), 'trip_type': 'one_way',
+        })
+        self.assertContains(response, f'?from_location=Navi%20Mumbai&to_location=Abu%20Dhabi&travel_date={self.departure_date.isoformat()}&')
+        self.assertNotContains(response, '?from_location=Navi Mumbai')
+
+    def test_api_requires_login(self):
+        response = self.client.get(reverse('fare_calendar_api'), {'from_location': 'Lucknow', 'to_location': 'Dubai'})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(reverse('login'), response['Location'])
+
+
+class SeatInventoryTests(FlightSearchTestMixin, TransactionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.schedule = Schedule.objects.get(route=self.outbound_route)
+        Schedule.objects.filter(pk=self.schedule.pk).update(total_seats=20, available_seats=20)
+        FlightSearchIndex.refresh_seats(self.schedule.pk)
+
+    def confirm_in_parallel(self, workers, seats=1):
+        """Fire `workers` simultaneous reservations at the schedule"""
+        barrier = threading.Barrier(workers)
+        results = []
+        errors = []
+
+        def confirm():
+            try:
+                barrier.wait()
+                results.append(inventory.reserve_seats(self.schedule.pk, seats))
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=confirm) for i in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        return results
+
+    def test_parallel_confirmations_never_oversell(self):
+        results = self.confirm_in_parallel(workers=40)
+        self.assertEqual(results.count(True), 20)
+        self.assertEqual(results.count(False), 20)
+        self.assertEqual(inventory.available_seats(self.schedule.pk), 0)
+        # update() bypasses signals; the search index must still follow
+        self.assertEqual(FlightSearchIndex.objects.get(schedule=self.schedule).available_seats, 0)
+
+    def test_parallel_group_confirmations_keep_every_decrement(self):
+        results = self.confirm_in_parallel(workers=12, seats=3)
+        self.assertEqual(results.count(True), 6)
+        self.assertEqual(inventory.available_seats(self.schedule.pk), 2)
+
+    def test_release_is_capped_at_total_seats(self):
+        self.assertTrue(inventory.reserve_seats(self.schedule.pk, 5))
+        self.assertFalse(inventory.release_seats(self.schedule.pk, 6))
+        self.assertTrue(inventory.release_seats(self.schedule.pk, 5))
+        self.assertEqual(inventory.available_seats(self.schedule.pk), 20)
+
+    def test_schedule_helpers_use_inventory(self):
+        self.assertTrue(self.schedule.book_seats(4))
+        self.assertEqual(self.schedule.available_seats, 16)
+        self.assertFalse(self.schedule.book_seats(17))
+        self.assertTrue(self.schedule.cancel_booking(4))
+        self.assertEqual(self.schedule.available_seats, 20)
+
+
+class SeatHoldTests(FlightSearchTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.schedule = Schedule.objects.get(route=self.outbound_route)
+        self.user = get_user_model().objects.create_user(email='agent@example.com', password='pass12345')
+
+    def create_booking(self):
+        return Booking.objects.create(
+            user=self.user,
+            schedule=self.schedule,
+            contact_email=self.user.email,
+            base_fare=Decimal('12500.00'),
+            total_amount=Decimal('12500.00'),
+        )
+
+    def search_row_seats(self):
+        return FlightSearchIndex.objects.get(schedule=self.schedule).available_seats
+
+    def test_hold_is_subtracted_from_bookable_seats(self):
+        holds = inventory.hold_seats(self.create_booking(), 48)
+        self.assertEqual(len(holds), 1)
+        self.assertEqual(inventory.available_seats(self.schedule.pk), 2)
+        self.assertEqual(self.search_row_seats(), 2)
+        # Held seats cannot be held or sold again
+        self.assertEqual(inventory.hold_seats(self.create_booking(), 3), [])
+        self.assertFalse(inventory.reserve_seats(self.schedule.pk, 3))
+        self.schedule.refresh_from_db()
+        self.assertTrue(self.schedule.can_book(2))
+        self.assertFalse(self.schedule.can_book(3))
+
+    def test_payment_converts_the_hold(self):
+        booking = self.create_booking()
+        inventory.hold_seats(booking, 2)
+        self.assertTrue(inventory.confirm_booking_seats(booking, 2))
+        self.schedule.refresh_from_db()
+        self.assertEqual((self.schedule.available_seats, self.schedule.held_seats), (48, 0))
+        self.assertEqual(booking.seat_holds.get().status, SeatHold.Status.CONVERTED)
+        self.assertEqual(self.search_row_seats(), 48)
+
+    def test_direct_sale_is_recorded_on_every_leg(self):
+        return_schedule = Schedule.objects.get(route=self.return_route)
+        booking = self.create_booking()
+        Booking.objects.filter(pk=booking.pk).update(return_schedule=return_schedule)
+        booking.refresh_from_db()
+        self.assertTrue(inventory.confirm_booking_seats(booking, 2))
+        self.assertEqual(set(booking.seat_holds.values_list('schedule_id', 'status')),
+                         {(self.schedule.pk, SeatHold.Status.CONVERTED), (return_schedule.pk, SeatHold.Status.CONVERTED)})
+        self.assertEqual(inventory.sold_legs(booking), {self.schedule.pk, return_schedule.pk})
+
+        self.assertTrue(inventory.release_booking_seats(booking, 2))
+        self.assertEqual((inventory.available_seats(self.schedule.pk), inventory.available_seats(return_schedule.pk)), (50, 50))
+
+    def test_booking_confirmed_before_holds_gives_back_the_outbound_leg(self):
+        return_schedule = Schedule.objects.get(route=self.return_route)
+        booking = self.create_booking()
+        Booking.objects.filter(pk=booking.pk).update(return_schedule=return_schedule)
+        booking.refresh_from_db()
+        # Only the outbound seats were taken, with no SeatHold rows
+        inventory.reserve_seats(self.schedule.pk, 2)
+        self.assertEqual(inventory.sold_legs(booking), {self.schedule.pk})
+        self.assertTrue(inventory.release_booking_seats(booking, 2))
+        self.assertEqual((inventory.available_seats(self.schedule.pk), inventory.available_seats(return_schedule.pk)), (50, 50))
+
+    def test_sweeper_releases_expired_holds_only(self):
+        expired = self.create_booking()
+        inventory.hold_seats(expired, 5)
+        expired.seat_holds.update(expires_at=timezone.now() - timedelta(minutes=1))
+        inventory.hold_seats(self.create_booking(), 3)
+        self.assertEqual(inventory.release_expired_holds(), 1)
+        self.assertEqual(expired.seat_holds.get().status, SeatHold.Status.RELEASED)
+        self.assertEqual(inventory.available_seats(self.schedule.pk), 47)
+        # A late payment on the swept booking sells the seats directly
+        self.assertTrue(inventory.confirm_booking_seats(expired, 5))
+        self.assertEqual(inventory.available_seats(self.schedule.pk), 42)
+
+    def test_wallet_payment_for_sold_out_flight_is_not_charged(self):
+        booking = self.create_booking()
+        wallet = fund_cash_wallet(self.user, Decimal('20000.00'))
+        self.assertTrue(inventory.reserve_seats(self.schedule.pk, 50))
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('payment', args=[booking.pk]), {'payment_method': 'cash_balance'})
+        self.assertRedirects(response, reverse('payment', args=[booking.pk]), fetch_redirect_response=False)
+        wallet.refresh_from_db()
+        self.assertEqual(wallet.balance, Decimal('20000.00'))
+        self.assertFalse(wallet.transactions.exists())
+        booking.refresh_from_db()
+        self.assertEqual((booking.status, booking.payment_status),
+                         (Booking.Status.PENDING, Booking.PaymentStatus.PENDING))
+
+    def test_deleting_a_pending_booking_frees_its_hold(self):
+        booking = self.create_booking()
+        inventory.hold_seats(booking, 4)
+        booking.delete()
+        self.assertEqual(inventory.available_seats(self.schedule.pk), 50)
+
+
+class StubGatewayHandler(BaseHTTPRequestHandler):
+    """Plays back the stub server's queued (status, body, delay) replies"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        form = {key: values[0] for key, values in parse_qs(self.rfile.read(length).decode()).items()}
+        self.server.requests.append((self.client_address, form))
+        if self.path.endswith('/status'):
+            self.reply(*self.status_reply(form['txnid']))
+            return
+        status, body, delay = self.server.replies.pop(0) if self.server.replies else (200, {'status': 1, 'data': 'abc123'}, 0)
+        if delay:
+            threading.Event().wait(delay)
+        self.reply(status, body)
+
+    def status_reply(self, txnid):
+        """Status API: the attempt queued in server.statuses, or not found"""
+        attempt = self.server.statuses.get(txnid)
+        if attempt is None:
+            return 200, {'status': False, 'msg': 'Transaction not found'}
+        return 200, {'status': True, 'msg': [dict(attempt, txnid=txnid)]}
+
+    def reply(self, status, body):
+        payload = json.dumps(body).encode()
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        except ConnectionError:
+            pass  # the client gave up (read timeout)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubGatewayMixin:
+    """Runs a local stub of the Easebuzz API and a client pointed at it"""
+
+    def start_stub_gateway(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubGatewayHandler)
+        self.server.requests = []
+        self.server.replies = []
+        self.server.statuses = {}
+        thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        url = f'http://127.0.0.1:{self.server.server_port}'
+        return EasebuzzClient(
+            key='KEY', salt='SALT', payment_url=f'{url}/payment/initiateLink', status_url=f'{url}/payment/status',
+            pay_base_url=f'{url}/pay/', refund_url=f'{url}/transaction/v2/refund', connect_timeout=1, read_timeout=0.5, max_retries=2, backoff=0,
+            breaker=CircuitBreaker(threshold=2, reset_timeout=60),
+        )
+
+
+class EasebuzzClientTests(StubGatewayMixin, TestCase):
+
+    def setUp(self):
+        self.client = self.start_stub_gateway()
+
+    def payment(self, txnid='TXN_1'):
+        return {'txnid': txnid, 'amount': '500.00', 'productinfo': 'Test', 'firstname': 'Agent',
+                'email': 'agent@example.com', 'phone': '9999999999', 'surl': 'http://x/s', 'furl': 'http://x/f'}
+
+    def test_initiation_reuses_the_connection(self):
+        url = self.client.initiate_payment(self.payment('TXN_1'))
+        self.client.initiate_payment(self.payment('TXN_2'))
+        self.assertEqual(url, f'http://127.0.0.1:{self.server.server_port}/pay/abc123')
+        (first_peer, form), (second_peer, _) = self.server.requests
+        self.assertEqual(first_peer, second_peer)
+        self.assertEqual(form['key'], 'KEY')
+        self.assertEqual(len(form['hash']), 128)
+        self.assertEqual(self.client.metrics.snapshot()['calls'], 2)
+
+    def test_gateway_errors_are_retried(self):
+        self.server.replies = [(503, {}, 0), (502, {}, 0), (200, {'status': 1, 'data': 'https://pay/xyz'}, 0)]
+        self.assertEqual(self.client.initiate_payment(self.payment()), 'https://pay/xyz')
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_rejected_initiation_raises(self):
+        self.server.replies = [(200, {'status': 0, 'error_desc': 'Invalid amount'}, 0)]
+        with self.assertRaisesMessage(EasebuzzError, 'Invalid amount'):
+            self.client.initiate_payment(self.payment())
+
+    def test_slow_gateway_times_out_and_opens_the_circuit(self):
+        self.server.replies = [(200, {}, 1), (200, {}, 1)]
+        for i in range(2):
+            with self.assertRaises(EasebuzzError):
+                self.client.initiate_payment(self.payment())
+        # A read timeout is never re-sent
+        self.assertEqual(len(self.server.requests), 2)
+        with self.assertRaises(CircuitOpenError):
+            self.client.initiate_payment(self.payment())
+        self.assertEqual(len(self.server.requests), 2)
+        metrics = self.client.metrics.snapshot()
+        self.assertEqual((metrics['errors'], metrics['short_circuited']), (2, 1))
+
+
+    def test_unexpected_error_ends_the_half_open_trial(self):
+        class BrokenForm(dict):
+            def items(self):
+                raise RuntimeError('cannot encode form')
+
+        now = [0]
+        self.client.breaker = CircuitBreaker(threshold=1, reset_timeout=10, clock=lambda: now[0])
+        self.client.breaker.record_failure()
+        now[0] = 10
+        with self.assertRaises(RuntimeError):
+            self.client.post(self.client.payment_url, BrokenForm(key='KEY'))
+        # The next call is the new trial instead of being short-circuited
+        self.client.initiate_payment(self.payment())
+        self.assertEqual(self.client.breaker.state, CircuitBreaker.CLOSED)
+
+
+class PaymentReconciliationTests(StubGatewayMixin, FlightSearchTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.gateway = self.start_stub_gateway()
+        self.schedule = Schedule.objects.get(route=self.outbound_route)
+        self.user = get_user_model().objects.create_user(email='agent@example.com', password='pass12345')
+
+    def start_payment(self, txnid, gateway_status=None, amount='12500.00', minutes_ago=30):
+        booking = Booking.objects.create(
+            user=self.user,
+            schedule=self.schedule,
+            contact_email=self.user.email,
+            base_fare=Decimal('12500.00'),
+            total_amount=Decimal('12500.00'),
+        )
+        inventory.hold_seats(booking, 1)
+        payment_txn = PaymentTransaction.start(txnid, booking, booking.total_amount,
+                                               PaymentTransaction.Purpose.FLIGHT_BOOKING, user=self.user)
+        PaymentTransaction.objects.filter(pk=payment_txn.pk).update(
+            created_at=timezone.now() - timedelta(minutes=minutes_ago))
+        if gateway_status:
+            self.server.statuses[txnid] = {'status': gateway_status, 'amount': amount}
+        return booking
+
+    def test_stale_transactions_are_settled_from_the_status_api(self):
+        paid = self.start_payment('TXN_PAID', 'success')
+        dropped = self.start_payment('TXN_DROPPED', 'userCancelled')
+        self.start_payment('TXN_WAITING', 'pending')
+        self.start_payment('TXN_UNKNOWN')
+        self.start_payment('TXN_FRESH', 'success', minutes_ago=1)
+
+        report = payments.reconcile(older_than=15, workers=4, batch_size=2, client=self.gateway)
+        self.assertEqual(
+            (report.checked, report.settled, report.failed, report.pending, report.unknown, report.errors),
+            (4, 1, 1, 1, 1, 0),
+        )
+        paid.refresh_from_db()
+        self.assertEqual((paid.status, paid.payment_status), (Booking.Status.CONFIRMED, Booking.PaymentStatus.PAID))
+        self.assertEqual(paid.seat_holds.get().status, SeatHold.Status.CONVERTED)
+        self.assertEqual(PaymentTransaction.for_txnid('TXN_DROPPED').gateway_status, 'usercancelled')
+        dropped.refresh_from_db()
+        self.assertEqual(dropped.status, Booking.Status.PENDING)
+        self.assertEqual(PaymentTransaction.for_txnid('TXN_FRESH').status, PaymentTransaction.Status.INITIATED)
+
+        # Settled rows are not checked again
+        self.assertEqual(payments.reconcile(older_than=15, client=self.gateway).checked, 2)
+
+    def test_amount_mismatch_is_not_fulfilled(self):
+        booking = self.start_payment('TXN_SHORT', 'success', amount='1.00')
+        report = payments.reconcile(client=self.gateway)
+        self.assertEqual(report.failed, 1)
+        self.assertEqual(PaymentTransaction.for_txnid('TXN_SHORT').gateway_status, payments.AMOUNT_MISMATCH)
+        booking.refresh_from_db()
+        self.assertEqual(booking.payment_status, Booking.PaymentStatus.PENDING)
+
+    def test_sold_out_leg_rolls_back_and_refunds(self):
+        return_schedule = Schedule.objects.get(route=self.return_route)
+        booking = self.start_payment('TXN_LATE')
+        Booking.objects.filter(pk=booking.pk).update(return_schedule=return_schedule)
+        booking.refresh_from_db()
+        self.server.statuses['TXN_LATE'] = {'status': 'success', 'amount': '12500.00', 'easepayid': 'E123'}
+        # The return flight sold out while the customer was paying
+        self.assertTrue(inventory.reserve_seats(return_schedule.pk, 50))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            report = payments.reconcile(client=self.gateway)
+        self.assertEqual((report.settled, report.errors), (1, 0))
+        booking.refresh_from_db()
+        self.assertEqual((booking.status, booking.payment_status),
+                         (Booking.Status.CANCELLED, Booking.PaymentStatus.REFUNDED))
+        # The outbound hold was neither sold nor kept
+        self.assertEqual(inventory.available_seats(self.schedule.pk), 50)
+        self.assertEqual(booking.seat_holds.get().status, SeatHold.Status.RELEASED)
+        _, refund = self.server.requests[-1]
+        self.assertEqual((refund['merchant_refund_id'], refund['easebuzz_id'], refund['refund_amount']),
+                         ('RF_TXN_LATE', 'E123', '12500.00'))
+
+
+def sign_response(data):
+    """Gateway response `data` with the reverse hash Easebuzz signs it with (salt 'SALT')"""
+    hash_string = '|'.join(['SALT'] + [data.get(key, '') for key in RESPONSE_HASH_SEQUENCE])
+    return dict(data, hash=hashlib.sha512(hash_string.encode()).hexdigest())
+
+
+@override_settings(EASEBUZZ_MERCHANT_KEY='KEY', EASEBUZZ_MERCHANT_SALT='SALT')
+class PaymentWebhookTests(FlightSearchTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = get_user_model().objects.create_user(email='agent@example.com', password='pass12345')
+        self.booking = Booking.objects.create(
+            user=self.user,
+            schedule=Schedule.objects.get(route=self.outbound_route),
+            contact_email=self.user.email,
+            base_fare=Decimal('12500.00'),
+            total_amount=Decimal('12500.00'),
+        )
+        inventory.hold_seats(self.booking, 1)
+        PaymentTransaction.start('TXN_HOOK', self.booking, self.booking.total_amount,
+                                 PaymentTransaction.Purpose.FLIGHT_BOOKING, user=self.user)
+
+    def post_webhook(self, status='success', amount='12500.00', txnid='TXN_HOOK', tamper=False):
+        data = {'key': 'KEY', 'txnid': txnid, 'amount': amount, 'status': status, 'email': self.user.email,
+                'firstname': 'Agent', 'productinfo': 'Flight Booking'}
+        data = sign_response(data)
+        if tamper:
+            data['amount'] = '1.00'
+        return self.client.post(reverse('payment_webhook'), data)
+
+    def test_webhook_only_stores_the_event(self):
+        with self.assertNumQueries(1):
+            response = self.post_webhook()
+        self.assertEqual(response.status_code, 200)
+        event = PaymentWebhookEvent.objects.get()
+        self.assertEqual((event.txnid, event.gateway_status, event.status), ('TXN_HOOK', 'success', 'pending'))
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, Booking.Status.PENDING)
+
+    def test_tampered_payload_is_rejected(self):
+        self.assertEqual(self.post_webhook(tamper=True).status_code, 403)
+        self.assertFalse(PaymentWebhookEvent.objects.exists())
+
+    def test_retried_deliveries_confirm_once(self):
+        for i in range(3):
+            self.post_webhook()
+        self.post_webhook(status='failure')
+        self.post_webhook(txnid='TXN_OTHER')
+
+        counts = payments.process_webhook_events(batch_size=2)
+        self.assertEqual(counts, {'processed': 4, 'ignored': 1})
+        outcomes = list(PaymentWebhookEvent.objects.order_by('pk').values_list('outcome', flat=True))
+        self.assertEqual(outcomes, [payments.SETTLED, payments.ALREADY_SETTLED, payments.ALREADY_SETTLED,
+                                    payments.FAILED, 'unknown_txnid'])
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, Booking.Status.CONFIRMED)
+        self.assertEqual(PaymentTransaction.for_txnid('TXN_HOOK').status, PaymentTransaction.Status.SUCCESS)
+        self.assertEqual(inventory.available_seats(self.booking.schedule_id), 49)
+        self.assertEqual(payments.process_webhook_events(), {})
+
+
+@override_settings(EASEBUZZ_MERCHANT_KEY='KEY', EASEBUZZ_MERCHANT_SALT='SALT')
+class PaymentCallbackTests(StubGatewayMixin, FlightSearchTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = get_user_model().objects.create_user(email='agent@example.com', password='pass12345')
+        self.wallet = CashBalanceWallet.objects.get(user=self.user)
+
+    def create_booking(self, **fields):
+        booking = Booking.objects.create(
+            user=self.user,
+            schedule=Schedule.objects.get(route=self.outbound_route),
+            contact_email=self.user.email,
+            base_fare=Decimal('12500.00'),
+            total_amount=Decimal('12500.00'),
+            **fields,
+        )
+        inventory.hold_seats(booking, 1)
+        return booking
+
+    def create_visa(self, **fields):
+        return VisaBooking.objects.create(user=self.user, full_name='Agent', email=self.user.email, phone='9876543210',
+                                          passport_number='P1234567', country='dubai', duration='30 Days',
+                                          price=Decimal('10700.00'), **fields)
+
+    def callback(self, name, txnid, amount, **extra):
+        data = {'key': 'KEY', 'txnid': txnid, 'amount': amount, 'status': 'success', 'email': self.user.email,
+                'firstname': 'Agent', 'productinfo': 'Payment', **extra}
+        return self.client.post(reverse(name), sign_response(data))
+
+    def test_flight_callback_resolves_the_booking_through_the_ledger(self):
+        booking = self.create_booking()
+        PaymentTransaction.start('TXN_FLIGHT', booking, booking.total_amount,
+                                 PaymentTransaction.Purpose.FLIGHT_BOOKING, user=self.user)
+
+        response = self.callback('payment_success', 'TXN_FLIGHT', '12500.00')
+        self.assertRedirects(response, reverse('booking_confirmation', kwargs={'booking_id': booking.pk}),
+                             fetch_redirect_response=False)
+        booking.refresh_from_db()
+        self.assertEqual((booking.status, booking.payment_status), (Booking.Status.CONFIRMED, Booking.PaymentStatus.PAID))
+        self.assertEqual(PaymentTransaction.for_txnid('TXN_FLIGHT').status, PaymentTransaction.Status.SUCCESS)
+
+    def test_unknown_txnid_is_rejected(self):
+        # The txnid is only in the booking notes (pre-ledger); the callback does not scan for it
+        booking = self.create_booking(notes=json.dumps({'easebuzz_txnid': 'TXN_NOTES'}))
+
+        response = self.callback('payment_success', 'TXN_NOTES', '12500.00')
+        self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+        booking.refresh_from_db()
+        self.assertEqual(booking.payment_status, Booking.PaymentStatus.PENDING)
+        self.assertFalse(PaymentTransaction.objects.exists())
+
+    def test_visa_callback_resolves_the_application_through_the_ledger(self):
+        visa = self.create_visa(payment_id='VISATXN_OLD')
+        PaymentTransaction.start('VISATXN_NEW', visa, visa.price, PaymentTransaction.Purpose.VISA, user=self.user)
+
+        # A txnid matching the stale payment_id is not looked up there
+        response = self.callback('payment_success', 'VISATXN_OLD', '10700.00')
+        self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+
+        response = self.callback('payment_success', 'VISATXN_NEW', '10700.00')
+        self.assertRedirects(response, reverse('visa_thanks', kwargs={'booking_id': visa.reference_id}),
+                             fetch_redirect_response=False)
+        visa.refresh_from_db()
+        self.assertEqual(visa.payment_status, VisaBooking.PaymentStatus.PAID)
+
+    def test_wallet_recharge_callback_credits_once(self):
+        PaymentTransaction.start('WALLET_TXN', self.wallet, Decimal('500.00'),
+                                 PaymentTransaction.Purpose.WALLET_RECHARGE, user=self.user)
+        self.client.force_login(self.user)
+
+        for i in range(2):
+            response = self.callback('wallet_recharge', 'WALLET_TXN', '500.00')
+            self.assertRedirects(response, reverse('wallet_history'), fetch_redirect_response=False)
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, Decimal('500.00'))
+        self.assertEqual(self.wallet.transactions.filter(transaction_type='recharge').count(), 1)
+
+    def test_wallet_recharge_callback_for_another_wallet_is_rejected(self):
+        other = get_user_model().objects.create_user(email='other@example.com', password='pass12345')
+        other_wallet = CashBalanceWallet.objects.get(user=other)
+        PaymentTransaction.start('WALLET_OTHER', other_wallet, Decimal('500.00'),
+                                 PaymentTransaction.Purpose.WALLET_RECHARGE, user=other)
+        self.client.force_login(self.user)
+
+        response = self.callback('wallet_recharge', 'WALLET_OTHER', '500.00')
+        self.assertRedirects(response, reverse('wallet_recharge'), fetch_redirect_response=False)
+        self.assertEqual(PaymentTransaction.for_txnid('WALLET_OTHER').status, PaymentTransaction.Status.INITIATED)
+        other_wallet.refresh_from_db()
+        self.wallet.refresh_from_db()
+        self.assertEqual((self.wallet.balance, other_wallet.balance), (Decimal('0.00'), Decimal('0.00')))
+
+    def test_visa_application_records_its_txnid_in_the_ledger(self):
+        self.start_stub_gateway()
+        url = f'http://127.0.0.1:{self.server.server_port}'
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root, EASEBUZZ_PAYMENT_URL=f'{url}/payment/initiateLink',
+                                              EASEBUZZ_PAY_BASE_URL=f'{url}/pay/')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        easebuzz_client.reset_client()
+        self.addCleanup(easebuzz_client.reset_client)
+        self.client.force_login(self.user)
+
+        documents = {name: ContentFile(b'scan', name=f'{name}.jpg')
+                     for name in ('passport_front', 'passport_back', 'passport_size_photo')}
+        response = self.client.post(f"{reverse('apply_visa')}?country=dubai", {
+            'name': 'Agent', 'email': self.user.email, 'phone': '9876543210', 'duration': '30', 'price': '10700',
+            'travel_date': '2026-12-01', 'address': 'Lucknow', 'payment_method': 'easebuzz', **documents,
+        })
+        self.assertRedirects(response, f'{url}/pay/abc123', fetch_redirect_response=False)
+        visa = VisaBooking.objects.get()
+        payment_txn = PaymentTransaction.for_txnid(visa.payment_id)
+        self.assertEqual((payment_txn.purpose, payment_txn.target, payment_txn.amount),
+                         (PaymentTransaction.Purpose.VISA, visa, Decimal('10700.00')))
+        _, form = self.server.requests[-1]
+        self.assertEqual((form['txnid'], form['udf2']), (visa.payment_id, visa.reference_id))
+
+    def test_migration_backfills_the_ledger(self):
+        paid = self.create_booking(notes=json.dumps({'easebuzz_txnid': 'TXN_LEGACY'}),
+                                   payment_status=Booking.PaymentStatus.PAID)
+        self.create_booking(notes='Window seat please')
+        visa = self.create_visa(payment_id='VISATXN_7_1700000000')
+        CashBalanceTransaction.objects.create(cash_balance_wallet=self.wallet, transaction_type='recharge',
+                                              amount=Decimal('500.00'), balance_after=Decimal('500.00'),
+                                              reference_id='WALLET_7_1700000000')
+
+        backfill = import_module('travels.migrations.0049_paymenttransaction').backfill_payment_transactions
+        backfill(django_apps, None)
+        rows = {row.txnid: row for row in PaymentTransaction.objects.all()}
+        self.assertEqual(set(rows), {'TXN_LEGACY', 'VISATXN_7_1700000000', 'WALLET_7_1700000000'})
+        self.assertEqual((rows['TXN_LEGACY'].target, rows['TXN_LEGACY'].status, rows['TXN_LEGACY'].amount),
+                         (paid, PaymentTransaction.Status.SUCCESS, Decimal('12500.00')))
+        self.assertEqual((rows['VISATXN_7_1700000000'].target, rows['VISATXN_7_1700000000'].status),
+                         (visa, PaymentTransaction.Status.INITIATED))
+        self.assertEqual((rows['WALLET_7_1700000000'].target, rows['WALLET_7_1700000000'].purpose),
+                         (self.wallet, PaymentTransaction.Purpose.WALLET_RECHARGE))
+
+        # Running it again adds nothing
+        backfill(django_apps, None)
+        self.assertEqual(PaymentTransaction.objects.count(), 3)
+
+
+def run_in_parallel(workers, func):
+    """Call func(i) from `workers` threads released at once; returns (results, errors)"""
+    barrier = threading.Barrier(workers)
+    results = []
+    errors = []
+
+    def call(i):
+        try:
+            barrier.wait()
+            results.append(func(i))
+        except Exception as exc:
+            errors.append(exc)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+def fund_cash_wallet(user, balance):
+    """The user's cash balance wallet (created with the account) set to `balance`"""
+    CashBalanceWallet.objects.filter(user=user).update(balance=balance)
+    return CashBalanceWallet.objects.get(user=user)
+
+
+def legacy_deduct(wallet_id, amount):
+    """Read-modify-write wallet debit as it was done before the ledger service"""
+    wallet = CashBalanceWallet.objects.get(pk=wallet_id)
+    if amount > wallet.balance:
+        raise ValidationError('Insufficient cash balance')
+    wallet.balance -= amount
+    wallet.save()
+    CashBalanceTransaction.objects.create(cash_balance_wallet=wallet, transaction_type='payment',
+                                          amount=-amount, balance_after=wallet.balance)
+    return wallet.balance
+
+
+class WalletLedgerTests(TransactionTestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='agent@example.com', password='pass12345')
+        self.wallet = fund_cash_wallet(self.user, Decimal('20.00'))
+
+    def debit_one(self, i):
+        return wallet_ledger.debit(CashBalanceWallet(pk=self.wallet.pk), Decimal('1.00'), reference_id=f'PAY{i}')
+
+    def test_parallel_debits_never_overdraw(self):
+        results, errors = run_in_parallel(40, self.debit_one)
+        self.assertEqual(len(results), 20)
+        self.assertEqual(len(errors), 20)
+        self.assertTrue(all(isinstance(exc, ValidationError) for exc in errors))
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, Decimal('0.00'))
+        # Every history row records the balance its own debit produced
+        balances_after = sorted(self.wallet.transactions.values_list('balance_after', flat=True))
+        self.assertEqual(balances_after, [Decimal(n) for n in range(20)])
+
+    def test_model_methods_use_the_ledger(self):
+        self.assertEqual(self.wallet.deduct_balance(Decimal('5.00')), Decimal('15.00'))
+        self.assertEqual(self.wallet.add_balance(Decimal('2.50')), Decimal('17.50'))
+        with self.assertRaisesMessage(ValidationError, 'Insufficient cash balance'):
+            self.wallet.deduct_balance(Decimal('100.00'))
+        self.assertEqual(self.wallet.transactions.count(), 2)
+
+    def test_od_wallet_rules(self):
+        od_wallet = ODWallet.objects.create(user=self.user, max_balance=Decimal('100.00'))
+        od_wallet.add_balance(Decimal('60.00'))
+        self.assertEqual(od_wallet.initial_balance, Decimal('60.00'))
+        with self.assertRaisesMessage(ValidationError, 'maximum limit'):
+            od_wallet.add_balance(Decimal('50.00'))
+        with self.assertRaisesMessage(ValidationError, 'not active'):
+            od_wallet.deduct_balance(Decimal('10.00'))
+
+    def test_expire_od_wallets_in_chunks(self):
+        users = [get_user_model().objects.create_user(email=f'od{i}@example.com', password='pass12345') for i in range(4)]
+        wallets = []
+        for user, balance in zip(users, ('60.00', '0', '25.00', '30.00')):
+            wallet = ODWallet.objects.create(user=user, is_active=True, max_balance=Decimal('100.00'))
+            if Decimal(balance):
+                wallet.add_balance(Decimal(balance))
+            wallets.append(wallet)
+        wallets[0].deduct_balance(Decimal('20.00'))
+        past = timezone.now() - timedelta(days=1)
+        ODWallet.objects.filter(pk__in=[w.pk for w in wallets[:3]]).update(expires_at=past)
+        ODWallet.objects.filter(pk=wallets[3].pk).update(expires_at=timezone.now() + timedelta(days=1))
+        with self.assertRaisesMessage(ValidationError, 'expired'):
+            wallets[0].deduct_balance(Decimal('1.00'))
+
+        report = wallet_ledger.expire_od_wallets(batch_size=2, dry_run=True)
+        self.assertEqual((report.processed, report.deducted, report.amount), (3, 2, Decimal('65.00')))
+        self.assertEqual(ODWallet.objects.filter(is_active=True).count(), 4)
+
+        chunks = []
+        report = wallet_ledger.expire_od_wallets(batch_size=2, progress=lambda r, done, total: chunks.append((done, total)))
+        self.assertEqual(chunks, [(2, 3), (3, 3)])
+        self.assertEqual((report.processed, report.deducted, report.deactivated), (3, 2, 1))
+        expired = ODWallet.objects.get(pk=wallets[0].pk)
+        self.assertFalse(expired.is_active)
+        self.assertEqual(expired.balance, Decimal('-20.00'))
+        self.assertEqual((expired.debit_total, expired.txn_count), (Decimal('60.00'), 3))
+        self.assertEqual(expired.last_txn.reference_id, 'EXPIRY_AUTO')
+        self.assertTrue(ODWallet.objects.get(pk=wallets[3].pk).is_active)
+
+        # A second run with the watermark finds nothing left to do
+        self.assertEqual(wallet_ledger.expire_od_wallets(since=report.watermark).processed, 0)
+
+    def test_process_expiry_settles_one_wallet(self):
+        od_wallet = ODWallet.objects.create(user=self.user, is_active=True, max_balance=Decimal('100.00'))
+        od_wallet.add_balance(Decimal('50.00'))
+        od_wallet.deduct_balance(Decimal('15.00'))
+        self.assertFalse(od_wallet.process_expiry())
+
+        ODWallet.objects.filter(pk=od_wallet.pk).update(expires_at=timezone.now() - timedelta(days=1))
+        od_wallet.refresh_from_db()
+        # Debits are refused as soon as the wallet expires, before it is settled
+        with self.assertRaisesMessage(ValidationError, 'expired'):
+            od_wallet.deduct_balance(Decimal('1.00'))
+        self.assertTrue(od_wallet.process_expiry())
+        self.assertEqual((od_wallet.balance, od_wallet.is_active), (Decimal('-15.00'), False))
+        od_wallet.refresh_from_db()
+        self.assertEqual((od_wallet.balance, od_wallet.debit_total, od_wallet.txn_count),
+                         (Decimal('-15.00'), Decimal('50.00'), 3))
+        self.assertFalse(od_wallet.process_expiry())
+
+    def test_batch_is_all_or_nothing(self):
+        other = fund_cash_wallet(
+            get_user_model().objects.create_user(email='other@example.com', password='pass12345'), Decimal('5.00'))
+        postings = [
+            wallet_ledger.Posting(self.wallet, Decimal('-10.00'), 'payment', reference_id='BULK1'),
+            wallet_ledger.Posting(other, Decimal('-10.00'), 'payment', reference_id='BULK2'),
+        ]
+        with self.assertRaises(ValidationError):
+            wallet_ledger.post_batch(postings)
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, Decimal('20.00'))
+        self.assertFalse(CashBalanceTransaction.objects.exists())
+        with self.assertRaisesMessage(ValidationError, 'greater than zero'):
+            wallet_ledger.post_batch([wallet_ledger.Posting(self.wallet, Decimal('0'), 'payment')])
+
+        postings[1] = wallet_ledger.Posting(other, Decimal('-5.00'), 'payment', reference_id='BULK2')
+        # One update + read per posting, one bulk insert, one totals update per wallet, in a single transaction
+        with self.assertNumQueries(9):
+            self.assertEqual(wallet_ledger.post_batch(postings), [Decimal('10.00'), Decimal('0.00')])
+        self.assertEqual(CashBalanceTransaction.objects.count(), 2)
+
+    def test_running_totals_follow_every_posting(self):
+        self.wallet.add_balance(Decimal('30.00'))
+        self.wallet.deduct_balance(Decimal('12.50'))
+        wallet_ledger.post_batch([
+            wallet_ledger.Posting(self.wallet, Decimal('-2.50'), 'payment'),
+            wallet_ledger.Posting(self.wallet, Decimal('5.00'), 'refund'),
+        ])
+        # A save from a stale instance must not overwrite the totals
+        stale = CashBalanceWallet.objects.get(pk=self.wallet.pk)
+        self.wallet.add_balance(Decimal('1.00'))
+        stale.save()
+
+        expected = (Decimal('36.00'), Decimal('15.00'), 5, self.wallet.transactions.first().pk)
+        wallet = CashBalanceWallet.objects.get(pk=self.wallet.pk)
+        self.assertEqual((wallet.credit_total, wallet.debit_total, wallet.txn_count, wallet.last_txn_id), expected)
+
+        CashBalanceWallet.objects.filter(pk=wallet.pk).update(credit_total=0, debit_total=0, txn_count=0, last_txn_id=None)
+        wallet_ledger.rebuild_aggregates()
+        wallet.refresh_from_db()
+        self.assertEqual((wallet.credit_total, wallet.debit_total, wallet.txn_count, wallet.last_txn_id), expected)
+
+    def test_benchmark_against_read_modify_write(self):
+        """40 concurrent single-unit debits on a 20-unit wallet, legacy code vs ledger"""
+        timings = {}
+        for name, debit in (('legacy', lambda i: legacy_deduct(self.wallet.pk, Decimal('1.00'))),
+                            ('ledger', self.debit_one)):
+            CashBalanceTransaction.objects.all().delete()
+            CashBalanceWallet.objects.filter(pk=self.wallet.pk).update(balance=Decimal('20.00'))
+            started = clock.perf_counter()
+            results, errors = run_in_parallel(40, debit)
+            elapsed = clock.perf_counter() - started
+            self.wallet.refresh_from_db()
+            timings[name] = (elapsed, len(results), self.wallet.balance, self.wallet.transactions.count())
+
+        # The ledger never accepts more than the wallet holds and never loses a decrement
+        elapsed, succeeded, balance, rows = timings['ledger']
+        self.assertEqual((succeeded, balance, rows), (20, Decimal('0.00'), 20))
+
+
+class WalletStatementTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='agent@example.com', password='pass12345')
+        self.wallet = self.user.cash_balance_wallet
+        for i in range(7):
+            self.wallet.add_balance(Decimal('10.00'), description=f'Top-up {i}', reference_id=f'REF{i}')
+        # Several rows share a timestamp so the cursor has to break ties on id
+        CashBalanceTransaction.objects.filter(cash_balance_wallet=self.wallet, reference_id__in=['REF2', 'REF3', 'REF4']).update(
+            created_at=timezone.now() - timedelta(hours=1))
+        self.client.force_login(self.user)
+
+    def test_cursor_pages_cover_every_row_once(self):
+        seen = []
+        cursor = None
+        while True:
+            page = statements.history_page(self.wallet, cursor, page_size=3)
+            seen.extend(txn.pk for txn in page)
+            cursor = page.next_cursor
+            if not cursor:
+                break
+        expected = list(self.wallet.transactions.order_by('-created_at', '-pk').values_list('pk', flat=True))
+        self.assertEqual(seen, expected)
+        self.assertIsNone(pagination.decode_cursor('not-a-cursor'))
+
+    def test_history_page_is_one_query(self):
+        first = statements.history_page(self.wallet, page_size=3)
+        with self.assertNumQueries(1):
+            statements.history_page(self.wallet, first.next_cursor, page_size=3)
+
+    def test_csv_statement_streams(self):
+        response = self.client.get(reverse('wallet_statement'), {'format': 'csv'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], ','.join(statements.HEADER))
+        self.assertEqual(len(lines), 8)
+        self.assertIn('Top-up 2', lines[1])  # oldest first
+
+    def test_xlsx_statement_is_a_workbook(self):
+        response = self.client.get(reverse('wallet_statement'), {'format': 'xlsx'})
+        self.assertEqual(response.status_code, 200)
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertIsNone(archive.testzip())
+        sheet = archive.read('xl/worksheets/sheet1.xml').decode()
+        self.assertEqual(sheet.count('<row>'), 8)
+        self.assertIn('REF6', sheet)
+
+    def test_statement_rejects_bad_input(self):
+        url = reverse('wallet_statement')
+        self.assertEqual(self.client.get(url, {'format': 'pdf'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'from': '2026-02-30'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'from': '2026-03-02', 'to': '2026-03-01'}).status_code, 400)
+
+
+class WalletContextTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='agent@example.com', password='pass12345')
+        self.request = RequestFactory().get('/')
+        self.request.user = self.user
+
+    def test_every_new_user_gets_a_cash_wallet(self):
+        self.assertEqual(self.user.cash_balance_wallet.balance, Decimal('0'))
+        admin = get_user_model().objects.create_superuser(email='admin@example.com', password='pass12345')
+        self.assertTrue(CashBalanceWallet.objects.filter(user=admin).exists())
+
+    def test_wallets_load_only_when_read_and_once_per_request(self):
+        # A user from before wallets were created with the account
+        CashBalanceWallet.objects.filter(user=self.user).delete()
+        with self.assertNumQueries(0):
+            context = wallet_context(self.request)
+        with self.assertNumQueries(2):
+            self.assertEqual(context['cash_balance'](), Decimal('0'))
+            self.assertFalse(context['has_od_wallet_access']())
+            self.assertEqual(context['od_wallet_balance'](), Decimal('0'))
+        # Views reuse the same snapshot
+        with self.assertNumQueries(0):
+            self.assertIs(get_wallet_snapshot(self.request), get_wallet_snapshot(self.request))
+            self.assertIsNone(get_wallet_snapshot(self.request).od_wallet)
+        # Reading never creates a wallet
+        self.assertFalse(CashBalanceWallet.objects.filter(user=self.user).exists())
+
+    def test_template_only_queries_what_it_renders(self):
+        fund_cash_wallet(self.user, Decimal('12.50'))
+        template = engines['django'].from_string('{{ cash_balance|floatformat:2 }}{% if od_wallet_days_remaining is not None %}!{% endif %}')
+        with self.assertNumQueries(2):
+            self.assertEqual(template.render(request=self.request), '12.50')
+        plain = engines['django'].from_string('no wallets here')
+        request = RequestFactory().get('/')
+        request.user = self.user
+        with self.assertNumQueries(0):
+            plain.render(request=request)
+
+
+class AirlineTests(FlightSearchTestMixin, TestCase):
+
+    def test_resolve_by_exact_name_or_alias(self):
+        self.assertEqual(Airline.resolve('IndiGo').code, '6E')
+        self.assertEqual(Airline.resolve('  Indigo   AIRLINES ').code, '6E')
+        self.assertEqual(Airline.resolve('FZ').code, 'FZ')
+
+    def test_resolve_by_whole_word_longest_first(self):
+        self.assertEqual(Airline.resolve('Air India Express Charter').code, 'IX')
+        self.assertEqual(Airline.resolve('Charter by Air India').code, 'AI')
+        # Part of a word is not a match
+        self.assertIsNone(Airline.resolve('Flair Arabian Tours'))
+
+    def test_resolve_by_carrier_code_prefix(self):
+        self.assertEqual(Airline.resolve('', 'ek701').code, 'EK')
+        self.assertEqual(Airline.resolve('Unknown Charter', 'QR 123').code, 'QR')
+
+    def test_resolve_without_match(self):
+        self.assertIsNone(Airline.resolve('Unknown Charter', 'ZZ101'))
+        self.assertIsNone(Airline.resolve('', ''))
+
+    def test_route_save_links_the_airline_and_logo(self):
+        self.assertEqual(self.outbound_route.airline.code, 'IX')
+        self.assertEqual(self.outbound_route.airline_logo_url, static('images/flight-logo/air-india.png'))
+        # Without an airline name the flight number decides and fills the name in
+        route = self.create_route('Lucknow', 'Jeddah', 'SV744')
+        Route.objects.filter(pk=route.pk).update(airline_name='')
+        route.refresh_from_db()
+        route.save(update_fields=['carrier_number'])
+        route.refresh_from_db()
+        self.assertEqual((route.airline.code, route.airline_name), ('SV', 'Saudia'))
+
+    def test_airline_edits_refresh_routes(self):
+        route = self.create_route('Lucknow', 'Muscat', 'ZZ101')
+        Route.objects.filter(pk=route.pk).update(airline_name='Zed Charter')
+        with self.captureOnCommitCallbacks(execute=True):
+            zed = Airline.objects.create(code='zz', name='Zed Air', static_logo='images/zed.png')
+        route.refresh_from_db()
+        self.assertEqual((route.airline_id, route.airline_logo_url), (zed.pk, static('images/zed.png')))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            zed.static_logo = 'images/zed-new.png'
+            zed.save()
+        route.refresh_from_db()
+        self.assertEqual(route.airline_logo_url, static('images/zed-new.png'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            zed.is_active = False
+            zed.save()
+        route.refresh_from_db()
+        self.assertEqual((route.airline_id, route.airline_logo_url), (None, ''))
+
+    def test_migration_links_existing_routes(self):
+        populate_airlines = import_module('travels.migrations.0047_airline').populate_airlines
+        Route.objects.update(airline=None, airline_logo_url='')
+        Route.objects.filter(pk=self.return_route.pk).update(airline_name='Fly Dubai Airlines')
+        populate_airlines(django_apps, None)
+        self.assertEqual(
+            dict(Route.objects.values_list('carrier_number', 'airline__code')), {'TC101': 'IX', 'TC102': 'FZ'})
+        self.assertEqual(Route.objects.get(pk=self.return_route.pk).airline_logo_url,
+                         static('images/flight-logo/fly-dubai.png'))
+        # Seeding again leaves admin edits alone
+        Airline.objects.filter(code='FZ').update(name='flydubai (edited)')
+        populate_airlines(django_apps, None)
+        self.assertEqual(Airline.objects.get(code='FZ').name, 'flydubai (edited)')
+
+
+class AirportRegistryTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.airport = Airport.objects.create(city='Shravasti', code='vsv')
+
+    def test_registry_is_loaded_once(self):
+        self.assertEqual(airports.get_registry().code_for('shravasti'), 'VSV')
+        with self.assertNumQueries(0):
+            self.assertEqual(airports.get_registry().city_for('VSV'), 'Shravasti')
+
+    def test_airport_edit_invalidates_the_lookup(self):
+        self.assertEqual(airports.get_registry().code_for('Shravasti'), 'VSV')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.airport.code = 'SVX'
+            self.airport.save()
+        registry = airports.get_registry()
+        self.assertEqual((registry.code_for('Shravasti'), registry.city_for('VSV')), ('SVX', ''))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.airport.delete()
+        self.assertEqual(airports.get_registry().code_for('Shravasti'), '')
+
+
+class SalesRepDirectoryTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(email='agent@example.com', password='pass12345')
+        self.alice = SalesRepresentative.objects.create(name='Alice', phone='9000000001', display_order=1)
+        self.bob = SalesRepresentative.objects.create(name='Bob', phone='9000000002', display_order=2)
+
+    def test_warm_header_costs_no_queries(self):
+        self.assertEqual(sales_reps.for_user(self.user), [self.alice, self.bob])
+        with self.assertNumQueries(0):
+            self.assertEqual(sales_reps.for_user(self.user), [self.alice, self.bob])
+            self.assertEqual(sales_reps.for_user(AnonymousUser()), [self.alice, self.bob])
+
+    def test_rep_changes_invalidate_the_directory(self):
+        sales_reps.for_user(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bob.is_active = False
+            self.bob.save()
+        self.assertEqual(sales_reps.for_user(self.user), [self.alice])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.alice.delete()
+        self.assertEqual(sales_reps.for_user(self.user), [])
+
+    def test_profile_assignment_invalidates_the_user_entry(self):
+        self.bob.is_active = False
+        self.bob.save()
+        sales_reps.for_user(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            profile = UserProfile.objects.get(user=self.user)
+            profile.sales_representative = self.bob
+            profile.save()
+        # An explicitly assigned rep is shown even when not globally active
+        self.assertEqual(sales_reps.for_user(self.user), [self.bob])
+        with self.assertNumQueries(0):
+            sales_reps.for_user(self.user)
+
+
+class MyTripsTests(FlightSearchTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = get_user_model().objects.create_user(email='agent@example.com', password='pass12345')
+        upcoming = Schedule.objects.get(route=self.outbound_route)
+        past = self.create_schedule(self.return_route, timezone.now().date() - timedelta(days=3), '11800.00')
+        for i in range(25):
+            booking = Booking.objects.create(
+                user=self.user,
+                schedule=upcoming if i % 5 else past,
+                contact_email=self.user.email,
+                base_fare=Decimal('12500.00'),
+                total_amount=Decimal('12500.00'),
+                status=Booking.Status.CONFIRMED,
+                payment_status=Booking.PaymentStatus.PAID,
+            )
+            for name in ('Asha', 'Ravi'):
+                BookingPassenger.objects.create(
+                    booking=booking, first_name=name, last_name=f'Traveller{i}',
+                    date_of_birth=timezone.now().date() - timedelta(days=365 * 30), gender='M',
+                )
+        self.client.force_login(self.user)
+
+    def test_counts_and_pages(self):
+        response = self.client.get(reverse('my_trips'))
+        self.assertEqual(
+            (response.context['total_count'], response.context['upcoming_count'], response.context['past_count']),
+            (25, 20, 5),
+        )
+        first_page = list(response.context['bookings'])
+        self.assertEqual(len(first_page), 20)
+        rest = list(self.client.get(reverse('my_trips'), {'cursor': response.context['next_cursor']}).context['bookings'])
+        self.assertEqual(len(rest), 5)
+        self.assertEqual(len({b.pk for b in first_page + rest}), 25)
+
+        past = self.client.get(reverse('my_trips'), {'trip_type': 'past'})
+        self.assertEqual(len(past.context['bookings']), 5)
+        self.assertIsNone(past.context['next_cursor'])
+
+    def test_query_count_does_not_grow_with_bookings(self):
+        self.client.get(reverse('my_trips'))  # warm the airport registry and session
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(reverse('my_trips'))
+        for booking in Booking.objects.all():
+            booking.pk = None
+            booking.booking_reference = ''
+            booking.save()
+        with CaptureQueriesContext(connection) as large:
+            self.client.get(reverse('my_trips'))
+        self.assertEqual(len(large), len(small))
+        self.assertLessEqual(len(large), 8)
+
+
+class BookingPassengerSummaryTests(FlightSearchTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = get_user_model().objects.create_user(email='agent@example.com', password='pass12345')
+        self.schedule = Schedule.objects.get(route=self.outbound_route)
+        self.booking = Booking.objects.create(
+            user=self.user,
+            schedule=self.schedule,
+            contact_email=self.user.email,
+            base_fare=Decimal('12500.00'),
+            total_amount=Decimal('12500.00'),
+        )
+        for first_name, passenger_type in (('Asha', 'adult'), ('Ravi', 'senior'), ('Zoya', 'child'), ('Ali', 'infant')):
+            BookingPassenger.objects.create(
+                booking=self.booking, first_name=first_name, last_name='Khan', gender='M',
+                date_of_birth=timezone.now().date() - timedelta(days=365), passenger_type=passenger_type,
+            )
+
+    def summary(self):
+        return Booking.objects.values(*Booking.PASSENGER_FIELDS).get(pk=self.booking.pk)
+
+    def test_summary_follows_passenger_writes(self):
+        expected = {'adult_count': 2, 'child_count': 1, 'infant_count': 1, 'seat_count': 3,
+                    'passenger_count': 4, 'lead_passenger_name': 'Asha Khan'}
+        self.assertEqual(self.summary(), expected)
+        # A stale instance saved later does not overwrite the summary
+        self.booking.notes = 'Window seats please'
+        self.booking.save()
+        self.assertEqual(self.summary(), expected)
+
+        self.booking.passengers.get(first_name='Asha').delete()
+        self.assertEqual(self.summary(), {**expected, 'adult_count': 1, 'seat_count': 2, 'passenger_count': 3,
+                                          'lead_passenger_name': 'Ravi Khan'})
+
+    def test_confirm_sells_one_seat_per_non_infant(self):
+        booking = Booking.objects.get(pk=self.booking.pk)
+        self.assertTrue(booking.confirm())
+        self.schedule.refresh_from_db()
+        self.assertEqual(self.schedule.available_seats, 47)
+
+    def test_rebuild_command(self):
+        Booking.objects.update(passenger_count=0, seat_count=0, lead_passenger_name='')
+        out = io.StringIO()
+        call_command('rebuild_passenger_counts', '--dry-run', stdout=out)
+        self.assertIn('1 booking(s)', out.getvalue())
+        call_command('rebuild_passenger_counts', stdout=io.StringIO())
+        self.assertEqual(self.summary()['seat_count'], 3)
+        self.assertEqual(self.summary()['lead_passenger_name'], 'Asha Khan')
+
+
+class TicketPdfCacheTests(FlightSearchTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, ignore_errors=True)
+        settings_override = override_settings(TICKET_PDF_CACHE_DIR=cache_dir, TICKET_PDF_CACHE_MAX_BYTES=10 ** 8)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = get_user_model().objects.create_user(email='agent@example.com', password='pass12345')
+        self.schedule = Schedule.objects.get(route=self.outbound_route)
+        self.booking = Booking.objects.create(
+            user=self.user,
+            schedule=self.schedule,
+            contact_email=self.user.email,
+            base_fare=Decimal('12500.00'),
+            total_amount=Decimal('12500.00'),
+            status=Booking.Status.CONFIRMED,
+            payment_status=Booking.PaymentStatus.PAID,
+        )
+        self.passenger = BookingPassenger.objects.create(
+            booking=self.booking, first_name='Asha', last_name='Khan', gender='F',
+            date_of_birth=timezone.now().date() - timedelta(days=365 * 30),
+        )
+        self.renders = 0
+
+    def render(self):
+        self.renders += 1
+        return f'%PDF-{self.renders}'.encode()
+
+    def fetch(self, **variant):
+        return ticket_pdfs.get_or_render(Booking.objects.get(pk=self.booking.pk), self.render, **variant)
+
+    def test_hits_until_the_ticket_content_changes(self):
+        first = self.fetch(hide_fare=True)
+        self.assertEqual(self.fetch(hide_fare=True), first)
+        self.assertEqual(self.renders, 1)
+        # Another variant is another file
+        self.fetch(hide_fare=False)
+        self.assertEqual(self.renders, 2)
+        # Seat sales on the flight do not change the ticket
+        inventory.reserve_seats(self.schedule.pk, 2)
+        self.fetch(hide_fare=True)
+        self.assertEqual(self.renders, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.passenger.last_name = 'Siddiqui'
+            self.passenger.save()
+        self.fetch(hide_fare=True)
+        self.assertEqual(self.renders, 3)
+
+        self.outbound_route.departure_terminal = 'T3'
+        self.outbound_route.save()
+        self.fetch(hide_fare=True)
+        self.assertEqual(self.renders, 4)
+
+    def test_fare_edit_drops_the_booking_directory(self):
+        self.fetch(hide_fare=False)
+        booking_dir = os.path.join(ticket_pdfs.get_cache_dir(), str(self.booking.pk))
+        self.assertEqual(len(os.listdir(booking_dir)), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            booking = Booking.objects.get(pk=self.booking.pk)
+            booking.base_fare = Decimal('9999.00')
+            booking.calculate_total()
+            booking.save()
+        self.assertFalse(os.path.exists(booking_dir))
+
+    def test_least_recently_used_files_are_evicted(self):
+        for key in ('a', 'b', 'c'):
+            ticket_pdfs.put(self.booking.pk, key, b'x' * 100)
+            clock.sleep(0.01)
+        self.assertIsNotNone(ticket_pdfs.get(self.booking.pk, 'a'))  # touch 'a'
+        self.assertEqual(ticket_pdfs.evict(max_bytes=250), 1)
+        self.assertIsNone(ticket_pdfs.get(self.booking.pk, 'b'))
+        self.assertIsNotNone(ticket_pdfs.get(self.booking.pk, 'a'))
+        self.assertIsNotNone(ticket_pdfs.get(self.booking.pk, 'c'))
+
+    def test_views_serve_the_cached_pdf(self):
+        self.client.force_login(self.user)
+        url = reverse('download_ticket_without_fare', args=[self.booking.pk])
+        started = clock.perf_counter()
+        cold = self.client.get(url)
+        cold_ms = (clock.perf_counter() - started) * 1000
+        started = clock.perf_counter()
+        warm = self.client.get(url)
+        warm_ms = (clock.perf_counter() - started) * 1000
+        self.assertEqual(cold['Content-Type'], 'application/pdf')
+        self.assertEqual(cold.content, warm.content)
+        self.assertTrue(cold.content.startswith(b'%PDF'))
+        # The cached response skips the xhtml2pdf render
+        self.assertLess(warm_ms, cold_ms)
+
+
+@override_settings(TICKET_RENDER_IN_BACKGROUND=True)
+class TicketRenderWorkerTests(FlightSearchTestMixin, TransactionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, ignore_errors=True)
+        settings_override = override_settings(TICKET_PDF_CACHE_DIR=cache_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = get_user_model().objects.create_user(email='agent@example.com', password='pass12345')
+        self.booking = Booking.objects.create(
+            user=self.user,
+            schedule=Schedule.objects.get(route=self.outbound_route),
+            contact_email=self.user.email,
+            base_fare=Decimal('12500.00'),
+            total_amount=Decimal('12500.00'),
+            status=Booking.Status.CONFIRMED,
+            payment_status=Booking.PaymentStatus.PAID,
+        )
+        self.client.force_login(self.user)
+        self.url = reverse('download_ticket_without_fare', args=[self.booking.pk])
+
+    def run_worker(self):
+        metrics = LatencyMetrics()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            counts = ticket_renderer.process_jobs(executor, metrics=metrics)
+        return counts, metrics
+
+    def test_download_waits_for_the_worker(self):
+        self.assertEqual(ticket_renderer.queue_depth(), 1)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response['Retry-After'], str(ticket_renderer.RETRY_SECONDS))
+        # Polling does not queue the booking twice
+        self.client.get(self.url)
+        self.assertEqual(ticket_renderer.queue_depth(), 1)
+
+        counts, metrics = self.run_worker()
+        self.assertEqual(counts, {TicketRenderJob.Status.DONE: 1})
+        self.assertEqual(metrics.snapshot()['calls'], len(ticket_pdfs.PRERENDER_VARIANTS))
+        job = TicketRenderJob.objects.get()
+        self.assertEqual(job.attempts, 1)
+        self.assertIsNotNone(job.render_ms)
+        self.assertEqual(ticket_renderer.queue_depth(), 0)
+
+        response = self.client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(response.content.startswith(b'%PDF'))
+        self.assertEqual(self.client.get(reverse('download_ticket_pdf_file', args=[self.booking.pk])).status_code, 200)
+
+    def test_failed_job_renders_inline(self):
+        TicketRenderJob.objects.update(status=TicketRenderJob.Status.FAILED, error='boom')
+        response = self.client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+
+
+class BulkTicketExportTests(FlightSearchTestMixin, TransactionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, ignore_errors=True)
+        settings_override = override_settings(TICKET_PDF_CACHE_DIR=cache_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = get_user_model().objects.create_user(email='agent@example.com', password='pass12345')
+        self.other = get_user_model().objects.create_user(email='other@example.com', password='pass12345')
+        self.schedule = Schedule.objects.get(route=self.outbound_route)
+        self.bookings = [self.book(self.user) for i in range(5)]
+        self.book(self.user, status=Booking.Status.PENDING, payment_status=Booking.PaymentStatus.PENDING)
+        self.book(self.other)
+        self.client.force_login(self.user)
+
+    def book(self, user, status=Booking.Status.CONFIRMED, payment_status=Booking.PaymentStatus.PAID):
+        return Booking.objects.create(
+            user=user, schedule=self.schedule, contact_email=user.email,
+            base_fare=Decimal('12500.00'), total_amount=Decimal('12500.00'),
+            status=status, payment_status=payment_status,
+        )
+
+    def download(self, **params):
+        response = self.client.get(reverse('download_tickets_zip'), params)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        return zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+
+    def test_travel_date_range_exports_own_ticketed_bookings(self):
+        archive = self.download(**{'from': self.departure_date.isoformat(), 'to': self.departure_date.isoformat()})
+        self.assertEqual(
+            sorted(archive.namelist()),
+            sorted(f'E-Ticket-{booking.booking_reference}.pdf' for booking in self.bookings),
+        )
+        for name in archive.namelist():
+            self.assertTrue(archive.read(name).startswith(b'%PDF'))
+
+    def test_selection_and_schedule_filters(self):
+        archive = self.download(booking=[self.bookings[0].pk, self.bookings[1].pk], schedule=self.schedule.pk)
+        self.assertEqual(len(archive.namelist()), 2)
+        self.assertEqual(self.client.get(reverse('download_tickets_zip')).status_code, 400)
+
+    def test_stream_is_written_as_tickets_complete(self):
+        bookings = ticket_pdfs.export_bookings(Booking.objects.filter(user=self.user, status=Booking.Status.CONFIRMED))
+        chunks = list(ticket_pdfs.stream_zip(bookings, workers=1))
+        # With one worker every ticket after the second is flushed as it completes
+        self.assertGreaterEqual(len(chunks), len(self.bookings))
+        self.assertEqual(len(zipfile.ZipFile(io.BytesIO(b''.join(chunks))).namelist()), len(self.bookings))
+
+
+class TicketQueryBudgetTests(FlightSearchTestMixin, TestCase):
+    """Ticket endpoints load the booking graph up front instead of per template lookup"""
+
+    # Session, user, booking with agency and flights, passengers
+    QUERY_BUDGET = 4
+
+    def setUp(self):
+        super().setUp()
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, ignore_errors=True)
+        settings_override = override_settings(TICKET_PDF_CACHE_DIR=cache_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = get_user_model().objects.create_user(email='agent@example.com', password='pass12345')
+        UserProfile.objects.filter(user=self.user).update(company_name='Safar Agency', city='Lucknow')
+        self.booking = Booking.objects.create(
+            user=self.user,
+            schedule=Schedule.objects.get(route=self.outbound_route),
+            return_schedule=Schedule.objects.get(route=self.return_route),
+            contact_email=self.user.email,
+            base_fare=Decimal('24300.00'),
+            total_amount=Decimal('24300.00'),
+            status=Booking.Status.CONFIRMED,
+            payment_status=Booking.PaymentStatus.PAID,
+        )
+        for first_name in ('Asha', 'Imran', 'Sara'):
+            BookingPassenger.objects.create(
+                booking=self.booking, first_name=first_name, last_name='Khan', gender='F',
+                date_of_birth=timezone.now().date() - timedelta(days=365 * 30),
+            )
+        self.client.force_login(self.user)
+        airports.get_registry()
+
+    def query_count(self, method, url, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data)
+        self.assertIn(response.status_code, (200, 302))
+        return len(queries)
+
+    def test_endpoint_query_budgets(self):
+        ticket_url = lambda name: reverse(name, args=[self.booking.pk])
+        endpoints = (
+            ('view_ticket', 'get', ticket_url('view_ticket'), None),
+            ('download_ticket_pdf', 'get', ticket_url('download_ticket_pdf'), None),
+            ('send_ticket_email_api', 'get', reverse('send_ticket_email_api'),
+             {'booking_id': self.booking.pk, 'email': 'guest@example.com'}),
+            ('download_ticket_pdf_file', 'get', ticket_url('download_ticket_pdf_file'), None),
+            ('print_ticket_pdf', 'get', ticket_url('print_ticket_pdf'), None),
+            ('download_ticket_without_fare', 'get', ticket_url('download_ticket_without_fare'), None),
+            ('email_ticket', 'post', ticket_url('email_ticket'), {'email': 'guest@example.com'}),
+        )
+        for name, method, url, data in endpoints:
+            with self.subTest(endpoint=name):
+                # Rendering (cold) and cache hits (warm) share the budget
+                for attempt in ('cold', 'warm'):
+                    self.assertLessEqual(self.query_count(method, url, data), self.QUERY_BUDGET, attempt)
+
+    def test_generate_ticket_pdf_renders_without_queries(self):
+        from .views import _generate_ticket_pdf
+        booking = ticket_pdfs.ticket_bookings().get(pk=self.booking.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(_generate_ticket_pdf(booking, hide_fare=True).read().startswith(b'%PDF'))
+
+
+class LogoHandler(BaseHTTPRequestHandler):
+    """Serves server.logo at /logo.png (404 elsewhere) and counts requests"""
+
+    def do_GET(self):
+        self.server.hits.append(self.path)
+        body = self.server.logo if self.path == '/logo.png' else b''
+        self.send_response(200 if body else 404)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TicketAssetTests(FlightSearchTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        directories = {}
+        for name in ('MEDIA_ROOT', 'TICKET_ASSET_DIR', 'TICKET_PDF_CACHE_DIR'):
+            directories[name] = tempfile.mkdtemp()
+            self.addCleanup(shutil.rmtree, directories[name], ignore_errors=True)
+        settings_override = override_settings(**directories)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        pdf_assets.clear()
+        self.addCleanup(pdf_assets.clear)
+
+        self.user = get_user_model().objects.create_user(email='agent@example.com', password='pass12345')
+        self.profile = UserProfile.objects.get(user=self.user)
+        # Agencies upload logos straight from the camera or design tool
+        self.profile.logo.save('logo.png', ContentFile(self.png(3000, 2000)))
+
+    def png(self, width, height):
+        output = io.BytesIO()
+        Image.effect_noise((width, height), 64).convert('RGB').save(output, 'PNG')
+        return output.getvalue()
+
+    def test_logo_is_downscaled_once_per_version(self):
+        uri = self.profile.logo.url
+        pooled = pdf_assets.link_callback(uri, None)
+        self.assertTrue(pooled.startswith(pdf_assets.get_asset_dir()))
+        with Image.open(pooled) as image:
+            self.assertLessEqual(image.width, pdf_assets.LOGO_MAX_SIZE[0])
+            self.assertLessEqual(image.height, pdf_assets.LOGO_MAX_SIZE[1])
+        self.assertEqual(pdf_assets.link_callback(uri, None), pooled)
+
+        # Replacing the file in place gives a new pooled copy
+        with open(self.profile.logo.path, 'wb') as logo_file:
+            logo_file.write(self.png(800, 800))
+        self.assertNotEqual(pdf_assets.link_callback(uri, None), pooled)
+
+    def test_remote_logo_is_fetched_outside_rendering(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), LogoHandler)
+        server.hits = []
+        server.logo = self.png(400, 160)
+        threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = f'http://127.0.0.1:{server.server_port}'
+
+        # Rendering never downloads: an unfetched logo is handed back as its URL
+        with self.assertLogs('travels.pdf_assets', 'WARNING'):
+            self.assertEqual(pdf_assets.link_callback(f'{url}/logo.png', None), f'{url}/logo.png')
+        self.assertEqual(server.hits, [])
+
+        self.assertTrue(pdf_assets.fetch_remote_image(f'{url}/logo.png'))
+        self.assertTrue(pdf_assets.fetch_remote_image(f'{url}/logo.png'))
+        pooled = pdf_assets.link_callback(f'{url}/logo.png', None)
+        self.assertTrue(pooled.startswith(pdf_assets.get_asset_dir()))
+        self.assertEqual(pdf_assets.link_callback(f'{url}/logo.png', None), pooled)
+        with self.assertLogs('travels.pdf_assets', 'WARNING'):
+            self.assertFalse(pdf_assets.fetch_remote_image(f'{url}/missing.png'))
+        self.assertEqual(server.hits, ['/logo.png', '/missing.png'])
+
+    def test_render_benchmark(self):
+        from xhtml2pdf import pisa
+        booking = Booking.objects.create(
+            user=self.user,
+            schedule=Schedule.objects.get(route=self.outbound_route),
+            return_schedule=Schedule.objects.get(route=self.return_route),
+            contact_email=self.user.email,
+            base_fare=Decimal('24300.00'),
+            total_amount=Decimal('24300.00'),
+            status=Booking.Status.CONFIRMED,
+            payment_status=Booking.PaymentStatus.PAID,
+        )
+        ticket = ticket_pdfs.TicketContext.for_booking(ticket_pdfs.ticket_bookings().get(pk=booking.pk))
+        html = render_to_string(ticket_pdfs.TEMPLATE_NAME, ticket.template_context(is_web_view=False))
+
+        def render(link_callback, runs=3):
+            timings = []
+            for run in range(runs):
+                output = io.BytesIO()
+                started = clock.perf_counter()
+                pisa.CreatePDF(html, dest=output, encoding='utf-8', link_callback=link_callback,
+                               **pdf_assets.resource_options())
+                timings.append((clock.perf_counter() - started) * 1000)
+            return min(timings), len(output.getvalue())
+
+        # Before: every render resolves and decodes the original files
+        before_ms, before_bytes = render(lambda uri, rel: pdf_assets.find_file(uri), runs=1)
+        pdf_assets.link_callback(self.profile.logo.url, None)  # pool is warm after the first render
+        after_ms, after_bytes = render(pdf_assets.link_callback)
+        self.assertLess(after_ms, before_ms)
+        self.assertLess(after_bytes, before_bytes)
@@ -0,0 +1,329 @@
+"""Ticket PDF cache.
+
+Rendering print_pdf.html through xhtml2pdf costs hundreds of milliseconds,
+and the print, download and email views ask for the same ticket again and
+again. Rendered PDFs are stored on disk (TICKET_PDF_CACHE_DIR, under
+MEDIA_ROOT by default) keyed by a content version: a hash of everything
+the template prints (booking and fare, passengers, schedules and routes,
+agency branding, the template file itself) plus the render variant
+(hide_fare, convenience fee, download layout). Any change to that content
+gives a new key, so a stale PDF is never served.
+
+Files live in one directory per booking, which is dropped as soon as the
+booking or one of its passengers is saved. Everything else is evicted
+least recently used first once the cache grows past
+TICKET_PDF_CACHE_MAX_BYTES.
+
+Rendering lives here rather than in the views so the render_tickets
+worker processes can produce the same files without importing views.
+
+Every ticket endpoint loads its booking through ticket_bookings() and
+builds a TicketContext: one joined query for the booking, its agency and
+flights, and one for the passengers, instead of lazy loads in the template.
+
+Bulk exports stream a ZIP of many tickets, fetching or rendering a few at a
+time on a thread pool, so memory stays flat however many are exported.
+"""
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Any, Mapping, Optional
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Prefetch
+from django.template.loader import get_template, render_to_string
+
+from . import airports, pdf_assets
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_NAME = 'print_pdf.html'
+
+# Fields that change without changing the printed ticket
+SCHEDULE_VOLATILE_FIELDS = {'available_seats', 'held_seats', 'created_at', 'updated_at'}
+TIMESTAMP_FIELDS = {'created_at', 'updated_at'}
+PASSENGER_FIELDS = ('pk', 'title', 'first_name', 'last_name', 'passenger_type', 'pnr')
+
+# Everything print_pdf.html reads off a booking besides its passengers
+TICKET_RELATED = ('user__profile', 'schedule__route', 'return_schedule__route')
+
+# Tickets fetched or rendered at once by a bulk export
+EXPORT_WORKERS = 4
+EXPORT_CHUNK_SIZE = 100
+
+# Variants the render worker prepares as soon as a booking is confirmed and paid
+PRERENDER_VARIANTS = ({'hide_fare': False}, {'hide_fare': True})
+
+
+def get_cache_dir():
+    return str(getattr(settings, 'TICKET_PDF_CACHE_DIR', os.path.join(settings.MEDIA_ROOT, 'ticket_pdfs')))
+
+
+def get_max_bytes():
+    return getattr(settings, 'TICKET_PDF_CACHE_MAX_BYTES', 256 * 1024 * 1024)
+
+
+def ticket_bookings(queryset=None):
+    """Bookings with everything their ticket prints: one joined query, plus
+    one for the passengers"""
+    from .models import Booking, BookingPassenger
+    queryset = Booking.objects.all() if queryset is None else queryset
+    return queryset.select_related(*TICKET_RELATED).prefetch_related(
+        Prefetch('passengers', queryset=BookingPassenger.objects.order_by('pk')))
+
+
+@dataclass(frozen=True)
+class TicketContext:
+    """What print_pdf.html prints for one booking, loaded up front"""
+    booking: Any
+    user: Any
+    user_profile: Optional[Any]
+    airport_codes: Mapping
+
+    @classmethod
+    def for_booking(cls, booking):
+        """Context of a booking (load it with ticket_bookings() to avoid lazy queries)"""
+        user = booking.user
+        return cls(
+            booking=booking,
+            user=user,
+            user_profile=getattr(user, 'profile', None) if user else None,
+            airport_codes=airports.get_registry().codes,
+        )
+
+    def template_context(self, **options):
+        """Template context plus render options (hide_fare, is_web_view, ...)"""
+        return {
+            'booking': self.booking,
+            'airport_codes': self.airport_codes,
+            'user_profile': self.user_profile,
+            'user': self.user,
+            **options,
+        }
+
+
+def _fields(obj, exclude=TIMESTAMP_FIELDS):
+    if obj is None:
+        return None
+    return [(field.attname, getattr(obj, field.attname))
+            for field in obj._meta.concrete_fields if field.name not in exclude]
+
+
+def _template_stamp():
+    """Modification time of print_pdf.html, so editing the template retires old PDFs"""
+    try:
+        return os.stat(get_template(TEMPLATE_NAME).origin.name).st_mtime_ns
+    except (OSError, AttributeError):
+        return None
+
+
+def content_version(booking):
+    """Hash of everything the ticket template prints for a booking"""
+    user = booking.user
+    profile = getattr(user, 'profile', None) if user else None
+    parts = [
+        _fields(booking),
+        sorted(tuple(getattr(passenger, field) for field in PASSENGER_FIELDS) for passenger in booking.passengers.all()),
+        _template_stamp(),
+        (user.email, getattr(user, 'phone', '')) if user else None,
+        _fields(profile),
+    ]
+    for schedule in (booking.schedule, booking.return_schedule):
+        parts.append(_fields(schedule, SCHEDULE_VOLATILE_FIELDS))
+        parts.append(_fields(schedule.route) if schedule else None)
+    return hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()
+
+
+def cache_key(booking, **variant):
+    """Content version plus render variant (hide_fare, convenience_fee, ...)"""
+    return hashlib.sha256(f'{content_version(booking)}|{sorted(variant.items())}'.encode('utf-8')).hexdigest()
+
+
+def _booking_dir(booking_id):
+    return os.path.join(get_cache_dir(), str(booking_id))
+
+
+def get(booking_id, key):
+    """Cached PDF bytes, or None; a hit marks the file as recently used"""
+    path = os.path.join(_booking_dir(booking_id), f'{key}.pdf')
+    try:
+        with open(path, 'rb') as pdf_file:
+            pdf = pdf_file.read()
+        os.utime(path)
+    except OSError:
+        return None
+    return pdf
+
+
+def put(booking_id, key, pdf):
+    """Store a rendered PDF (written atomically) and trim the cache"""
+    directory = _booking_dir(booking_id)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as tmp_file:
+            tmp_file.write(pdf)
+        os.replace(tmp_path, os.path.join(directory, f'{key}.pdf'))
+    except OSError as exc:
+        logger.warning('Could not cache ticket PDF for booking %s: %s', booking_id, exc)
+        return
+    evict()
+
+
+def evict(max_bytes=None):
+    """Delete least recently used PDFs until the cache fits in max_bytes; returns files removed"""
+    max_bytes = get_max_bytes() if max_bytes is None else max_bytes
+    entries = []
+    total = 0
+    for root, dirs, files in os.walk(get_cache_dir()):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+            total += stat.st_size
+    removed = 0
+    for mtime, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    return removed
+
+
+def invalidate(booking_id):
+    """Drop every cached PDF of a booking once the current transaction commits"""
+    transaction.on_commit(lambda: shutil.rmtree(_booking_dir(booking_id), ignore_errors=True))
+
+
+def get_or_render(booking, render, **variant):
+    """Cached PDF of a booking, rendering (and caching) it on a miss.
+
+    `render()` returns the PDF bytes, or None if rendering failed; failures
+    are not cached.
+    """
+    key = cache_key(booking, **variant)
+    pdf = get(booking.pk, key)
+    if pdf is None:
+        pdf = render()
+        if pdf is not None:
+            put(booking.pk, key, pdf)
+    return pdf
+
+
+def render_ticket(booking, hide_fare=False, convenience_fee=0):
+    """Render print_pdf.html with xhtml2pdf; returns the PDF bytes, or None if xhtml2pdf is missing or fails"""
+    try:
+        # Try using xhtml2pdf (pisa) for HTML to PDF conversion
+        from xhtml2pdf import pisa
+    except ImportError:
+        return None
+    
+    # Calculate total with convenience fee
+    total_with_fee = float(booking.total_amount) + float(convenience_fee)
+
+    # Render HTML template (is_web_view=False for PDF generation)
+    html_string = render_to_string(TEMPLATE_NAME, TicketContext.for_booking(booking).template_context(
+        hide_fare=hide_fare,
+        convenience_fee=convenience_fee,
+        total_with_fee=total_with_fee,
+        is_web_view=False,  # Not a web view, this is PDF generation
+    ))
+    
+    # Convert HTML to PDF
+    buffer = BytesIO()
+    pisa_status = pisa.CreatePDF(
+        html_string,
+        dest=buffer,
+        encoding='utf-8',
+        link_callback=pdf_assets.link_callback,
+        **pdf_assets.resource_options()
+    )
+    if pisa_status.err:
+        return None
+    return buffer.getvalue()
+
+
+def _variant(hide_fare, convenience_fee):
+    return {'hide_fare': bool(hide_fare), 'convenience_fee': str(convenience_fee)}
+
+
+def cached_ticket(booking, hide_fare=False, convenience_fee=0):
+    """Cached PDF of a ticket variant, or None (never renders)"""
+    return get(booking.pk, cache_key(booking, **_variant(hide_fare, convenience_fee)))
+
+
+def ticket(booking, hide_fare=False, convenience_fee=0):
+    """PDF of a ticket variant, rendered and cached on a miss (None if rendering fails)"""
+    return get_or_render(
+        booking,
+        lambda: render_ticket(booking, hide_fare, convenience_fee),
+        **_variant(hide_fare, convenience_fee)
+    )
+
+
+def _export_ticket(booking, hide_fare):
+    """Ticket PDF for a bulk export (runs on a pool thread)"""
+    try:
+        return ticket(booking, hide_fare)
+    except Exception:
+        logger.exception('Could not export the ticket of booking %s', booking.pk)
+        return None
+    finally:
+        # Pool threads open their own connection; don't leave it behind
+        connection.close()
+
+
+def export_bookings(queryset):
+    """Bookings of a bulk export, with what the ticket prints, in travel order"""
+    return ticket_bookings(queryset).order_by(
+        'schedule__departure_date', 'booking_reference').iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def stream_zip(bookings, hide_fare=False, workers=EXPORT_WORKERS):
+    """ZIP archive of the bookings' ticket PDFs for a StreamingHttpResponse.
+
+    At most 2 * workers tickets are in flight, and each one is written to the
+    archive and yielded as soon as it is ready, in booking order. Tickets
+    that cannot be rendered are listed in MISSING.txt.
+    """
+    from .statements import ZipSink
+    sink = ZipSink()
+    missing = []
+    in_flight = deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor, zipfile.ZipFile(sink, 'w', zipfile.ZIP_STORED) as archive:
+
+        def write_next():
+            booking, future = in_flight.popleft()
+            pdf = future.result()
+            if pdf is None:
+                missing.append(booking.booking_reference)
+            else:
+                # PDFs are already compressed; store them as they are
+                archive.writestr(f'E-Ticket-{booking.booking_reference}.pdf', pdf)
+
+        for booking in bookings:
+            in_flight.append((booking, executor.submit(_export_ticket, booking, hide_fare)))
+            if len(in_flight) >= 2 * workers:
+                write_next()
+                yield sink.drain()
+        while in_flight:
+            write_next()
+            yield sink.drain()
+        if missing:
+            archive.writestr('MISSING.txt', 'Tickets that could not be generated:\n' + '\n'.join(missing) + '\n')
+    yield sink.drain()
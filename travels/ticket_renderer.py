@@ -0,0 +1,157 @@
+"""Background ticket rendering.
+
+With TICKET_RENDER_IN_BACKGROUND on, confirming a paid booking queues a
+TicketRenderJob, and the render_tickets worker renders the fare and
+no-fare tickets into the ticket PDF cache in a pool of processes (xhtml2pdf
+is CPU bound, so threads would only queue behind the GIL). Download views
+then serve the cached file, or a short "rendering" page while the job is
+still waiting, instead of rendering inside the request.
+
+Worker processes are spawned rather than forked, so no database connection
+is ever shared with the parent; they set Django up in the pool initializer.
+This module imports models lazily for the same reason.
+"""
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F
+from django.utils import timezone
+
+from . import ticket_pdfs
+from .metrics import LatencyMetrics
+
+# How soon the "rendering" page asks the browser to try again
+RETRY_SECONDS = 3
+
+# RUNNING jobs untouched for this long belong to a worker that died
+STALLED_AFTER = timedelta(minutes=10)
+
+
+class TicketRendering(Exception):
+    """The ticket is queued for the render worker and not cached yet"""
+
+
+def enabled():
+    return getattr(settings, 'TICKET_RENDER_IN_BACKGROUND', False)
+
+
+def fetch(booking, hide_fare=False, convenience_fee=0):
+    """Ticket PDF bytes (None if rendering fails).
+
+    With background rendering on, a ticket the worker has not cached yet is
+    queued and TicketRendering raised instead of rendering in the request.
+    A booking whose last job failed renders inline, so a broken worker never
+    leaves a customer without a ticket.
+    """
+    if not enabled():
+        return ticket_pdfs.ticket(booking, hide_fare, convenience_fee)
+    pdf = ticket_pdfs.cached_ticket(booking, hide_fare, convenience_fee)
+    if pdf is not None:
+        return pdf
+    from .models import TicketRenderJob
+    last_status = booking.render_jobs.order_by('-pk').values_list('status', flat=True).first()
+    if last_status == TicketRenderJob.Status.FAILED:
+        return ticket_pdfs.ticket(booking, hide_fare, convenience_fee)
+    if last_status not in (TicketRenderJob.Status.PENDING, TicketRenderJob.Status.RUNNING):
+        # Never queued, or rendered and since evicted
+        TicketRenderJob.enqueue(booking.pk)
+    raise TicketRendering(booking.pk)
+
+
+def _init_worker(settings_module):
+    """Pool initializer: a spawned interpreter needs Django set up first"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+
+def render_booking(booking_id):
+    """Render every pre-render variant of a booking into the cache (runs in a
+    worker process); returns the seconds each variant took"""
+    close_old_connections()
+    booking = ticket_pdfs.ticket_bookings().get(pk=booking_id)
+    timings = []
+    for variant in ticket_pdfs.PRERENDER_VARIANTS:
+        started = time.perf_counter()
+        if ticket_pdfs.ticket(booking, **variant) is None:
+            raise RuntimeError('xhtml2pdf could not render the ticket')
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def worker_pool(workers):
+    """Process pool for render_booking"""
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+        initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'Travel_agency.settings'),),
+    )
+
+
+def queue_depth():
+    """Jobs waiting for a worker"""
+    from .models import TicketRenderJob
+    return TicketRenderJob.objects.filter(status=TicketRenderJob.Status.PENDING).count()
+
+
+def requeue_stalled(now=None):
+    """Put RUNNING jobs of a dead worker back in the queue; returns how many"""
+    from .models import TicketRenderJob
+    now = now or timezone.now()
+    return TicketRenderJob.objects.filter(
+        status=TicketRenderJob.Status.RUNNING, updated_at__lt=now - STALLED_AFTER,
+    ).update(status=TicketRenderJob.Status.PENDING, updated_at=now)
+
+
+def _claim(job_id):
+    """Mark a pending job running; False if another worker took it"""
+    from .models import TicketRenderJob
+    return bool(TicketRenderJob.objects.filter(pk=job_id, status=TicketRenderJob.Status.PENDING).update(
+        status=TicketRenderJob.Status.RUNNING, attempts=F('attempts') + 1, updated_at=timezone.now()))
+
+
+def process_jobs(executor, batch_size=20, limit=None, metrics=None):
+    """Render pending jobs oldest first on the executor; returns {status: count}.
+
+    Each rendered variant is recorded in `metrics` (a LatencyMetrics), so the
+    caller can report render latency percentiles across passes.
+    """
+    from .models import TicketRenderJob
+    metrics = metrics if metrics is not None else LatencyMetrics()
+    counts = {}
+    last_pk = 0
+    processed = 0
+    pending = TicketRenderJob.objects.filter(status=TicketRenderJob.Status.PENDING).order_by('pk')
+    while limit is None or processed < limit:
+        size = batch_size if limit is None else min(batch_size, limit - processed)
+        jobs = list(pending.filter(pk__gt=last_pk).values_list('pk', 'booking_id')[:size])
+        if not jobs:
+            break
+        futures = {executor.submit(render_booking, booking_id): job_id
+                   for job_id, booking_id in jobs if _claim(job_id)}
+        for future in as_completed(futures):
+            job_id = futures[future]
+            try:
+                timings = future.result()
+            except Exception as exc:
+                TicketRenderJob.objects.filter(pk=job_id).update(
+                    status=TicketRenderJob.Status.FAILED, error=str(exc) or repr(exc),
+                    processed_at=timezone.now(), updated_at=timezone.now())
+                status = TicketRenderJob.Status.FAILED
+            else:
+                for elapsed in timings:
+                    metrics.record(elapsed)
+                TicketRenderJob.objects.filter(pk=job_id).update(
+                    status=TicketRenderJob.Status.DONE, error='', render_ms=round(sum(timings) * 1000),
+                    processed_at=timezone.now(), updated_at=timezone.now())
+                status = TicketRenderJob.Status.DONE
+            counts[status] = counts.get(status, 0) + 1
+        processed += len(jobs)
+        last_pk = jobs[-1][0]
+    return counts
@@ -26,6 +26,7 @@ urlpatterns = [
     path('apply-package/', views.apply_package, name='apply_package'),
     path('test-colors/', TemplateView.as_view(template_name='test_colors.html'), name='test_colors'),
     path('search/', views.search_flights, name='search_flights'),
+    path('api/fare-calendar/', views.fare_calendar_api, name='fare_calendar_api'),
     
     # Booking
     path('booking/<int:schedule_id>/', views.booking_page, name='booking'),
@@ -35,6 +36,7 @@ urlpatterns = [
     path('payment/<int:booking_id>/', views.payment_page, name='payment'),
     path('payment/success/', views.payment_success, name='payment_success'),
     path('payment/failed/', views.payment_failed, name='payment_failed'),
+    path('payment/webhook/', views.payment_webhook, name='payment_webhook'),
     path('booking/confirmation/<int:booking_id>/', views.booking_confirmation, name='booking_confirmation'),
     path('booking/<int:booking_id>/fare-rule/', views.fare_rule, name='fare_rule'),
     path('booking/<int:booking_id>/change-request/', views.change_request, name='change_request'),
@@ -64,10 +66,12 @@ urlpatterns = [
     path('api/verify-otp/', views.verify_otp, name='verify_otp'),
     path('api/send-ticket-email/', views.send_ticket_email_api, name='send_ticket_email_api'),
     path('ticket/<int:booking_id>/pdf/download/', views.download_ticket_pdf_file, name='download_ticket_pdf_file'),
+    path('tickets/download/', views.download_tickets_zip, name='download_tickets_zip'),
     
     # Wallet
     path('wallet/recharge/', views.wallet_recharge, name='wallet_recharge'),
     path('wallet/history/', views.wallet_history, name='wallet_history'),
+    path('wallet/statement/', views.wallet_statement, name='wallet_statement'),
     
     # Group Request (B2B)
     path('group-request/', views.group_request, name='group_request'),
@@ -5,65 +5,33 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from functools import wraps
 from django.contrib.auth import login, authenticate, logout, get_user_model
 from django.contrib import messages
-from django.db.models import Q, Count, Sum
+from django.db import transaction
+from django.db.models import Q, Count, Sum, Prefetch
 from django.utils import timezone
 from datetime import datetime, date, timedelta
-from django.http import JsonResponse, HttpResponse, QueryDict
+from django.http import JsonResponse, HttpResponse, QueryDict, StreamingHttpResponse
 from django.views.decorators.http import require_http_methods, require_GET, require_POST
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.clickjacking import xframe_options_sameorigin
 from django.conf import settings
 from decimal import Decimal
-from .models import Schedule, Route, Booking, Package, UserProfile, BookingPassenger, OTPVerification, Contact, ODWallet, ODWalletTransaction, CashBalanceWallet, CashBalanceTransaction, GroupRequest, PackageApplication, SalesRepresentative, Umrah, VisaBooking, Coupon
+from .models import Schedule, Route, FlightSearchIndex, FareCalendarDay, Booking, Package, UserProfile, BookingPassenger, OTPVerification, Contact, ODWallet, ODWalletTransaction, CashBalanceWallet, CashBalanceTransaction, GroupRequest, PackageApplication, SalesRepresentative, Umrah, VisaBooking, Coupon, SeatHold, PaymentTransaction, PaymentWebhookEvent
+from . import airports, inventory, pagination, payments, statements, ticket_pdfs, ticket_renderer
+from .easebuzz_client import EasebuzzError, get_client, generate_easebuzz_hash, verify_easebuzz_hash
+from .wallets import get_wallet_snapshot
+from .search import SearchService
 from .forms import UserRegisterForm, UserLoginForm, ProfileUpdateForm, ContactForm, WalletRechargeForm, PasswordResetRequestForm, SetNewPasswordForm
 import random
+import re
 import string
 import json
 import os
 import hashlib
+import logging
 import urllib.parse
 import sys
 import os
 
-# Add user site-packages to path if easebuzz is installed there
-user_site_packages = os.path.join(os.path.expanduser('~'), 'AppData', 'Roaming', 'Python', 'Python312', 'site-packages')
-if os.path.exists(user_site_packages):
-    if user_site_packages not in sys.path:
-        sys.path.insert(0, user_site_packages)
-    # Also try adding parent directory
-    parent_dir = os.path.dirname(user_site_packages)
-    if parent_dir not in sys.path:
-        sys.path.insert(0, parent_dir)
-
-try:
-    # Try standard import first
-    from easebuzz import Easebuzz
-    EASEBUZZ_SDK_AVAILABLE = True
-    print("[OK] Easebuzz SDK loaded successfully")
-except ImportError:
-    try:
-        # Try with capital E (package folder name)
-        from Easebuzz.easebuzz_payment_gateway import EasebuzzAPIs
-        # Create alias for compatibility
-        Easebuzz = EasebuzzAPIs
-        EASEBUZZ_SDK_AVAILABLE = True
-        print("[OK] Easebuzz SDK loaded successfully (using EasebuzzAPIs)")
-    except ImportError as e:
-        EASEBUZZ_SDK_AVAILABLE = False
-        # Try to find where easebuzz might be installed
-        import site
-        user_site = site.getusersitepackages()
-        if user_site and user_site not in sys.path:
-            sys.path.insert(0, user_site)
-        try:
-            from Easebuzz.easebuzz_payment_gateway import EasebuzzAPIs
-            Easebuzz = EasebuzzAPIs
-            EASEBUZZ_SDK_AVAILABLE = True
-            print("✅ Easebuzz SDK loaded successfully (after adding user site)")
-        except ImportError:
-            print(f"⚠️  Easebuzz SDK not installed. Error: {e}")
-            print(f"⚠️  User site packages: {user_site_packages}")
-            print("⚠️  Run: pip install easebuzz")
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.lib.units import inch
 from reportlab.pdfgen import canvas
@@ -72,303 +40,7 @@ from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph,
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.enums import TA_CENTER, TA_LEFT
 
-
-# Easebuzz Payment Gateway Helper Functions
-def generate_easebuzz_hash(data_dict, salt):
-    """Generate hash for Easebuzz payment gateway using the strict sequence"""
-    # Sequence: key|txnid|amount|productinfo|firstname|email|udf1|udf2|udf3|udf4|udf5|udf6|udf7|udf8|udf9|udf10|salt
-    hash_sequence = [
-        'key', 'txnid', 'amount', 'productinfo', 'firstname', 'email',
-        'udf1', 'udf2', 'udf3', 'udf4', 'udf5', 'udf6', 'udf7', 'udf8', 'udf9', 'udf10'
-    ]
-    
-    hash_params = []
-    for key in hash_sequence:
-        val = str(data_dict.get(key, '')) if data_dict.get(key) is not None else ''
-        hash_params.append(val)
-    
-    hash_params.append(salt)
-    
-    hash_string = '|'.join(hash_params)
-    
-    # Generate SHA512 hash
-    hash_value = hashlib.sha512(hash_string.encode('utf-8')).hexdigest()
-    return hash_value.lower()
-
-def verify_easebuzz_hash(data_dict, salt, received_hash):
-    """Verify hash from Easebuzz payment response"""
-    # Response Sequence: salt|status|udf10|udf9|udf8|udf7|udf6|udf5|udf4|udf3|udf2|udf1|email|firstname|productinfo|amount|txnid|key
-    
-    hash_sequence = [
-        'status', 'udf10', 'udf9', 'udf8', 'udf7', 'udf6', 'udf5', 'udf4', 'udf3', 'udf2', 'udf1', 
-        'email', 'firstname', 'productinfo', 'amount', 'txnid', 'key'
-    ]
-    
-    hash_params = [salt]
-    for key in hash_sequence:
-        val = str(data_dict.get(key, '')) if data_dict.get(key) is not None else ''
-        hash_params.append(val)
-        
-    hash_string = '|'.join(hash_params)
-        
-    generated_hash = hashlib.sha512(hash_string.encode('utf-8')).hexdigest()
-    return generated_hash == received_hash
-
-
-# Comprehensive Airport Codes Dictionary
-def get_airport_codes():
-    """Returns a comprehensive dictionary of airport codes for major cities worldwide"""
-    return {
-        # India - Major Cities
-        'Mumbai': 'BOM',
-        'Delhi': 'DEL',
-        'Bangalore': 'BLR',
-        'Chennai': 'MAA',
-        'Kolkata': 'CCU',
-        'Hyderabad': 'HYD',
-        'Pune': 'PNQ',
-        'Ahmedabad': 'AMD',
-        'Goa': 'GOI',
-        'Kochi': 'COK',
-        'Thiruvananthapuram': 'TRV',
-        'Jaipur': 'JAI',
-        'Lucknow': 'LKO',
-        'Nagpur': 'NAG',
-        'Srinagar': 'SXR',
-        'Guwahati': 'GAU',
-        'Varanasi': 'VNS',
-        'Amritsar': 'ATQ',
-        'Indore': 'IDR',
-        'Bhopal': 'BHO',
-        'Chandigarh': 'IXC',
-        'Coimbatore': 'CJB',
-        'Madurai': 'IXM',
-        'Tiruchirappalli': 'TRZ',
-        'Visakhapatnam': 'VTZ',
-        'Bhubaneswar': 'BBI',
-        'Patna': 'PAT',
-        'Raipur': 'RPR',
-        'Surat': 'STV',
-        'Vadodara': 'BDQ',
-        'Udaipur': 'UDR',
-        'Jodhpur': 'JDH',
-        'Dehradun': 'DED',
-        'Shimla': 'SLV',
-        
-        # Middle East - UAE
-        'Dubai': 'DXB',
-        'Abu Dhabi': 'AUH',
-        'Sharjah': 'SHJ',
-        'Al Ain': 'AAN',
-        'Ras Al Khaimah': 'RKT',
-        
-        # Middle East - Saudi Arabia
-        'Riyadh': 'RUH',
-        'Jeddah': 'JED',
-        'Dammam': 'DMM',
-        'Medina': 'MED',
-        'Abha': 'AHB',
-        'Tabuk': 'TUU',
-        'Taif': 'TIF',
-        'Hail': 'HAS',
-        'Qassim': 'ELQ',
-        
-        # Middle East - Qatar
-        'Doha': 'DOH',
-        
-        # Middle East - Kuwait
-        'Kuwait': 'KWI',
-        'Kuwait City': 'KWI',
-        
-        # Middle East - Bahrain
-        'Bahrain': 'BAH',
-        'Manama': 'BAH',
-        
-        # Middle East - Oman
-        'Muscat': 'MCT',
-        'Salalah': 'SLL',
-        
-        # Middle East - Jordan
-        'Amman': 'AMM',
-        
-        # Middle East - Lebanon
-        'Beirut': 'BEY',
-        
-        # Middle East - Israel
-        'Tel Aviv': 'TLV',
-        'Jerusalem': 'JRS',
-        
-        # Middle East - Egypt
-        'Cairo': 'CAI',
-        'Alexandria': 'ALY',
-        'Sharm El Sheikh': 'SSH',
-        'Hurghada': 'HRG',
-        
-        # Middle East - Turkey
-        'Istanbul': 'IST',
-        'Ankara': 'ESB',
-        'Antalya': 'AYT',
-        
-        # Middle East - Iran
-        'Tehran': 'IKA',
-        'Shiraz': 'SYZ',
-        'Isfahan': 'IFN',
-        
-        # Asia - Southeast
-        'Singapore': 'SIN',
-        'Bangkok': 'BKK',
-        'Phuket': 'HKT',
-        'Kuala Lumpur': 'KUL',
-        'Penang': 'PEN',
-        'Jakarta': 'CGK',
-        'Bali': 'DPS',
-        'Manila': 'MNL',
-        'Cebu': 'CEB',
-        'Ho Chi Minh': 'SGN',
-        'Hanoi': 'HAN',
-        'Phnom Penh': 'PNH',
-        'Yangon': 'RGN',
-        'Vientiane': 'VTE',
-        
-        # Asia - East
-        'Hong Kong': 'HKG',
-        'Macau': 'MFM',
-        'Shanghai': 'PVG',
-        'Beijing': 'PEK',
-        'Guangzhou': 'CAN',
-        'Shenzhen': 'SZX',
-        'Chengdu': 'CTU',
-        'Xi\'an': 'XIY',
-        'Tokyo': 'NRT',
-        'Osaka': 'KIX',
-        'Seoul': 'ICN',
-        'Busan': 'PUS',
-        'Taipei': 'TPE',
-        'Kaohsiung': 'KHH',
-        
-        # Asia - South
-        'Colombo': 'CMB',
-        'Male': 'MLE',
-        'Kathmandu': 'KTM',
-        'Dhaka': 'DAC',
-        'Karachi': 'KHI',
-        'Lahore': 'LHE',
-        'Islamabad': 'ISB',
-        'Rawalpindi': 'RWP',
-        
-        # Europe - UK & Ireland
-        'London': 'LHR',
-        'Manchester': 'MAN',
-        'Edinburgh': 'EDI',
-        'Birmingham': 'BHX',
-        'Glasgow': 'GLA',
-        'Dublin': 'DUB',
-        'Cork': 'ORK',
-        
-        # Europe - Western
-        'Paris': 'CDG',
-        'Lyon': 'LYS',
-        'Nice': 'NCE',
-        'Marseille': 'MRS',
-        'Frankfurt': 'FRA',
-        'Munich': 'MUC',
-        'Berlin': 'BER',
-        'Hamburg': 'HAM',
-        'Amsterdam': 'AMS',
-        'Brussels': 'BRU',
-        'Zurich': 'ZRH',
-        'Geneva': 'GVA',
-        'Vienna': 'VIE',
-        'Madrid': 'MAD',
-        'Barcelona': 'BCN',
-        'Lisbon': 'LIS',
-        'Porto': 'OPO',
-        'Rome': 'FCO',
-        'Milan': 'MXP',
-        'Venice': 'VCE',
-        'Naples': 'NAP',
-        
-        # Europe - Northern
-        'Copenhagen': 'CPH',
-        'Stockholm': 'ARN',
-        'Oslo': 'OSL',
-        'Helsinki': 'HEL',
-        'Reykjavik': 'KEF',
-        
-        # Europe - Eastern
-        'Warsaw': 'WAW',
-        'Prague': 'PRG',
-        'Budapest': 'BUD',
-        'Bucharest': 'OTP',
-        'Sofia': 'SOF',
-        'Athens': 'ATH',
-        'Belgrade': 'BEG',
-        'Zagreb': 'ZAG',
-        
-        # North America - USA
-        'New York': 'JFK',
-        'Los Angeles': 'LAX',
-        'Chicago': 'ORD',
-        'San Francisco': 'SFO',
-        'Miami': 'MIA',
-        'Boston': 'BOS',
-        'Washington': 'IAD',
-        'Seattle': 'SEA',
-        'Atlanta': 'ATL',
-        'Dallas': 'DFW',
-        'Houston': 'IAH',
-        'Las Vegas': 'LAS',
-        'Phoenix': 'PHX',
-        'Denver': 'DEN',
-        'Philadelphia': 'PHL',
-        'Detroit': 'DTW',
-        'Minneapolis': 'MSP',
-        'Orlando': 'MCO',
-        
-        # North America - Canada
-        'Toronto': 'YYZ',
-        'Vancouver': 'YVR',
-        'Montreal': 'YUL',
-        'Calgary': 'YYC',
-        'Ottawa': 'YOW',
-        'Edmonton': 'YEG',
-        
-        # North America - Mexico
-        'Mexico City': 'MEX',
-        'Cancun': 'CUN',
-        'Guadalajara': 'GDL',
-        
-        # South America
-        'São Paulo': 'GRU',
-        'Rio de Janeiro': 'GIG',
-        'Buenos Aires': 'EZE',
-        'Lima': 'LIM',
-        'Bogotá': 'BOG',
-        'Santiago': 'SCL',
-        'Caracas': 'CCS',
-        
-        # Africa
-        'Johannesburg': 'JNB',
-        'Cape Town': 'CPT',
-        'Cairo': 'CAI',
-        'Casablanca': 'CMN',
-        'Lagos': 'LOS',
-        'Nairobi': 'NBO',
-        'Addis Ababa': 'ADD',
-        'Accra': 'ACC',
-        
-        # Australia & Oceania
-        'Sydney': 'SYD',
-        'Melbourne': 'MEL',
-        'Brisbane': 'BNE',
-        'Perth': 'PER',
-        'Adelaide': 'ADL',
-        'Auckland': 'AKL',
-        'Wellington': 'WLG',
-        'Christchurch': 'CHC',
-        'Fiji': 'NAN',
-        'Honolulu': 'HNL',
-    }
+logger = logging.getLogger(__name__)
 
 
 def approved_required(view_func):
@@ -388,6 +60,16 @@ def approved_required(view_func):
         return redirect('login')
     return _wrapped_view
 
+def extract_city_name(location_str):
+    """Extract city name from input (remove airport codes in parentheses)"""
+    if not location_str:
+        return ''
+    # Remove airport code in parentheses like "Delhi (DEL)" -> "Delhi"
+    match = re.match(r'^(.+?)(\s*\([^)]+\))?$', location_str.strip())
+    if match:
+        return match.group(1).strip()
+    return location_str.strip()
+
 def get_client_ip(request):
     """Get client IP address"""
     x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
@@ -446,28 +128,17 @@ def homepage(request):
         },
     ]
     
-    # Get airport codes dictionary
-    airport_codes = get_airport_codes()
-    
-    # Get unique locations from database routes
-    origins_list = list(Route.objects.values_list('from_location', flat=True).distinct())
-    destinations_list = list(Route.objects.values_list('to_location', flat=True).distinct())
-    
-    # Combine database locations with all cities from airport_codes
-    # This ensures all cities (including Lucknow) appear in dropdown even if no routes exist yet
-    all_cities = set(airport_codes.keys())
-    origins_set = set(origins_list) | all_cities
-    destinations_set = set(destinations_list) | all_cities
-    
-    origins = sorted(list(origins_set))
-    destinations = sorted(list(destinations_set))
+    # Airport codes and the pre-sorted route locations (+ all airport cities) for the dropdowns
+    airport_registry = airports.get_registry()
+    airport_codes = airport_registry.codes
+    origins = airport_registry.origins
+    destinations = airport_registry.destinations
     
-    # Get available dates from Schedule (admin-controlled dates only)
-    available_dates = Schedule.objects.filter(
-        is_active=True,
-        departure_date__gte=date.today(),
-        available_seats__gt=0
-    ).values_list('departure_date', flat=True).distinct().order_by('departure_date')
+    # Get available dates from the fare calendar (admin-controlled dates only)
+    available_dates = FareCalendarDay.objects.filter(
+        day__gte=date.today(),
+        seats_left__gt=0
+    ).values_list('day', flat=True).distinct().order_by('day')
     
     # Convert to list of date strings for JavaScript
     available_dates_list = [d.isoformat() for d in available_dates]
@@ -540,18 +211,8 @@ def search_flights(request):
     passengers = adults + children  # Infants don't need seats
     
     # Get comprehensive airport codes
-    airport_codes = get_airport_codes()
-    
-    # Extract city name from input (remove airport codes in parentheses)
-    import re
-    def extract_city_name(location_str):
-        if not location_str:
-            return ''
-        # Remove airport code in parentheses like "Delhi (DEL)" -> "Delhi"
-        match = re.match(r'^(.+?)(\s*\([^)]+\))?$', location_str.strip())
-        if match:
-            return match.group(1).strip()
-        return location_str.strip()
+    airport_registry = airports.get_registry()
+    airport_codes = airport_registry.codes
     
     from_location = extract_city_name(from_location)
     to_location = extract_city_name(to_location)
@@ -565,105 +226,53 @@ def search_flights(request):
         messages.error(request, 'Origin and destination cannot be the same.')
         return redirect('homepage')
     
-    # Start with base query - use case-insensitive matching
-    base_flights = Schedule.objects.select_related('route').filter(
-        route__from_location__iexact=from_location,
-        route__to_location__iexact=to_location,
-        is_active=True
-    )
-    
-    # First try with route type filter if specified
-    flights = base_flights
-    if route_type and route_type in dict(Route.ROUTE_TYPE_CHOICES):
-        flights = base_flights.filter(route__route_type=route_type)
-        # If no flights found with route type, try without route type filter
-        if not flights.exists():
-            flights = base_flights
-            messages.info(request, f'No {route_type} flights found. Showing all available flights.')
-    
     # Filter by travel date if specified
+    travel_date_obj = None
     if travel_date:
         try:
             travel_date_obj = datetime.strptime(travel_date, '%Y-%m-%d').date()
             if travel_date_obj < timezone.now().date():
                 messages.error(request, 'Please select a future date.')
                 return redirect('homepage')
-            flights = flights.filter(departure_date=travel_date_obj)
         except ValueError:
             messages.error(request, 'Invalid date format.')
             return redirect('homepage')
     
-    # Filter only future dates
-    flights = flights.filter(departure_date__gte=timezone.now().date())
-    
-    # Filter flights with enough available seats
-    flights = flights.filter(available_seats__gte=passengers)
-    
-    # Filter by flight type if specified (Direct/Via)
-    if flight_type and flight_type != 'any':
-        flights = flights.filter(route__flight_type=flight_type)
-    
-    # Order by adult fare (or use route base_price) and departure date
-    flights = flights.order_by('adult_fare', 'departure_date')
-    
-    # Filter by travel class (Currently only Economy is supported in DB)
-    if travel_class and travel_class != 'economy':
-        # logic: if user asks for Business/First, and we only have Economy (implicit), return nothing.
-        flights = flights.none()
-        if trip_type != 'return': # avoid double messages if checking return too
-             messages.warning(request, f'No {travel_class.title()} Class flights available for this route.')
-    
-    # Search for return flights if trip_type is 'return'
-    return_flights = None
+    # Validate return date for round trips
+    return_date_obj = None
     if trip_type == 'return' and return_date:
         try:
             return_date_obj = datetime.strptime(return_date, '%Y-%m-%d').date()
-            if return_date_obj < timezone.now().date():
-                messages.error(request, 'Return date must be in the future.')
-                return redirect('homepage')
-            
-            # Validate return date is after departure date
-            if travel_date:
-                travel_date_obj = datetime.strptime(travel_date, '%Y-%m-%d').date()
-                if return_date_obj <= travel_date_obj:
-                    messages.error(request, 'Return date must be after departure date.')
-                    return redirect('homepage')
-            
-            # Search for return flights (reverse route: to_location -> from_location)
-            return_base_flights = Schedule.objects.select_related('route').filter(
-                route__from_location__iexact=to_location,
-                route__to_location__iexact=from_location,
-                is_active=True
-            )
-            
-            # Apply route type filter if specified
-            if route_type and route_type in dict(Route.ROUTE_TYPE_CHOICES):
-                return_base_flights = return_base_flights.filter(route__route_type=route_type)
-            
-            # Filter by return date
-            return_flights = return_base_flights.filter(departure_date=return_date_obj)
-            
-            # Filter only future dates
-            return_flights = return_flights.filter(departure_date__gte=timezone.now().date())
-            
-            # Filter flights with enough available seats
-            return_flights = return_flights.filter(available_seats__gte=passengers)
-            
-            # Order by price and departure date
-            return_flights = return_flights.order_by('adult_fare', 'departure_date')
-            
         except ValueError:
             messages.error(request, 'Invalid return date format.')
             return redirect('homepage')
+        if return_date_obj < timezone.now().date():
+            messages.error(request, 'Return date must be in the future.')
+            return redirect('homepage')
+        
+        # Validate return date is after departure date
+        if travel_date_obj and return_date_obj <= travel_date_obj:
+            messages.error(request, 'Return date must be after departure date.')
+            return redirect('homepage')
     
-    # Get route information
-    route_info = None
-    if flights.exists():
-        route_info = flights.first().route
+    # One query per leg (or none on a cache hit); return leg is the reverse route
+    search_service = SearchService(
+        passengers=passengers,
+        flight_type=flight_type,
+        route_type=route_type,
+        travel_class=travel_class,
+    )
+    search = search_service.search(from_location, to_location, travel_date_obj, return_date_obj)
+    
+    # Filter by travel class (Currently only Economy is supported in DB)
+    if not search_service.class_available and trip_type != 'return': # avoid double messages if checking return too
+        messages.warning(request, f'No {travel_class.title()} Class flights available for this route.')
+    if search.outbound.used_fallback:
+        messages.info(request, f'No {route_type} flights found. Showing all available flights.')
     
     # Get airport codes for display
-    from_airport_code = airport_codes.get(from_location, '')
-    to_airport_code = airport_codes.get(to_location, '')
+    from_airport_code = airport_registry.code_for(from_location)
+    to_airport_code = airport_registry.code_for(to_location)
     
     # Get travel class if provided
     travel_class = request.GET.get('travel_class', 'economy').strip()
@@ -687,16 +296,28 @@ def search_flights(request):
             next_date = (travel_date_obj + timedelta(days=1)).strftime('%Y-%m-%d')
             
             # Generate 7-day range centered around travel_date (3 before, current, 3 after)
+            # with the cheapest fare per day from the fare calendar
             start_date = max(travel_date_obj - timedelta(days=3), timezone.now().date())
-            for i in range(7):
-                check_date = start_date + timedelta(days=i)
-                date_range.append(check_date.strftime('%Y-%m-%d'))
+            strip_days = [start_date + timedelta(days=i) for i in range(7)]
+            calendar = FareCalendarDay.for_days(
+                FlightSearchIndex.normalize_location(from_location),
+                FlightSearchIndex.normalize_location(to_location),
+                strip_days
+            )
+            for check_date in strip_days:
+                cell = calendar.get(check_date)
+                date_range.append({
+                    'date': check_date.strftime('%Y-%m-%d'),
+                    'day': check_date,
+                    'min_fare': cell.min_adult_fare if cell else None,
+                    'seats_left': cell.seats_left if cell else 0,
+                    'is_selected': check_date == travel_date_obj,
+                })
         except ValueError:
             pass
     
     context = {
-        'flights': flights,
-        'return_flights': return_flights,
+        'search': search,
         'from_location': from_location,
         'to_location': to_location,
         'from_airport_code': from_airport_code,
@@ -712,9 +333,6 @@ def search_flights(request):
         'children': children,
         'infants': infants,
         'travel_class': travel_class,
-        'route_info': route_info,
-        'total_flights': flights.count(),
-        'total_return_flights': return_flights.count() if return_flights else 0,
         'previous_date': previous_date,
         'next_date': next_date,
         'date_range': date_range,
@@ -722,6 +340,44 @@ def search_flights(request):
     return render(request, 'search.html', context)
 
 
+@login_required
+@require_GET
+def fare_calendar_api(request):
+    """Month of per-day cheapest fares and seats for an origin/destination pair"""
+    from_location = extract_city_name(request.GET.get('from_location', ''))
+    to_location = extract_city_name(request.GET.get('to_location', ''))
+    if not from_location or not to_location:
+        return JsonResponse({'success': False, 'error': 'from_location and to_location are required'}, status=400)
+    
+    month = request.GET.get('month', '').strip()
+    try:
+        month_start = datetime.strptime(month, '%Y-%m').date() if month else timezone.now().date().replace(day=1)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'month must be in YYYY-MM format'}, status=400)
+    
+    cells = FareCalendarDay.for_month(
+        FlightSearchIndex.normalize_location(from_location),
+        FlightSearchIndex.normalize_location(to_location),
+        month_start.year,
+        month_start.month
+    )
+    days = [
+        {
+            'date': cell.day.isoformat(),
+            'min_adult_fare': str(cell.min_adult_fare),
+            'seats_left': cell.seats_left,
+        }
+        for cell in cells
+    ]
+    return JsonResponse({
+        'success': True,
+        'from_location': from_location,
+        'to_location': to_location,
+        'month': month_start.strftime('%Y-%m'),
+        'days': days,
+    })
+
+
 @login_required
 def booking_page(request, schedule_id):
     """B2B Booking page for a specific flight with multiple passenger support"""
@@ -775,8 +431,8 @@ def booking_page(request, schedule_id):
             return redirect('search_flights')
     
     # Ensure passengers doesn't exceed available seats
-    if passengers > schedule.available_seats:
-        passengers = schedule.available_seats
+    if passengers > schedule.bookable_seats:
+        passengers = schedule.bookable_seats
         messages.warning(request, f'Maximum {passengers} passengers can be booked for this flight.')
     
     if request.method == 'POST':
@@ -789,8 +445,8 @@ def booking_page(request, schedule_id):
         seats_booked = adults + children
         
         # Check availability
-        if schedule.available_seats < seats_booked:
-            messages.error(request, f'Not enough seats available! Only {schedule.available_seats} seats left.')
+        if schedule.bookable_seats < seats_booked:
+            messages.error(request, f'Not enough seats available! Only {schedule.bookable_seats} seats left.')
             # Preserve passenger counts in redirect
             from urllib.parse import urlencode
             redirect_params = {
@@ -897,8 +553,8 @@ def booking_page(request, schedule_id):
             try:
                 return_schedule = Schedule.objects.get(id=return_schedule_id)
                 # Check return flight availability
-                if return_schedule.available_seats < seats_booked:
-                    messages.error(request, f'Not enough seats available on return flight! Only {return_schedule.available_seats} seats left.')
+                if return_schedule.bookable_seats < seats_booked:
+                    messages.error(request, f'Not enough seats available on return flight! Only {return_schedule.bookable_seats} seats left.')
                     return redirect('booking', schedule_id=schedule_id)
             except Schedule.DoesNotExist:
                 messages.error(request, 'Return flight not found.')
@@ -968,7 +624,7 @@ def booking_page(request, schedule_id):
             pass
     
     # Get comprehensive airport codes
-    airport_codes = get_airport_codes()
+    airport_codes = airports.get_registry().codes
     
     # Get fare information
     adult_fare = schedule.get_fare_for_passenger_type('adult')
@@ -1091,7 +747,7 @@ def review_booking(request, schedule_id):
             pass
     
     # Get comprehensive airport codes
-    airport_codes = get_airport_codes()
+    airport_codes = airports.get_registry().codes
     
     context = {
         'schedule': schedule,
@@ -1168,8 +824,8 @@ def handle_booking_confirmation(request, schedule_id):
     seats_booked = booking_data.get('seats_booked', 1)
     
     # Check availability again
-    if schedule.available_seats < seats_booked:
-        messages.error(request, f'Not enough seats available! Only {schedule.available_seats} seats left.')
+    if schedule.bookable_seats < seats_booked:
+        messages.error(request, f'Not enough seats available! Only {schedule.bookable_seats} seats left.')
         return redirect('booking', schedule_id=schedule_id)
     
     # Get return schedule if it's a return trip
@@ -1180,8 +836,8 @@ def handle_booking_confirmation(request, schedule_id):
         try:
             return_schedule = Schedule.objects.get(id=return_schedule_id)
             # Check return flight availability
-            if return_schedule.available_seats < seats_booked:
-                messages.error(request, f'Not enough seats available on return flight! Only {return_schedule.available_seats} seats left.')
+            if return_schedule.bookable_seats < seats_booked:
+                messages.error(request, f'Not enough seats available on return flight! Only {return_schedule.bookable_seats} seats left.')
                 return redirect('booking', schedule_id=schedule_id)
         except Schedule.DoesNotExist:
             messages.error(request, 'Return flight not found.')
@@ -1194,9 +850,6 @@ def handle_booking_confirmation(request, schedule_id):
         try:
             from .models import Coupon
             coupon = Coupon.objects.get(id=booking_data.get('coupon_id'))
-            # Increment usage count
-            coupon.used_count += 1
-            coupon.save()
         except Coupon.DoesNotExist:
             pass
     
@@ -1219,6 +872,17 @@ def handle_booking_confirmation(request, schedule_id):
         user_agent=request.META.get('HTTP_USER_AGENT', '')
     )
     
+    # Hold the seats until payment (released by the expiry sweeper if unpaid)
+    if not inventory.hold_seats(booking, seats_booked):
+        booking.delete()
+        messages.error(request, 'Sorry, these seats were just taken. Please choose another flight.')
+        return redirect('booking', schedule_id=schedule_id)
+    
+    # Increment coupon usage count
+    if coupon:
+        coupon.used_count += 1
+        coupon.save()
+    
     # Create BookingPassenger records and assign PNRs
     from datetime import datetime
     passenger_data = booking_data.get('passenger_data', [])
@@ -1448,24 +1112,24 @@ def apply_visa(request):
             
             # 2. Handle Easebuzz Payment
             elif payment_method == 'easebuzz':
-                easebuzz_merchant_key = getattr(settings, 'EASEBUZZ_MERCHANT_KEY', '')
-                easebuzz_merchant_salt = getattr(settings, 'EASEBUZZ_MERCHANT_SALT', '')
+                gateway = get_client()
                 
-                if not easebuzz_merchant_key or not easebuzz_merchant_salt:
+                if not gateway.configured:
                     messages.error(request, 'Online payment gateway not configured. Please use wallet payment.')
                     visa_booking.delete()
                     return render(request, 'apply_visa.html', {**context, 'visa': selected_visa})
                 
                 try:
-                    import requests
                     txnid = f"VISATXN_{visa_booking.id}_{int(timezone.now().timestamp())}"
                     visa_booking.payment_id = txnid
                     visa_booking.save()
+                    PaymentTransaction.start(
+                        txnid, visa_booking, visa_booking.price,
+                        PaymentTransaction.Purpose.VISA, user=request.user
+                    )
                     
-                    payment_url = getattr(settings, 'EASEBUZZ_PAYMENT_URL', 'https://pay.easebuzz.in/payment/initiateLink')
-                    
-                    payment_data = {
-                        'key': easebuzz_merchant_key,
+                    # Call API (key and hash are added by the client)
+                    payment_redirect_url = gateway.initiate_payment({
                         'txnid': txnid,
                         'amount': f"{float(visa_booking.price):.2f}",
                         'productinfo': f'Visa Application - {visa_booking.reference_id}',
@@ -1476,24 +1140,13 @@ def apply_visa(request):
                         'furl': request.build_absolute_uri(reverse('payment_failed')),
                         'udf1': 'visa', # Help identify this as a visa payment in callback
                         'udf2': visa_booking.reference_id,
-                        'udf3': '', 'udf4': '', 'udf5': '', 'udf6': '', 'udf7': '', 'udf8': '', 'udf9': '', 'udf10': '',
-                    }
-                    
-                    # Generate hash (helper should be available in scope)
-                    payment_data['hash'] = generate_easebuzz_hash(payment_data, easebuzz_merchant_salt)
-                    
-                    # Call API
-                    response = requests.post(payment_url, data=payment_data)
-                    response_json = response.json()
-                    
-                    if response_json.get('status') == 1:
-                        return redirect(response_json.get('data'))
-                    else:
-                        error_msg = response_json.get('error_desc', 'Unknown error')
-                        messages.error(request, f'Payment initiation failed: {error_msg}')
-                        visa_booking.delete()
-                        return render(request, 'apply_visa.html', {**context, 'visa': selected_visa})
+                    })
+                    return redirect(payment_redirect_url)
                         
+                except EasebuzzError as e:
+                    messages.error(request, str(e))
+                    visa_booking.delete()
+                    return render(request, 'apply_visa.html', {**context, 'visa': selected_visa})
                 except Exception as e:
                     messages.error(request, f'Easebuzz redirection failed: {str(e)}')
                     visa_booking.delete()
@@ -1626,41 +1279,11 @@ def dashboard(request):
         payment_status=Booking.PaymentStatus.PAID
     ).aggregate(Sum('total_amount'))['total_amount__sum'] or Decimal('0')
     
-    # Get OD Wallet information (admin controlled)
-    od_wallet = None
-    od_wallet_balance = Decimal('0')
-    has_od_wallet_access = False
-    od_wallet_days_remaining = None
-    od_wallet_is_expired = False
-    try:
-        od_wallet = ODWallet.objects.get(user=request.user)
-        od_wallet_balance = od_wallet.balance
-        has_od_wallet_access = od_wallet.is_active and not od_wallet.is_expired()
-        od_wallet_days_remaining = od_wallet.days_remaining()
-        od_wallet_is_expired = od_wallet.is_expired()
-        
-        # Auto-process expired wallet if needed
-        if od_wallet_is_expired and od_wallet.is_active:
-            od_wallet.process_expiry()
-            od_wallet.refresh_from_db()
-            od_wallet_balance = od_wallet.balance
-            has_od_wallet_access = False
-    except ODWallet.DoesNotExist:
-        pass
-    
-    # Get Cash Balance Wallet information (user self-recharge, direct access)
-    cash_balance_wallet = None
-    cash_balance = Decimal('0')
-    try:
-        cash_balance_wallet = CashBalanceWallet.objects.get(user=request.user)
-        cash_balance = cash_balance_wallet.balance
-    except CashBalanceWallet.DoesNotExist:
-        # Create cash balance wallet if it doesn't exist (auto-create for all users)
-        cash_balance_wallet = CashBalanceWallet.objects.create(user=request.user)
-        cash_balance = Decimal('0')
+    # Wallets come from the per-request snapshot shared with wallet_context
+    wallets = get_wallet_snapshot(request)
     
     # Get comprehensive airport codes
-    airport_codes = get_airport_codes()
+    airport_codes = airports.get_registry().codes
     
     context = {
         'total_bookings': all_bookings.count(),
@@ -1673,13 +1296,13 @@ def dashboard(request):
         'airport_codes': airport_codes,
         'user': request.user,
         'profile': profile,
-        'od_wallet': od_wallet,
-        'od_wallet_balance': od_wallet_balance,
-        'has_od_wallet_access': has_od_wallet_access,
-        'od_wallet_days_remaining': od_wallet_days_remaining,
-        'od_wallet_is_expired': od_wallet_is_expired,
-        'cash_balance_wallet': cash_balance_wallet,
-        'cash_balance': cash_balance,
+        'od_wallet': wallets.od_wallet,
+        'od_wallet_balance': wallets.od_wallet_balance,
+        'has_od_wallet_access': wallets.has_od_wallet_access,
+        'od_wallet_days_remaining': wallets.od_wallet_days_remaining,
+        'od_wallet_is_expired': wallets.od_wallet_is_expired,
+        'cash_balance_wallet': wallets.cash_wallet,
+        'cash_balance': wallets.cash_balance,
     }
     return render(request, 'dashboard_new.html', context)
 
@@ -1732,7 +1355,7 @@ def my_trips(request):
         user=request.user,
         status=Booking.Status.CONFIRMED,
         payment_status=Booking.PaymentStatus.PAID
-    ).select_related('schedule__route')
+    )
     
     # Apply date filters if provided
     if from_date:
@@ -1740,56 +1363,39 @@ def my_trips(request):
     if to_date:
         all_bookings = all_bookings.filter(schedule__departure_date__lte=to_date)
     
-    # Categorize bookings
-    upcoming_bookings = all_bookings.filter(
-        schedule__departure_date__gte=today,
-        status=Booking.Status.CONFIRMED
+    # Categories as filters, so they can be counted in one query
+    categories = {
+        'upcoming': Q(schedule__departure_date__gte=today, status=Booking.Status.CONFIRMED),
+        'past': Q(schedule__departure_date__lt=today),
+        'completed': Q(status=Booking.Status.COMPLETED),
+        'cancelled': Q(status=Booking.Status.CANCELLED),
+    }
+    counts = all_bookings.aggregate(
+        total_count=Count('pk'),
+        **{f'{name}_count': Count('pk', filter=condition) for name, condition in categories.items()}
     )
     
-    # Past bookings - Only confirmed and paid past bookings
-    past_bookings = all_bookings.filter(
-        schedule__departure_date__lt=today
+    # Only the displayed category is fetched, one keyset page at a time
+    # ('all' shows all confirmed and paid bookings, no pending)
+    display_bookings = all_bookings
+    if trip_type in categories:
+        display_bookings = all_bookings.filter(categories[trip_type])
+    display_bookings = display_bookings.select_related('schedule__route').prefetch_related(
+        Prefetch('passengers', queryset=BookingPassenger.objects.order_by('pk'))
     )
+    page = pagination.keyset_page(display_bookings, request.GET.get('cursor'), page_size=20)
     
-    completed_bookings = all_bookings.filter(status=Booking.Status.COMPLETED)
-    cancelled_bookings = all_bookings.filter(status=Booking.Status.CANCELLED)
-    
-    # Select display bookings based on trip type
-    if trip_type == 'upcoming':
-        display_bookings = upcoming_bookings
-    elif trip_type == 'past':
-        display_bookings = past_bookings
-    elif trip_type == 'completed':
-        display_bookings = completed_bookings
-    elif trip_type == 'cancelled':
-        display_bookings = cancelled_bookings
-    else:
-        # For 'all', show all confirmed and paid bookings (no pending)
-        display_bookings = all_bookings
-    
-    try:
-        cash_balance = CashBalanceWallet.objects.get(user=request.user).balance
-    except CashBalanceWallet.DoesNotExist:
-        CashBalanceWallet.objects.create(user=request.user)
-        cash_balance = Decimal('0')
+    cash_balance = get_wallet_snapshot(request).cash_balance
     
-    # Evaluate querysets to lists to ensure they work in templates
     context = {
-        'bookings': list(display_bookings),
-        'all_bookings': list(all_bookings),
-        'upcoming_bookings': list(upcoming_bookings),
-        'past_bookings': list(past_bookings),
-        'completed_bookings': list(completed_bookings),
-        'cancelled_bookings': list(cancelled_bookings),
-        'upcoming_count': upcoming_bookings.count(),
-        'past_count': past_bookings.count(),
-        'completed_count': completed_bookings.count(),
-        'cancelled_count': cancelled_bookings.count(),
-        'total_count': all_bookings.count(),
+        'bookings': page.rows,
+        'next_cursor': page.next_cursor,
+        'is_first_page': not request.GET.get('cursor'),
+        **counts,
         'trip_type': trip_type,
         'from_date': from_date_str,
         'to_date': to_date_str,
-        'airport_codes': get_airport_codes(),
+        'airport_codes': airports.get_registry().codes,
         'cash_balance': cash_balance,
         'today': today,
     }
@@ -1804,10 +1410,7 @@ def cancel_booking(request, booking_id):
     
     if booking.status == Booking.Status.CONFIRMED:
         # Return seats to schedule
-        schedule = booking.schedule
-        seats_to_return = booking.passengers.count()
-        schedule.available_seats += seats_to_return
-        schedule.save()
+        inventory.release_booking_seats(booking, booking.seat_count or 1)
         
         # Update booking status
         booking.status = Booking.Status.CANCELLED
@@ -1852,30 +1455,33 @@ def payment_page(request, booking_id):
                     wallet_type = 'Cash Balance'
                 
                 if wallet.balance >= booking.total_amount:
-                    # Deduct from wallet
-                    wallet.deduct_balance(
-                        amount=booking.total_amount,
-                        transaction_type='payment',
-                        description=f'Payment for booking {booking.booking_reference}',
-                        reference_id=booking.booking_reference
-                    )
-                    
-                    # Confirm booking
-                    booking.payment_status = Booking.PaymentStatus.PAID
-                    booking.status = Booking.Status.CONFIRMED
-                    
-                    # Update schedule - reduce available seats
-                    seats_booked = booking.passengers.count() or 1
-                    if booking.schedule.available_seats >= seats_booked:
-                        booking.schedule.available_seats -= seats_booked
-                        booking.schedule.save()
-                    
-                    booking.save()
+                    # Debit, seats and status commit together: if a leg has
+                    # sold out, the wallet is not charged
+                    with transaction.atomic():
+                        wallet.deduct_balance(
+                            amount=booking.total_amount,
+                            transaction_type='payment',
+                            description=f'Payment for booking {booking.booking_reference}',
+                            reference_id=booking.booking_reference
+                        )
+                        
+                        # Update schedule - reduce available seats
+                        seats_booked = booking.seat_count or 1
+                        if not inventory.confirm_booking_seats(booking, seats_booked):
+                            raise inventory.SeatsUnavailable(booking.pk)
+                        
+                        # Confirm booking
+                        booking.payment_status = Booking.PaymentStatus.PAID
+                        booking.status = Booking.Status.CONFIRMED
+                        booking.save()
                     
                     messages.success(request, f'Payment successful using {wallet_type}! Booking confirmed: {booking.booking_reference}')
                     return redirect('booking_confirmation', booking_id=booking.id)
                 else:
                     messages.error(request, f'Insufficient {wallet_type} balance. Your balance: ₹{wallet.balance}, Required: ₹{booking.total_amount}')
+            except inventory.SeatsUnavailable:
+                messages.error(request, f'Sorry, the seats on this flight are no longer available. Nothing has been deducted from your {wallet_type}.')
+                return redirect('payment', booking_id=booking.id)
             except ODWallet.DoesNotExist:
                 messages.error(request, 'OD Wallet is not available or not activated.')
             except CashBalanceWallet.DoesNotExist:
@@ -1886,55 +1492,36 @@ def payment_page(request, booking_id):
     # Handle skip payment (for testing)
     if request.method == 'POST' and request.POST.get('payment_method') == 'skip':
         # For testing: confirm booking without payment
-        booking.payment_status = Booking.PaymentStatus.PAID
-        booking.status = Booking.Status.CONFIRMED
-        
-        # Update schedule - reduce available seats
-        seats_booked = booking.passengers.count() or 1
-        if booking.schedule.available_seats >= seats_booked:
-            booking.schedule.available_seats -= seats_booked
-            booking.schedule.save()
-        
-        booking.save()
+        seats_booked = booking.seat_count or 1
+        try:
+            with transaction.atomic():
+                # Update schedule - reduce available seats
+                if not inventory.confirm_booking_seats(booking, seats_booked):
+                    raise inventory.SeatsUnavailable(booking.pk)
+                booking.payment_status = Booking.PaymentStatus.PAID
+                booking.status = Booking.Status.CONFIRMED
+                booking.save()
+        except inventory.SeatsUnavailable:
+            messages.error(request, 'Sorry, the seats on this flight are no longer available.')
+            return redirect('payment', booking_id=booking.id)
         
         messages.success(request, f'Booking confirmed: {booking.booking_reference} (Payment skipped for testing)')
         return redirect('booking_confirmation', booking_id=booking.id)
     
-    # Get OD Wallet information for payment page
-    od_wallet = None
-    od_wallet_balance = Decimal('0')
-    can_use_od_wallet = False
-    od_wallet_days_remaining = None
-    od_wallet_is_expired = False
-    try:
-        od_wallet = ODWallet.objects.get(user=request.user, is_active=True)
-        od_wallet_is_expired = od_wallet.is_expired()
-        if od_wallet_is_expired:
-            od_wallet.process_expiry()
-            od_wallet.refresh_from_db()
-        od_wallet_balance = od_wallet.balance
-        can_use_od_wallet = not od_wallet_is_expired and od_wallet.balance >= booking.total_amount and od_wallet.is_active
-        od_wallet_days_remaining = od_wallet.days_remaining()
-    except ODWallet.DoesNotExist:
-        pass
-    
-    # Get Cash Balance Wallet information for payment page
-    cash_balance_wallet = None
-    cash_balance = Decimal('0')
-    can_use_cash_balance = False
-    try:
-        cash_balance_wallet = CashBalanceWallet.objects.get(user=request.user)
-        cash_balance = cash_balance_wallet.balance
-        can_use_cash_balance = cash_balance_wallet.balance >= booking.total_amount
-    except CashBalanceWallet.DoesNotExist:
-        # Auto-create cash balance wallet if it doesn't exist
-        cash_balance_wallet = CashBalanceWallet.objects.create(user=request.user)
-        cash_balance = Decimal('0')
+    # Wallets come from the per-request snapshot shared with wallet_context
+    wallets = get_wallet_snapshot(request)
+    od_wallet = wallets.od_wallet if wallets.od_wallet and wallets.od_wallet.is_active else None
+    od_wallet_balance = od_wallet.balance if od_wallet else Decimal('0')
+    od_wallet_is_expired = wallets.od_wallet_is_expired if od_wallet else False
+    od_wallet_days_remaining = wallets.od_wallet_days_remaining if od_wallet else None
+    can_use_od_wallet = bool(od_wallet) and not od_wallet_is_expired and od_wallet.balance >= booking.total_amount
+    
+    cash_balance_wallet = wallets.cash_wallet
+    cash_balance = wallets.cash_balance
+    can_use_cash_balance = cash_balance >= booking.total_amount
     
     # Check if Easebuzz is configured
-    easebuzz_merchant_key = getattr(settings, 'EASEBUZZ_MERCHANT_KEY', '')
-    easebuzz_merchant_salt = getattr(settings, 'EASEBUZZ_MERCHANT_SALT', '')
-    easebuzz_env = getattr(settings, 'EASEBUZZ_ENV', 'prod')
+    gateway = get_client()
     
     # Prepare Easebuzz payment data
     payment_redirect_url = None
@@ -1942,12 +1529,14 @@ def payment_page(request, booking_id):
     
     # Process Easebuzz payment only if explicitly requested via POST
     if request.method == 'POST' and request.POST.get('payment_method') == 'easebuzz':
-        if easebuzz_merchant_key and easebuzz_merchant_salt:
+        if gateway.configured:
             try:
-                import requests
-                
-                # Generate unique transaction ID
+                # Generate unique transaction ID and record it in the payment ledger
                 txnid = f"TXN_{booking.id}_{int(timezone.now().timestamp())}"
+                payment_txn = PaymentTransaction.start(
+                    txnid, booking, booking.total_amount,
+                    PaymentTransaction.Purpose.FLIGHT_BOOKING, user=request.user
+                )
                 
                 # Prepare payment data for Easebuzz
                 # Get phone number and ensure it's exactly 10 digits
@@ -1960,10 +1549,8 @@ def payment_page(request, booking_id):
                     phone_number = '9999999999'  # Default valid phone number
                 
                 amount_str = f"{float(booking.total_amount):.2f}"
-                payment_url = getattr(settings, 'EASEBUZZ_PAYMENT_URL', 'https://pay.easebuzz.in/payment/initiateLink')
                 
                 payment_data_dict = {
-                    'key': easebuzz_merchant_key,
                     'txnid': txnid,
                     'amount': amount_str,
                     'productinfo': f'Flight Booking - {booking.booking_reference}',
@@ -1972,77 +1559,25 @@ def payment_page(request, booking_id):
                     'phone': phone_number,
                     'surl': request.build_absolute_uri(reverse('payment_success')),
                     'furl': request.build_absolute_uri(reverse('payment_failed')),
-                    'udf1': '',
-                    'udf2': '',
-                    'udf3': '',
-                    'udf4': '',
-                    'udf5': '',
-                    'udf6': '',
-                    'udf7': '',
-                    'udf8': '',
-                    'udf9': '',
-                    'udf10': '',
                 }
                 
-                # Generate Hash
-                payment_data_dict['hash'] = generate_easebuzz_hash(payment_data_dict, easebuzz_merchant_salt)
-                
                 # Call Easebuzz API to get payment URL
-                print("=" * 50)
-                print("EASEBUZZ DIRECT API CALL:")
-                print(f"URL: {payment_url}")
-                print(f"TxnID: {txnid}")
-                print(f"Amount: {amount_str}")
-                print("=" * 50)
+                logger.info('Initiating Easebuzz payment %s for %s', txnid, amount_str)
                 
                 try:
-                    response = requests.post(payment_url, data=payment_data_dict)
-                    print(f"Response Status: {response.status_code}")
-                    print(f"Response Text: {response.text}")
-                    
-                    response_json = response.json()
-                    
-                    if response_json.get('status') == 1 and response_json.get('data'):
-                         access_data = response_json.get('data')
-                         # Check if data is a URL or an Access Key
-                         if access_data.startswith('http'):
-                             payment_redirect_url = access_data
-                         else:
-                             # It's an Access Key, construct the URL
-                             # Base URL depends on environment (prod/test)
-                             # We know we are in prod now
-                             payment_redirect_url = f"https://pay.easebuzz.in/pay/{access_data}"
-                    else:
-                        print(f"❌ Easebuzz Error: {response_json.get('data')}")
-                        payment_redirect_url = None
-                        
-                except Exception as api_err:
-                    print(f"❌ API Request Failed: {str(api_err)}")
+                    payment_redirect_url = gateway.initiate_payment(payment_data_dict)
+                except EasebuzzError as api_err:
+                    logger.warning('Easebuzz payment %s could not be initiated: %s', txnid, api_err)
                     payment_redirect_url = None
 
                 
                 # If we got a payment URL
-                if payment_redirect_url:
-                    print(f"✅ Payment URL received: {payment_redirect_url}")
-                    
-                    # Store txnid in booking
-                    if not booking.notes:
-                        booking.notes = json.dumps({'easebuzz_txnid': txnid})
-                    else:
-                        try:
-                            notes = json.loads(booking.notes) if booking.notes else {}
-                        except:
-                            notes = {}
-                        notes['easebuzz_txnid'] = txnid
-                        booking.notes = json.dumps(notes)
-                    booking.save()
-                else:
+                if not payment_redirect_url:
+                    payment_txn.mark_failed(gateway_status='initiate_failed')
                     messages.error(request, 'Failed to initiate payment. Please try again or use another method.')
             
-            except Exception as e:
-                import traceback
-                print(f"❌ General Error: {str(e)}")
-                print(traceback.format_exc())
+            except Exception:
+                logger.exception('Payment initiation failed for booking %s', booking.pk)
                 messages.error(request, 'An internal error occurred. Please try again.')
                 payment_redirect_url = None
         else:
@@ -2054,7 +1589,7 @@ def payment_page(request, booking_id):
             return redirect(payment_redirect_url)
     
     # Get comprehensive airport codes
-    airport_codes = get_airport_codes()
+    airport_codes = airports.get_registry().codes
     
     context = {
         'booking': booking,
@@ -2069,6 +1604,7 @@ def payment_page(request, booking_id):
         'can_use_cash_balance': can_use_cash_balance,
         'easebuzz_available': payment_redirect_url is not None,
         'amount': amount_in_paise,
+        'seat_hold': booking.seat_holds.filter(status=SeatHold.Status.ACTIVE).order_by('expires_at').first(),
     }
     return render(request, 'payment.html', context)
 
@@ -2082,18 +1618,6 @@ def payment_success(request):
     else:
         data = request.GET
     
-    # Debug: Print all received data
-    print("=" * 50)
-    print("PAYMENT SUCCESS CALLBACK RECEIVED:")
-    print(f"Method: {request.method}")
-    print("Received Data:")
-    for key, value in data.items():
-        if key == 'hash':
-            print(f"  {key}: {value[:20]}... (truncated)")
-        else:
-            print(f"  {key}: {value}")
-    print("=" * 50)
-    
     txnid = data.get('txnid')
     amount = data.get('amount')
     productinfo = data.get('productinfo')
@@ -2103,13 +1627,7 @@ def payment_success(request):
     hash_value = data.get('hash')
     status = data.get('status')
     
-    print(f"Transaction ID: {txnid}")
-    print(f"Amount: {amount}")
-    print(f"Status: {status}")
-    print(f"Hash: {hash_value[:20] if hash_value else 'None'}... (truncated)")
-    
     if not txnid or not hash_value:
-        print("❌ Missing txnid or hash")
         messages.error(request, 'Invalid payment data received.')
         return redirect('payment_failed')
     
@@ -2125,10 +1643,13 @@ def payment_success(request):
         booking = None
         visa_booking = None
         
-        # 1. Identify which type of booking this is
+        # 1. Identify which type of booking this is (indexed lookup in the payment ledger)
+        payment_txn = PaymentTransaction.for_txnid(txnid)
+        target = payment_txn.target if payment_txn else None
+        
         if txnid.startswith('VISATXN_'):
             # This is a Visa Booking
-            visa_booking = VisaBooking.objects.filter(payment_id=txnid).first()
+            visa_booking = target if isinstance(target, VisaBooking) else None
             if not visa_booking:
                 # Try finding by udf2 as backup
                 udf2 = data.get('udf2')
@@ -2139,27 +1660,16 @@ def payment_success(request):
                 messages.error(request, 'Visa application not found.')
                 return redirect('dashboard')
             
-            # Check price/amount
-            booking_amount = visa_booking.price
             confirmation_url = reverse('visa_thanks', kwargs={'booking_id': visa_booking.reference_id})
             
         else:
             # This is a Flight Booking
-            bookings = Booking.objects.filter(notes__icontains=txnid)
-            for b in bookings:
-                try:
-                    notes = json.loads(b.notes) if b.notes else {}
-                    if notes.get('easebuzz_txnid') == txnid:
-                        booking = b
-                        break
-                except:
-                    continue
+            booking = target if isinstance(target, Booking) else None
             
             if not booking:
                 messages.error(request, 'Flight booking not found.')
                 return redirect('dashboard')
                 
-            booking_amount = booking.total_amount
             confirmation_url = reverse('booking_confirmation', kwargs={'booking_id': booking.id})
 
         # 2. Verify hash
@@ -2168,51 +1678,32 @@ def payment_success(request):
             messages.error(request, 'Payment verification failed.')
             return redirect('payment_failed')
         
-        # 3. Check payment status
-        if status != 'success':
+        if payment_txn is None:
+            # Visa application matched through udf2 without a ledger row
+            payment_txn = PaymentTransaction.start(
+                txnid, visa_booking, visa_booking.price,
+                PaymentTransaction.Purpose.VISA, user=visa_booking.user
+            )
+        
+        # 3. Check payment status and amount, then confirm (only the first
+        # successful callback for a txnid is applied)
+        outcome = payments.settle(payment_txn, status, amount, data)
+        if outcome == payments.FAILED:
             messages.error(request, f'Payment failed with status: {status}')
             return redirect('payment_failed')
-        
-        # 4. Verify amount matches
-        # Easebuzz amount might be slightly different representation (e.g. 500.00 vs 500)
-        if Decimal(amount) != booking_amount:
+        if outcome == payments.AMOUNT_MISMATCH:
             messages.error(request, 'Payment amount mismatch.')
             return redirect('payment_failed')
-            
-        # 5. Handle Payment Success
-        if visa_booking:
-            visa_booking.payment_status = VisaBooking.PaymentStatus.PAID
-            visa_booking.payment_id = txnid
-            visa_booking.save()
-            messages.success(request, f'Payment successful! Visa application {visa_booking.reference_id} submitted.')
-            return redirect(confirmation_url)
-            
-        elif booking:
-            # Already paid check
-            if booking.payment_status == Booking.PaymentStatus.PAID:
-                return redirect(confirmation_url)
-                
-            booking.payment_status = Booking.PaymentStatus.PAID
-            booking.status = Booking.Status.CONFIRMED
-            
-            # Update notes
-            try:
-                notes = json.loads(booking.notes) if booking.notes else {}
-            except:
-                notes = {}
-            notes['easebuzz_txnid'] = txnid
-            notes['easebuzz_amount'] = amount
-            booking.notes = json.dumps(notes)
-            
-            # Update seats
-            seats_booked = booking.passengers.count() or 1
-            if booking.schedule.available_seats >= seats_booked:
-                booking.schedule.available_seats -= seats_booked
-                booking.schedule.save()
-            
-            booking.save()
-            messages.success(request, f'Payment successful! Flight booking {booking.booking_reference} confirmed.')
-            return redirect(confirmation_url)
+        if outcome == payments.SEATS_UNAVAILABLE:
+            messages.error(request, f'Sorry, the seats for booking {booking.booking_reference} sold out before your payment completed. The booking has been cancelled and your payment will be refunded.')
+            return redirect('payment_failed')
+        
+        if outcome == payments.SETTLED:
+            if visa_booking:
+                messages.success(request, f'Payment successful! Visa application {visa_booking.reference_id} submitted.')
+            else:
+                messages.success(request, f'Payment successful! Flight booking {booking.booking_reference} confirmed.')
+        return redirect(confirmation_url)
 
     except Exception as e:
         import traceback
@@ -2222,6 +1713,28 @@ def payment_success(request):
         return redirect('dashboard')
 
 
+@csrf_exempt
+@require_POST
+def payment_webhook(request):
+    """Server-to-server Easebuzz webhook: verify the hash, store the event, acknowledge.
+    
+    The event is applied later by the process_payment_webhooks worker, so the
+    gateway gets its 200 without waiting on seat or booking updates.
+    """
+    data = request.POST
+    easebuzz_merchant_salt = getattr(settings, 'EASEBUZZ_MERCHANT_SALT', '')
+    hash_value = data.get('hash')
+    if not data.get('txnid') or not hash_value or not easebuzz_merchant_salt:
+        return HttpResponse('Invalid payload', status=400)
+    
+    verification_data = {k: v for k, v in data.items() if k != 'hash' and v}
+    if not verify_easebuzz_hash(verification_data, easebuzz_merchant_salt, hash_value):
+        return HttpResponse('Invalid hash', status=403)
+    
+    PaymentWebhookEvent.receive(data)
+    return HttpResponse('OK')
+
+
 @login_required
 def payment_failed(request):
     """Payment failed page"""
@@ -2275,24 +1788,34 @@ def wallet_recharge(request):
                 messages.error(request, 'Payment verification failed. Please try again.')
                 return redirect('wallet_recharge')
             
-            # Check payment status
-            if status != 'success':
-                messages.error(request, 'Payment was not successful.')
+            # Look up the recharge in the payment ledger
+            payment_txn = PaymentTransaction.for_txnid(txnid)
+            if payment_txn is None:
+                # Recharge initiated before the ledger existed
+                payment_txn = PaymentTransaction.start(
+                    txnid, wallet, Decimal(amount),
+                    PaymentTransaction.Purpose.WALLET_RECHARGE, user=request.user
+                )
+            elif payment_txn.purpose != PaymentTransaction.Purpose.WALLET_RECHARGE or payment_txn.object_id != wallet.pk:
+                messages.error(request, 'This payment does not belong to your wallet.')
                 return redirect('wallet_recharge')
             
-            # Get amount from response
-            recharge_amount = Decimal(amount)
-            
             # Get description from session
-            description = request.session.get('wallet_recharge_description', 'Wallet Recharge via Easebuzz')
+            description = request.session.get('wallet_recharge_description', payments.DEFAULT_RECHARGE_DESCRIPTION)
             
-            # Add balance to wallet (no limit)
-            wallet.add_balance(
-                amount=recharge_amount,
-                transaction_type='recharge',
-                description=description,
-                reference_id=txnid
-            )
+            # Check status and amount; the wallet is credited only for the first successful callback
+            outcome = payments.settle(payment_txn, status, amount, payment_data, description=description)
+            if outcome == payments.FAILED:
+                messages.error(request, 'Payment was not successful.')
+                return redirect('wallet_recharge')
+            if outcome == payments.AMOUNT_MISMATCH:
+                messages.error(request, 'Payment amount mismatch.')
+                return redirect('wallet_recharge')
+            if outcome == payments.ALREADY_SETTLED:
+                messages.info(request, 'This recharge has already been credited to your wallet.')
+                return redirect('wallet_history')
+            
+            wallet.refresh_from_db()
             messages.success(request, f'Wallet recharged successfully! New balance: ₹{wallet.balance}')
             
             # Clear session
@@ -2320,89 +1843,39 @@ def wallet_recharge(request):
             request.session['wallet_recharge_description'] = description
             request.session.modified = True  # Ensure session is saved
             
-            # Initialize Easebuzz payment using SDK
-            easebuzz_merchant_key = getattr(settings, 'EASEBUZZ_MERCHANT_KEY', '')
-            easebuzz_merchant_salt = getattr(settings, 'EASEBUZZ_MERCHANT_SALT', '')
-            easebuzz_env = getattr(settings, 'EASEBUZZ_ENV', 'prod')
+            # Initialize Easebuzz payment through the shared gateway client
+            gateway = get_client()
             
-            if not easebuzz_merchant_key or not easebuzz_merchant_salt:
+            if not gateway.configured:
                 messages.error(request, 'Payment gateway not configured. Please contact support.')
                 form = WalletRechargeForm(initial={'amount': amount, 'description': description})
-            elif not EASEBUZZ_SDK_AVAILABLE:
-                messages.error(request, 'Easebuzz SDK not installed. Please contact support.')
-                form = WalletRechargeForm(initial={'amount': amount, 'description': description})
             else:
                 try:
-                    # Initialize Easebuzz SDK
-                    easebuzz_obj = Easebuzz(
-                        key=easebuzz_merchant_key,
-                        salt=easebuzz_merchant_salt,
-                        env=easebuzz_env
-                    )
-                    
                     # Generate unique transaction ID
                     txnid = f"WALLET_{request.user.id}_{int(timezone.now().timestamp())}"
-                    
-                    # Prepare payment data for Easebuzz SDK
-                    payment_data_dict = {
-                        'txnid': txnid,
-                        'amount': f"{float(amount):.2f}",  # Easebuzz requires decimal format: "500.00"
-                        'productinfo': f'Wallet Recharge - {description}',
-                        'firstname': request.user.profile.full_name if hasattr(request.user, 'profile') and request.user.profile.full_name else request.user.email.split('@')[0],
-                        'email': request.user.email,
-                        'phone': str(getattr(request.user.profile, 'phone', '9999999999') if hasattr(request.user, 'profile') else '9999999999')[:10],
-                        'surl': request.build_absolute_uri(reverse('wallet_recharge')),
-                        'furl': request.build_absolute_uri(reverse('wallet_recharge')),
-                        'udf1': '',
-                        'udf2': '',
-                        'udf3': '',
-                        'udf4': '',
-                        'udf5': '',
-                    }
-                    
-                    # Convert dict to QueryDict
-                    query_dict = QueryDict('', mutable=True)
-                    query_dict.update(payment_data_dict)
+                    payment_txn = PaymentTransaction.start(
+                        txnid, wallet, amount,
+                        PaymentTransaction.Purpose.WALLET_RECHARGE, user=request.user
+                    )
                     
                     # Call Easebuzz API to get payment URL
-                    response = easebuzz_obj.initiate_payment_api(query_dict)
-                    
-                    # Handle different response formats
-                    payment_redirect_url = None
-                    response_dict = None
-                    
-                    if response:
-                        if isinstance(response, str):
-                            try:
-                                response_dict = json.loads(response)
-                            except json.JSONDecodeError:
-                                if response.startswith('http'):
-                                    payment_redirect_url = response
-                        elif isinstance(response, dict):
-                            response_dict = response
-                        
-                        if response_dict:
-                            if response_dict.get('status') == 1:
-                                payment_redirect_url = (
-                                    response_dict.get('data') or
-                                    response_dict.get('url') or
-                                    response_dict.get('payment_url') or
-                                    response_dict.get('redirect_url') or
-                                    response_dict.get('payment_link') or
-                                    response_dict.get('link')
-                                )
-                        
-                        if payment_redirect_url:
-                            return redirect(payment_redirect_url)
-                        else:
-                            error_msg = "No payment URL received"
-                            if response_dict:
-                                error_msg = response_dict.get('message') or response_dict.get('error') or response_dict.get('msg') or 'No payment URL received'
-                            messages.error(request, f'Payment gateway error: {error_msg}. Please try again.')
-                            form = WalletRechargeForm(initial={'amount': amount, 'description': description})
-                    else:
-                        messages.error(request, 'Payment gateway error: Empty response. Please try again.')
+                    try:
+                        payment_redirect_url = gateway.initiate_payment({
+                            'txnid': txnid,
+                            'amount': f"{float(amount):.2f}",  # Easebuzz requires decimal format: "500.00"
+                            'productinfo': f'Wallet Recharge - {description}',
+                            'firstname': request.user.profile.full_name if hasattr(request.user, 'profile') and request.user.profile.full_name else request.user.email.split('@')[0],
+                            'email': request.user.email,
+                            'phone': str(getattr(request.user.profile, 'phone', '9999999999') if hasattr(request.user, 'profile') else '9999999999')[:10],
+                            'surl': request.build_absolute_uri(reverse('wallet_recharge')),
+                            'furl': request.build_absolute_uri(reverse('wallet_recharge')),
+                        })
+                    except EasebuzzError as e:
+                        payment_txn.mark_failed(gateway_status='initiate_failed')
+                        messages.error(request, f'{e}. Please try again.')
                         form = WalletRechargeForm(initial={'amount': amount, 'description': description})
+                    else:
+                        return redirect(payment_redirect_url)
                     
                 except Exception as e:
                     import traceback
@@ -2431,38 +1904,81 @@ def wallet_recharge(request):
     }
     return render(request, 'wallet_recharge.html', context)
 
+def _history_wallet(request, wallet_type):
+    """Wallet shown on the history/statement pages, or None if the OD wallet is not active"""
+    if wallet_type == 'od':
+        return ODWallet.objects.filter(user=request.user, is_active=True).first()
+    wallet, created = CashBalanceWallet.objects.get_or_create(user=request.user)
+    return wallet
+
+
 @login_required
 def wallet_history(request):
     """Wallet transaction history page - supports both OD Wallet and Cash Balance Wallet"""
     wallet_type = request.GET.get('type', 'cash_balance')  # Default to cash balance
     
-    if wallet_type == 'od':
-        # OD Wallet history (only if active)
-        try:
-            wallet = ODWallet.objects.get(user=request.user, is_active=True)
-            transactions = wallet.transactions.all().order_by('-created_at')[:50]  # Last 50 transactions
-            wallet_balance = wallet.balance
-            wallet_name = 'OD Wallet'
-        except ODWallet.DoesNotExist:
-            messages.info(request, 'OD Wallet is not available or not activated.')
-            return redirect('dashboard')
-    else:
-        # Cash Balance Wallet history (direct access for everyone)
-        wallet, created = CashBalanceWallet.objects.get_or_create(user=request.user)
-        transactions = wallet.transactions.all().order_by('-created_at')[:50]  # Last 50 transactions
-        wallet_balance = wallet.balance
-        wallet_name = 'Cash Balance'
+    wallet = _history_wallet(request, wallet_type)
+    if wallet is None:
+        messages.info(request, 'OD Wallet is not available or not activated.')
+        return redirect('dashboard')
+    wallet_name = 'OD Wallet' if wallet_type == 'od' else 'Cash Balance'
+    
+    # Keyset pagination: ?cursor= continues after the last row of the previous page
+    page = statements.history_page(wallet, request.GET.get('cursor'))
     
     context = {
         'wallet': wallet,
-        'wallet_balance': wallet_balance,
-        'transactions': transactions,
+        'wallet_balance': wallet.balance,
+        'transactions': page.rows,
+        'next_cursor': page.next_cursor,
+        'is_first_page': not request.GET.get('cursor'),
         'wallet_type': wallet_type,
         'wallet_name': wallet_name,
+        'statement_from': (timezone.localdate() - timedelta(days=30)).isoformat(),
+        'statement_to': timezone.localdate().isoformat(),
     }
     
     return render(request, 'wallet_history.html', context)
 
+
+@login_required
+@require_GET
+def wallet_statement(request):
+    """Download a wallet statement for a date range as CSV or XLSX (streamed)"""
+    wallet_type = request.GET.get('type', 'cash_balance')
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in ('csv', 'xlsx'):
+        return HttpResponse('Unsupported format', status=400)
+    
+    wallet = _history_wallet(request, wallet_type)
+    if wallet is None:
+        messages.info(request, 'OD Wallet is not available or not activated.')
+        return redirect('dashboard')
+    
+    try:
+        date_to = date.fromisoformat(request.GET['to']) if request.GET.get('to') else timezone.localdate()
+        date_from = date.fromisoformat(request.GET['from']) if request.GET.get('from') else date_to - timedelta(days=30)
+    except ValueError:
+        return HttpResponse('Invalid date', status=400)
+    if date_from > date_to:
+        return HttpResponse('Start date must be before end date', status=400)
+    
+    # Whole days in local time, end date inclusive
+    start = timezone.make_aware(datetime.combine(date_from, datetime.min.time()))
+    end = timezone.make_aware(datetime.combine(date_to + timedelta(days=1), datetime.min.time()))
+    rows = statements.statement_rows(wallet, start, end)
+    
+    filename = f"{wallet_type}_statement_{date_from:%Y%m%d}_{date_to:%Y%m%d}.{export_format}"
+    if export_format == 'xlsx':
+        response = StreamingHttpResponse(
+            statements.stream_xlsx(rows),
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        )
+    else:
+        response = StreamingHttpResponse(statements.stream_csv(rows), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
 @login_required
 def group_request(request):
     """Group booking request form for B2B customers (more than 9 passengers)"""
@@ -2559,7 +2075,7 @@ def group_request(request):
             return redirect('group_request')
     
     # GET request - show form
-    airport_codes = get_airport_codes()
+    airport_codes = airports.get_registry().codes
     today = date.today().strftime('%Y-%m-%d')
     min_return_date = (date.today() + timedelta(days=1)).strftime('%Y-%m-%d')
     
@@ -2665,7 +2181,7 @@ def booking_confirmation(request, booking_id):
     booking = get_object_or_404(Booking, id=booking_id, user=request.user)
     
     # Get comprehensive airport codes
-    airport_codes = get_airport_codes()
+    airport_codes = airports.get_registry().codes
     
     context = {
         'booking': booking,
@@ -2674,37 +2190,25 @@ def booking_confirmation(request, booking_id):
     return render(request, 'booking_confirmation.html', context)
 
 
+def _ticket_context(request, booking_id):
+    """Ticket context of one of the user's bookings (404 otherwise), loaded in two queries"""
+    booking = get_object_or_404(ticket_pdfs.ticket_bookings(), id=booking_id, user=request.user)
+    return ticket_pdfs.TicketContext.for_booking(booking)
+
+
 @login_required
 @xframe_options_sameorigin
 def view_ticket(request, booking_id):
     """View ticket HTML page"""
-    booking = get_object_or_404(Booking, id=booking_id, user=request.user)
+    ticket = _ticket_context(request, booking_id)
+    booking = ticket.booking
     
     # Only allow view for confirmed and paid bookings
     if booking.status != Booking.Status.CONFIRMED or booking.payment_status != Booking.PaymentStatus.PAID:
         messages.error(request, 'Ticket can only be viewed for confirmed and paid bookings.')
         return redirect('dashboard')
     
-    # Get comprehensive airport codes
-    airport_codes = get_airport_codes()
-    
-    # Get user profile for branding (if available)
-    try:
-        user_profile = booking.user.profile
-    except:
-        user_profile = None
-    
-    # Get user details
-    user = booking.user
-    
-    context = {
-        'booking': booking,
-        'airport_codes': airport_codes,
-        'user_profile': user_profile,
-        'user': user,
-        'is_web_view': True,
-    }
-    return render(request, 'print_pdf.html', context)
+    return render(request, 'print_pdf.html', ticket.template_context(is_web_view=True))
 
 
 @login_required
@@ -2815,97 +2319,38 @@ Please process this request in the admin panel.
     return render(request, 'change_request.html', context)
 
 
-def link_callback(uri, rel):
-    """
-    Convert HTML URIs to absolute system paths so xhtml2pdf can access those resources
-    """
-    import os
-    from django.conf import settings
-    
-    # Handle static files
-    sUrl = settings.STATIC_URL        # Typically /static/
-    sRoot = settings.STATIC_ROOT      # Typically /home/user/var/www/static/
-    mUrl = settings.MEDIA_URL         # Typically /media/
-    mRoot = settings.MEDIA_ROOT       # Typically /home/user/var/www/media/
-
-    if uri.startswith(mUrl):
-        path = os.path.join(mRoot, uri.replace(mUrl, ""))
-    elif uri.startswith(sUrl):
-        path = os.path.join(sRoot, uri.replace(sUrl, ""))
-    else:
-        return uri
-
-    # Example: /home/user/var/www/static/css/style.css
-    if not os.path.isfile(path):
-        # For development where STATIC_ROOT might not be set or populated
-        if uri.startswith(sUrl):
-             # check in static directories
-             for static_dir in settings.STATICFILES_DIRS:
-                 potential_path = os.path.join(static_dir, uri.replace(sUrl, ""))
-                 if os.path.isfile(potential_path):
-                     path = potential_path
-                     break
-        
-    return path
+def _ticket_rendering_response(booking):
+    """Short "still rendering" page that reloads itself until the render worker has the ticket ready"""
+    response = HttpResponse(f'''
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <title>E-Ticket - {booking.booking_reference}</title>
+        <meta http-equiv="refresh" content="{ticket_renderer.RETRY_SECONDS}">
+    </head>
+    <body>
+        <p>Your e-ticket for booking {booking.booking_reference} is being prepared. This page will refresh in a few seconds.</p>
+    </body>
+    </html>
+    ''', content_type='text/html', status=202)
+    response['Retry-After'] = str(ticket_renderer.RETRY_SECONDS)
+    return response
+
+
+def _generate_ticket_pdf(booking, hide_fare=False, convenience_fee=0, background=False):
+    """Helper function to generate ticket PDF from HTML template (served from the ticket PDF cache when unchanged).
 
-def _generate_ticket_pdf(booking, hide_fare=False, convenience_fee=0):
-    """Helper function to generate ticket PDF from HTML template"""
+    With background=True a ticket the render worker has not prepared yet
+    raises ticket_renderer.TicketRendering instead of rendering inline.
+    """
     from io import BytesIO
-    from django.template.loader import render_to_string
-    from django.conf import settings
     
-    try:
-        # Try using xhtml2pdf (pisa) for HTML to PDF conversion
-        from xhtml2pdf import pisa
-        
-        # Get comprehensive airport codes
-        airport_codes = get_airport_codes()
-        
-        # Get user profile for branding (if available)
-        try:
-            user_profile = booking.user.profile
-        except:
-            user_profile = None
-        
-        # Get user details
-        user = booking.user
-        
-        # Calculate total with convenience fee
-        total_with_fee = float(booking.total_amount) + float(convenience_fee)
-
-        # Render HTML template (is_web_view=False for PDF generation)
-        html_string = render_to_string('print_pdf.html', {
-            'booking': booking,
-            'airport_codes': airport_codes,
-            'user_profile': user_profile,
-            'user': user,
-            'hide_fare': hide_fare,
-            'convenience_fee': convenience_fee,
-            'total_with_fee': total_with_fee,
-            'is_web_view': False,  # Not a web view, this is PDF generation
-        })
-        
-        # Create PDF buffer
-        buffer = BytesIO()
-        
-        # Convert HTML to PDF
-        pisa_status = pisa.CreatePDF(
-            html_string,
-            dest=buffer,
-            encoding='utf-8',
-            link_callback=link_callback
-        )
-        
-        if pisa_status.err:
-            # Fallback to old method if xhtml2pdf fails
-            return _generate_ticket_pdf_old(booking, hide_fare, convenience_fee)
-        
-        buffer.seek(0)
-        return buffer
-        
-    except ImportError:
-        # If xhtml2pdf is not installed, use old method
+    fetch = ticket_renderer.fetch if background else ticket_pdfs.ticket
+    pdf = fetch(booking, hide_fare, convenience_fee)
+    if pdf is None:
+        # Fallback to old method if xhtml2pdf is not installed or fails
         return _generate_ticket_pdf_old(booking, hide_fare, convenience_fee)
+    return BytesIO(pdf)
 
 
 def _generate_ticket_pdf_old(booking, hide_fare=False, convenience_fee=0):
@@ -3083,7 +2528,8 @@ def _generate_ticket_pdf_old(booking, hide_fare=False, convenience_fee=0):
 @xframe_options_sameorigin
 def download_ticket_pdf(request, booking_id):
     """View ticket HTML page with fare modification options for B2B"""
-    booking = get_object_or_404(Booking, id=booking_id, user=request.user)
+    ticket = _ticket_context(request, booking_id)
+    booking = ticket.booking
     
     # Only allow view for confirmed and paid bookings
     if booking.status != Booking.Status.CONFIRMED or booking.payment_status != Booking.PaymentStatus.PAID:
@@ -3102,30 +2548,14 @@ def download_ticket_pdf(request, booking_id):
     if modified_total < 0:
         modified_total = Decimal('0')
     
-    # Get comprehensive airport codes
-    airport_codes = get_airport_codes()
-    
-    # Get user profile for branding (if available)
-    try:
-        user_profile = booking.user.profile
-    except:
-        user_profile = None
-    
-    # Get user details
-    user = booking.user
-    
-    context = {
-        'booking': booking,
-        'airport_codes': airport_codes,
-        'user_profile': user_profile,
-        'user': user,
-        'is_web_view': view_mode,
-        'hide_fare': hide_fare,
-        'convenience_fee': convenience_fee,
-        'discount_applied': discount,
-        'total_with_fee': modified_total,
-        'show_modified_fare': convenience_fee > 0 or discount > 0,
-    }
+    context = ticket.template_context(
+        is_web_view=view_mode,
+        hide_fare=hide_fare,
+        convenience_fee=convenience_fee,
+        discount_applied=discount,
+        total_with_fee=modified_total,
+        show_modified_fare=convenience_fee > 0 or discount > 0,
+    )
     return render(request, 'print_pdf.html', context)
 
 
@@ -3144,30 +2574,14 @@ def send_ticket_email_api(request):
         return JsonResponse({'success': False, 'error': 'Missing booking_id or email'})
     
     try:
-        booking = get_object_or_404(Booking, id=booking_id, user=request.user)
+        ticket = _ticket_context(request, booking_id)
+        booking = ticket.booking
         
         if booking.status != Booking.Status.CONFIRMED or booking.payment_status != Booking.PaymentStatus.PAID:
             return JsonResponse({'success': False, 'error': 'Invalid booking status'})
         
-        # Get airport codes
-        airport_codes = get_airport_codes()
-        
-        # Get user profile
-        try:
-            user_profile = booking.user.profile
-        except:
-            user_profile = None
-        
         # Render ticket HTML
-        context = {
-            'booking': booking,
-            'airport_codes': airport_codes,
-            'user_profile': user_profile,
-            'user': booking.user,
-            'is_web_view': False,
-            'hide_fare': hide_fare,
-        }
-        html_content = render_to_string('print_pdf.html', context)
+        html_content = render_to_string('print_pdf.html', ticket.template_context(is_web_view=False, hide_fare=hide_fare))
         
         # Send email
         subject = f'E-Ticket - {booking.booking_reference}'
@@ -3188,54 +2602,29 @@ def send_ticket_email_api(request):
 @login_required
 def download_ticket_pdf_file(request, booking_id):
     """Download ticket as PDF file - automatic download"""
-    booking = get_object_or_404(Booking, id=booking_id, user=request.user)
+    ticket = _ticket_context(request, booking_id)
+    booking = ticket.booking
     
     if booking.status != Booking.Status.CONFIRMED or booking.payment_status != Booking.PaymentStatus.PAID:
         messages.error(request, 'Ticket can only be downloaded for confirmed and paid bookings.')
         return redirect('dashboard')
     
-    # Get airport codes
-    airport_codes = get_airport_codes()
-    
-    # Get user profile
-    try:
-        user_profile = booking.user.profile
-    except:
-        user_profile = None
-    
-    context = {
-        'booking': booking,
-        'airport_codes': airport_codes,
-        'user_profile': user_profile,
-        'user': booking.user,
-        'is_web_view': False,
-        'is_download': True,
-    }
-    
-    # Try to generate PDF using xhtml2pdf
+    # Try to generate PDF using xhtml2pdf (served from the ticket PDF cache, or by the render worker)
     try:
-        from xhtml2pdf import pisa
-        from io import BytesIO
-        
-        # Render HTML template
-        html_content = render_to_string('print_pdf.html', context)
-        
-        # Create PDF
-        result = BytesIO()
-        pdf = pisa.CreatePDF(BytesIO(html_content.encode('utf-8')), dest=result)
-        
-        if not pdf.err:
-            # Set up response with PDF
-            response = HttpResponse(result.getvalue(), content_type='application/pdf')
-            filename = f'E-Ticket-{booking.booking_reference}.pdf'
-            response['Content-Disposition'] = f'attachment; filename="{filename}"'
-            return response
-    except ImportError:
-        # If xhtml2pdf not available, fall back to browser printing
-        pass
+        pdf = ticket_renderer.fetch(booking)
+    except ticket_renderer.TicketRendering:
+        return _ticket_rendering_response(booking)
+    if pdf is not None:
+        # Set up response with PDF
+        response = HttpResponse(pdf, content_type='application/pdf')
+        filename = f'E-Ticket-{booking.booking_reference}.pdf'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+    
+    # If xhtml2pdf not available, fall back to browser printing
     
     # Fallback: Return HTML page with auto-print script
-    html_content = render_to_string('print_pdf.html', context)
+    html_content = render_to_string('print_pdf.html', ticket.template_context(is_web_view=False, is_download=True))
     auto_print_html = f'''
     <!DOCTYPE html>
     <html>
@@ -3255,17 +2644,56 @@ def download_ticket_pdf_file(request, booking_id):
     return HttpResponse(auto_print_html, content_type='text/html')
 
 
+@login_required
+def download_tickets_zip(request):
+    """Download the tickets of several bookings as one ZIP (streamed).
+
+    Pick bookings with repeated ?booking=<id>, a travel date range
+    (?from=&to=, YYYY-MM-DD) and/or a flight (?schedule=<id>).
+    """
+    bookings = Booking.objects.filter(
+        user=request.user, status=Booking.Status.CONFIRMED, payment_status=Booking.PaymentStatus.PAID)
+    booking_ids = request.GET.getlist('booking')
+    schedule_id = request.GET.get('schedule')
+    try:
+        date_from = date.fromisoformat(request.GET['from']) if request.GET.get('from') else None
+        date_to = date.fromisoformat(request.GET['to']) if request.GET.get('to') else None
+        if booking_ids:
+            bookings = bookings.filter(pk__in=[int(booking_id) for booking_id in booking_ids])
+        if schedule_id:
+            bookings = bookings.filter(schedule_id=int(schedule_id))
+    except ValueError:
+        return HttpResponse('Invalid filter', status=400)
+    if not (booking_ids or schedule_id or date_from or date_to):
+        return HttpResponse('Select bookings, a travel date range or a flight', status=400)
+    if date_from:
+        bookings = bookings.filter(schedule__departure_date__gte=date_from)
+    if date_to:
+        bookings = bookings.filter(schedule__departure_date__lte=date_to)
+    
+    hide_fare = request.GET.get('hide_fare', 'false').lower() == 'true'
+    response = StreamingHttpResponse(
+        ticket_pdfs.stream_zip(ticket_pdfs.export_bookings(bookings), hide_fare=hide_fare),
+        content_type='application/zip',
+    )
+    response['Content-Disposition'] = f'attachment; filename="E-Tickets-{timezone.localdate():%Y%m%d}.zip"'
+    return response
+
+
 @login_required
 def print_ticket_pdf(request, booking_id):
     """Print ticket PDF without fare"""
-    booking = get_object_or_404(Booking, id=booking_id, user=request.user)
+    booking = _ticket_context(request, booking_id).booking
     
     if booking.status != Booking.Status.CONFIRMED or booking.payment_status != Booking.PaymentStatus.PAID:
         messages.error(request, 'Ticket can only be printed for confirmed and paid bookings.')
         return redirect('dashboard')
     
     # Generate PDF without fare
-    buffer = _generate_ticket_pdf(booking, hide_fare=True)
+    try:
+        buffer = _generate_ticket_pdf(booking, hide_fare=True, background=True)
+    except ticket_renderer.TicketRendering:
+        return _ticket_rendering_response(booking)
     
     response = HttpResponse(buffer.read(), content_type='application/pdf')
     response['Content-Disposition'] = f'inline; filename="ticket_{booking.booking_reference}_nofare.pdf"'
@@ -3275,7 +2703,7 @@ def print_ticket_pdf(request, booking_id):
 @login_required
 def download_ticket_without_fare(request, booking_id):
     """Download ticket PDF without fare details"""
-    booking = get_object_or_404(Booking, id=booking_id, user=request.user)
+    booking = _ticket_context(request, booking_id).booking
     
     # Only allow download for confirmed and paid bookings
     if booking.status != Booking.Status.CONFIRMED or booking.payment_status != Booking.PaymentStatus.PAID:
@@ -3283,7 +2711,10 @@ def download_ticket_without_fare(request, booking_id):
         return redirect('dashboard')
     
     # Generate PDF without fare (hide_fare=True)
-    buffer = _generate_ticket_pdf(booking, hide_fare=True)
+    try:
+        buffer = _generate_ticket_pdf(booking, hide_fare=True, background=True)
+    except ticket_renderer.TicketRendering:
+        return _ticket_rendering_response(booking)
     
     # Create PDF download response
     response = HttpResponse(buffer.read(), content_type='application/pdf')
@@ -3296,7 +2727,7 @@ def download_ticket_without_fare(request, booking_id):
 @require_POST
 def email_ticket(request, booking_id):
     """Email ticket PDF with or without fare"""
-    booking = get_object_or_404(Booking, id=booking_id, user=request.user)
+    booking = _ticket_context(request, booking_id).booking
     
     if booking.status != Booking.Status.CONFIRMED or booking.payment_status != Booking.PaymentStatus.PAID:
         return JsonResponse({'success': False, 'message': 'Ticket can only be emailed for confirmed and paid bookings.'})
@@ -3696,7 +3127,7 @@ def user_signup(request):
                 })
             
             try:
-                # Save the user (which also creates the profile)
+                # Save the user (which also creates the profile and cash balance wallet)
                 # User will NOT be approved by default - needs admin approval
                 user = form.save()
                 
@@ -3929,7 +3360,7 @@ def admin_schedules(request):
     today_bookings = Booking.objects.filter(created_at__date=timezone.now().date()).count()
     
     # Get comprehensive airport codes
-    airport_codes = get_airport_codes()
+    airport_codes = airports.get_registry().codes
     
     context = {
         'schedule_list': schedule_list,
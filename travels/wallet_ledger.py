@@ -0,0 +1,336 @@
+"""Wallet ledger.
+
+Every change to ODWallet.balance and CashBalanceWallet.balance goes through
+this module. A posting is a single conditional UPDATE
+(``balance = balance - n WHERE balance >= n``) followed by the
+transaction-history row, both inside one atomic block, so two concurrent
+payments from the same agency can neither overdraw the wallet nor lose an
+update, and the history row always matches the balance it records.
+
+post_batch() applies many postings (e.g. a bulk debit run) in a single
+commit: either every posting succeeds or none does.
+
+Each posting also folds into the wallet's running totals (credit_total,
+debit_total, txn_count, last_txn_at, last_txn_id) in the same transaction,
+so the admin reads them straight off the wallet row instead of
+aggregating the history. rebuild_aggregates() recomputes them in bulk.
+
+expire_od_wallets() settles expired OD wallets in chunks, one transaction,
+one history bulk insert and one wallet bulk update per chunk. An OD wallet
+past its expiry date rejects debits even before it is settled.
+"""
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Optional
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from .inventory import retry_on_busy
+from .models import ODWallet, ODWalletTransaction, CashBalanceWallet, CashBalanceTransaction
+
+# wallet model -> (history model, history FK to the wallet)
+LEDGERS = {
+    ODWallet: (ODWalletTransaction, 'od_wallet'),
+    CashBalanceWallet: (CashBalanceTransaction, 'cash_balance_wallet'),
+}
+
+
+@dataclass(frozen=True)
+class Posting:
+    """One signed balance change (positive credits, negative debits)"""
+    wallet: object
+    amount: Decimal
+    transaction_type: str
+    description: str = ''
+    reference_id: Optional[str] = None
+
+
+def _apply(posting):
+    """Conditional balance update; returns (history row, new balance) or raises ValidationError"""
+    wallet = posting.wallet
+    model = type(wallet)
+    history_model, wallet_field = LEDGERS[model]
+    amount = posting.amount
+    wallets = model.objects.filter(pk=wallet.pk)
+    changes = {'balance': F('balance') + amount, 'updated_at': timezone.now()}
+    if amount < 0:
+        wallets = wallets.filter(balance__gte=-amount)
+        if model is ODWallet:
+            # Expired wallets are frozen until process_expired_od_wallets settles them
+            wallets = wallets.filter(Q(expires_at__isnull=True) | Q(expires_at__gt=timezone.now()), is_active=True)
+    elif model is ODWallet:
+        wallets = wallets.filter(balance__lte=F('max_balance') - amount)
+        if posting.transaction_type == 'recharge':
+            # Track the initial balance on the first recharge or when the wallet is (re)activated
+            changes['initial_balance'] = Case(
+                When(Q(initial_balance=0) | Q(is_active=False), then=F('balance') + amount),
+                default=F('initial_balance'),
+            )
+        else:
+            changes['initial_balance'] = Case(
+                When(initial_balance=0, then=F('balance') + amount),
+                default=F('initial_balance'),
+            )
+
+    if not wallets.update(**changes):
+        raise _rejection(wallet, amount)
+
+    balance = model.objects.filter(pk=wallet.pk).values_list('balance', flat=True).get()
+    history = history_model(**{
+        wallet_field: wallet,
+        'transaction_type': posting.transaction_type,
+        'amount': amount,
+        'balance_after': balance,
+        'description': posting.description,
+        'reference_id': posting.reference_id,
+    })
+    return history, balance
+
+
+def _rejection(wallet, amount):
+    """Explain why a conditional update matched no row"""
+    model = type(wallet)
+    current = model.objects.filter(pk=wallet.pk).values('balance', 'max_balance').first()
+    if current is None:
+        return ValidationError(_('Wallet not found'))
+    if amount > 0:
+        return ValidationError(_(f'Balance cannot exceed maximum limit of ₹{current["max_balance"]}'))
+    if model is ODWallet and not model.objects.filter(pk=wallet.pk, is_active=True).exists():
+        return ValidationError(_('OD Wallet is not active'))
+    if model is ODWallet and model.objects.filter(pk=wallet.pk, expires_at__lte=timezone.now()).exists():
+        return ValidationError(_('OD Wallet has expired'))
+    if model is ODWallet:
+        return ValidationError(_('Insufficient OD wallet balance'))
+    return ValidationError(_('Insufficient cash balance'))
+
+
+def _fold(model, wallet_pk, histories):
+    """Add saved history rows to a wallet's running totals"""
+    last = histories[-1]
+    model.objects.filter(pk=wallet_pk).update(
+        credit_total=F('credit_total') + sum((h.amount for h in histories if h.amount > 0), Decimal('0')),
+        debit_total=F('debit_total') + sum((-h.amount for h in histories if h.amount < 0), Decimal('0')),
+        txn_count=F('txn_count') + len(histories),
+        last_txn_at=last.created_at,
+        last_txn_id=last.pk,
+    )
+
+
+def record(wallet, history):
+    """Save a history row written outside credit/debit (e.g. OD expiry) and fold it into the totals"""
+    with transaction.atomic():
+        history.save()
+        _fold(type(wallet), wallet.pk, [history])
+
+
+def _refresh(wallet, balance, credited=False):
+    """Keep the caller's wallet instance in step with the database"""
+    wallet.balance = balance
+    if credited and type(wallet) is ODWallet:
+        wallet.initial_balance = ODWallet.objects.filter(pk=wallet.pk).values_list('initial_balance', flat=True).get()
+
+
+def _validate_amount(amount):
+    if amount is None or amount <= 0:
+        raise ValidationError(_('Amount must be greater than zero'))
+    return Decimal(amount)
+
+
+@retry_on_busy
+def credit(wallet, amount, transaction_type='recharge', description='', reference_id=None):
+    """Add to a wallet and record the history row; returns the new balance"""
+    amount = _validate_amount(amount)
+    with transaction.atomic():
+        history, balance = _apply(Posting(wallet, amount, transaction_type, description, reference_id))
+        history.save()
+        _fold(type(wallet), wallet.pk, [history])
+    _refresh(wallet, balance, credited=True)
+    return balance
+
+
+@retry_on_busy
+def debit(wallet, amount, transaction_type='payment', description='', reference_id=None):
+    """Take from a wallet if the balance covers it; raises ValidationError otherwise"""
+    amount = _validate_amount(amount)
+    with transaction.atomic():
+        history, balance = _apply(Posting(wallet, -amount, transaction_type, description, reference_id))
+        history.save()
+        _fold(type(wallet), wallet.pk, [history])
+    _refresh(wallet, balance)
+    return balance
+
+
+@retry_on_busy
+def post_batch(postings):
+    """Apply many postings in one commit (all or nothing); returns the new balances in order.
+
+    History rows are written with one bulk insert per ledger and folded into
+    the totals with one update per wallet.
+    """
+    for posting in postings:
+        _validate_amount(abs(posting.amount))
+    balances = []
+    histories = {}
+    by_wallet = {}
+    with transaction.atomic():
+        for posting in postings:
+            history, balance = _apply(posting)
+            histories.setdefault(type(history), []).append(history)
+            by_wallet.setdefault((type(posting.wallet), posting.wallet.pk), []).append(history)
+            balances.append(balance)
+        for history_model, rows in histories.items():
+            history_model.objects.bulk_create(rows)
+        for (model, wallet_pk), rows in by_wallet.items():
+            _fold(model, wallet_pk, rows)
+    for posting, balance in zip(postings, balances):
+        _refresh(posting.wallet, balance, credited=posting.amount > 0)
+    return balances
+
+
+def rebuild_aggregates(batch_size=500):
+    """Recompute every wallet's running totals from its history; returns wallets updated"""
+    zero = Value(Decimal('0'), output_field=DecimalField(max_digits=12, decimal_places=2))
+    updated = 0
+    for model, (history_model, wallet_field) in LEDGERS.items():
+        history = history_model.objects.filter(**{wallet_field: OuterRef('pk')})
+        per_wallet = history.order_by().values(wallet_field)
+        totals = {
+            'credit_total': Coalesce(Subquery(per_wallet.filter(amount__gt=0).annotate(total=Sum('amount')).values('total')), zero),
+            'debit_total': Coalesce(Subquery(per_wallet.filter(amount__lt=0).annotate(total=-Sum('amount')).values('total')), zero),
+            'txn_count': Coalesce(Subquery(per_wallet.annotate(count=Count('pk')).values('count')), 0),
+            'last_txn_at': Subquery(history.order_by('-created_at', '-pk').values('created_at')[:1]),
+            'last_txn_id': Subquery(history.order_by('-created_at', '-pk').values('pk')[:1]),
+        }
+        wallet_ids = list(model.objects.order_by('pk').values_list('pk', flat=True))
+        for start in range(0, len(wallet_ids), batch_size):
+            with transaction.atomic():
+                updated += model.objects.filter(pk__in=wallet_ids[start:start + batch_size]).update(**totals)
+    return updated
+
+
+@dataclass
+class ExpiryReport:
+    """Counters of one OD wallet expiry run"""
+    processed: int = 0
+    deducted: int = 0
+    deactivated: int = 0
+    skipped: int = 0
+    amount: Decimal = Decimal('0')
+    watermark: Optional[object] = None
+    lines: list = field(default_factory=list)
+
+
+def expired_od_wallets(now=None, since=None):
+    """Active OD wallets past their expiry date (optionally only those expiring after `since`)"""
+    wallets = ODWallet.objects.filter(is_active=True, expires_at__lte=now or timezone.now())
+    if since:
+        wallets = wallets.filter(expires_at__gte=since)
+    return wallets
+
+
+def _expire(wallet, now):
+    """Expire one locked wallet in memory; returns its history row (None if there was nothing left)"""
+    remaining = wallet.balance
+    used = wallet.initial_balance - remaining
+    wallet.is_active = False
+    wallet.updated_at = now
+    if remaining == 0:
+        return None
+    # The balance goes negative by the used amount so the admin sees what was spent
+    wallet.balance = -used
+    return ODWalletTransaction(
+        od_wallet=wallet,
+        transaction_type='adjustment',
+        amount=-remaining,
+        balance_after=wallet.balance,
+        description=f'Wallet expired. Remaining balance ₹{remaining} deducted. Used: ₹{used}',
+        reference_id='EXPIRY_AUTO',
+    )
+
+
+@retry_on_busy
+def _expire_chunk(wallet_ids, now, dry_run):
+    """Expire one chunk in a single transaction; returns [(wallet, deducted amount)] and the skipped count"""
+    expired = []
+    skipped = 0
+    with transaction.atomic():
+        wallets = list(ODWallet.objects.select_for_update().select_related('user').filter(
+            pk__in=wallet_ids, is_active=True, expires_at__lte=now).order_by('pk'))
+        histories = []
+        for wallet in wallets:
+            if wallet.balance < 0:
+                # Already settled by an earlier run (balance went negative); left alone
+                skipped += 1
+                continue
+            remaining = wallet.balance
+            history = _expire(wallet, now)
+            if history is not None:
+                histories.append(history)
+            expired.append((wallet, remaining))
+        if dry_run:
+            transaction.set_rollback(True)
+            return expired, skipped
+
+        ODWalletTransaction.objects.bulk_create(histories)
+        for history in histories:
+            wallet = history.od_wallet
+            wallet.debit_total -= history.amount
+            wallet.txn_count += 1
+            wallet.last_txn_at = history.created_at
+            wallet.last_txn_id = history.pk
+        ODWallet.objects.bulk_update(
+            [wallet for wallet, remaining in expired],
+            ['balance', 'is_active', 'updated_at', 'debit_total', 'txn_count', 'last_txn_at', 'last_txn_id'],
+        )
+    return expired, skipped
+
+
+def expire_od_wallet(wallet, now=None):
+    """Settle one OD wallet if it has expired; returns whether it was settled"""
+    expired, skipped = _expire_chunk([wallet.pk], now or timezone.now(), dry_run=False)
+    if not expired:
+        return False
+    settled, remaining = expired[0]
+    wallet.balance = settled.balance
+    wallet.is_active = settled.is_active
+    return True
+
+
+def expire_od_wallets(now=None, since=None, batch_size=500, dry_run=False, progress=None):
+    """Settle every expired OD wallet in chunks of `batch_size`; returns an ExpiryReport.
+
+    `progress(report, done, total)` is called after each chunk. With
+    dry_run nothing is written. report.watermark is the `since` to pass to
+    the next run.
+    """
+    now = now or timezone.now()
+    expired_wallets = expired_od_wallets(now, since)
+    report = ExpiryReport(watermark=now)
+    total = expired_wallets.count()
+    done = 0
+    last_pk = 0
+    while True:
+        wallet_ids = list(expired_wallets.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not wallet_ids:
+            break
+        expired, skipped = _expire_chunk(wallet_ids, now, dry_run)
+        report.skipped += skipped
+        for wallet, remaining in expired:
+            report.processed += 1
+            if remaining:
+                report.deducted += 1
+                report.amount += remaining
+                report.lines.append(f'{wallet.user.email}: ₹{remaining} deducted, balance ₹{wallet.balance}')
+            else:
+                report.deactivated += 1
+                report.lines.append(f'{wallet.user.email}: deactivated (no balance left)')
+        done += len(wallet_ids)
+        last_pk = wallet_ids[-1]
+        if progress:
+            progress(report, done, total)
+    return report
@@ -0,0 +1,72 @@
+"""Per-request wallet snapshot.
+
+The wallet_context processor, the dashboard and the payment page all show
+the user's wallets. get_wallet_snapshot() memoizes one WalletSnapshot on
+the request, and each wallet is loaded on first access only, so a page
+(or a PDF rendered with render_to_string) that never shows a wallet runs
+no wallet queries at all.
+
+Reading never creates rows: cash balance wallets are created with the user
+(post_save signal) and by the wallet pages that write to them.
+"""
+from decimal import Decimal
+
+from django.utils.functional import cached_property
+
+from .models import ODWallet, CashBalanceWallet
+
+
+class WalletSnapshot:
+    """The user's cash balance and OD wallets, loaded lazily"""
+
+    def __init__(self, user):
+        self.user = user
+
+    @cached_property
+    def cash_wallet(self):
+        """Saved wallet, or an unsaved zero-balance one for users who never had one"""
+        if not self.user.is_authenticated:
+            return None
+        return CashBalanceWallet.objects.filter(user=self.user).first() or CashBalanceWallet(user=self.user)
+
+    @cached_property
+    def od_wallet(self):
+        if not self.user.is_authenticated:
+            return None
+        return ODWallet.objects.filter(user=self.user).first()
+
+    @property
+    def cash_balance(self):
+        return self.cash_wallet.balance if self.cash_wallet else Decimal('0')
+
+    @property
+    def has_cash_balance_wallet(self):
+        return self.user.is_authenticated
+
+    @property
+    def od_wallet_balance(self):
+        return self.od_wallet.balance if self.od_wallet else Decimal('0')
+
+    @property
+    def has_od_wallet(self):
+        return self.od_wallet is not None
+
+    @property
+    def od_wallet_is_expired(self):
+        return bool(self.od_wallet and self.od_wallet.is_expired())
+
+    @property
+    def has_od_wallet_access(self):
+        return bool(self.od_wallet and self.od_wallet.is_active and not self.od_wallet_is_expired)
+
+    @property
+    def od_wallet_days_remaining(self):
+        return self.od_wallet.days_remaining() if self.od_wallet else None
+
+
+def get_wallet_snapshot(request):
+    """The request's WalletSnapshot (created on first use)"""
+    snapshot = getattr(request, '_wallet_snapshot', None)
+    if snapshot is None:
+        snapshot = request._wallet_snapshot = WalletSnapshot(request.user)
+    return snapshot